@@ -12,6 +12,11 @@ export const getAIDJSession = asyncHandler(async (req: Request, res: Response):
   const limit = Number.isFinite(requestedLimit) && requestedLimit > 0
     ? Math.min(requestedLimit, MAX_LIMIT)
     : DEFAULT_LIMIT;
+  // Курсор сессии ML сервиса: следующая порция треков без повторного ранжирования
+  const cursor = typeof req.query.cursor === 'string' && req.query.cursor ? req.query.cursor : undefined;
+  // Сессию ML сервиса начинаем, только если клиент будет листать ее курсором (?session=1):
+  // без сессии ответ берется из кэша ML сервиса, а не ранжирует AI_DJ_SESSION_SIZE треков
+  const useSession = req.query.session === '1' || Boolean(cursor);
 
   try {
     const userId = req.user?.id;
@@ -109,9 +114,10 @@ export const getAIDJSession = asyncHandler(async (req: Request, res: Response):
 
     // Пытаемся получить рекомендации от ML сервиса
     let mlRecommendations: any[] = [];
+    let mlCursor: string | undefined;
     let usingML = false;
 
-    logger.info(`[AI DJ] Запрос к ML сервису: ${ML_SERVICE_URL}/recommend`);
+    logger.info(`[AI DJ] Запрос к ML сервису: ${ML_SERVICE_URL}/recommend${cursor ? '/next' : ''}`);
     logger.info(`[AI DJ] Параметры: history=${userHistory.length}, genres=${preferredGenres.length}, artists=${preferredArtists.length}, limit=${limit}`);
 
     try {
@@ -124,16 +130,38 @@ export const getAIDJSession = asyncHandler(async (req: Request, res: Response):
         genres: preferredGenres,
         artists: preferredArtists,
         limit,
+        session: useSession,
       };
       
       logger.info(`[AI DJ] Отправка запроса к ML сервису: ${JSON.stringify({ ...requestBody, history: requestBody.history.length, historyWithDates: requestBody.historyWithDates.length })}`);
 
-      const mlResponse = await fetch(`${ML_SERVICE_URL}/recommend`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(requestBody),
-        signal: controller.signal,
-      });
+      let mlResponse: Awaited<ReturnType<typeof fetch>> | undefined;
+      if (cursor) {
+        mlResponse = await fetch(`${ML_SERVICE_URL}/recommend/next`, {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({
+            cursor,
+            limit,
+            history: requestBody.history,
+            historyWithDates: requestBody.historyWithDates,
+          }),
+          signal: controller.signal,
+        });
+        if (mlResponse.status === 404) {
+          logger.info(`[AI DJ] Сессия ML сервиса истекла, начинаем новую`);
+          mlResponse = undefined;
+        }
+      }
+
+      if (!mlResponse) {
+        mlResponse = await fetch(`${ML_SERVICE_URL}/recommend`, {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify(requestBody),
+          signal: controller.signal,
+        });
+      }
 
       clearTimeout(timeout);
 
@@ -142,6 +170,7 @@ export const getAIDJSession = asyncHandler(async (req: Request, res: Response):
       if (mlResponse.ok) {
         const mlData: any = await mlResponse.json();
         mlRecommendations = mlData.recommendations || [];
+        mlCursor = mlData.cursor;
         usingML = mlRecommendations.length > 0;
         logger.info(`[AI DJ] ML service returned ${mlRecommendations.length} recommendations, method: ${mlData.method || 'unknown'}`);
         logger.info(`[AI DJ] First 3 recommendations: ${JSON.stringify(mlRecommendations.slice(0, 3).map((r: any) => ({ id: r.id, title: r.title, artist: r.artist })))}`);
@@ -205,6 +234,7 @@ export const getAIDJSession = asyncHandler(async (req: Request, res: Response):
           tracks: tracks.slice(0, limit),
           source: 'ml-service',
           matched: tracks.length,
+          cursor: mlCursor,
         });
       } else {
         logger.warn(`[AI DJ] Ни один трек из рекомендаций не найден в БД, используем fallback`);
@@ -258,3 +288,75 @@ export const getAIDJSession = asyncHandler(async (req: Request, res: Response):
   }
 });
 
+
+// Похожие треки ("еще похожие", радио по треку): готовые соседи трека из ML сервиса
+export const getSimilarTracks = asyncHandler(async (req: Request, res: Response): Promise<any> => {
+  const { trackId } = req.params;
+  const requestedLimit = parseInt(String(req.query.limit ?? DEFAULT_LIMIT), 10);
+  const limit = Number.isFinite(requestedLimit) && requestedLimit > 0
+    ? Math.min(requestedLimit, MAX_LIMIT)
+    : DEFAULT_LIMIT;
+
+  const trackInclude = {
+    artist: { select: { id: true, name: true, imageUrl: true, verified: true } },
+    album: { select: { id: true, title: true, year: true, coverUrl: true } },
+    genre: { select: { id: true, name: true, color: true } },
+  };
+
+  try {
+    let similarIds: string[] = [];
+    try {
+      const controller = new AbortController();
+      const timeout = setTimeout(() => controller.abort(), 5000);
+      const mlResponse = await fetch(
+        `${ML_SERVICE_URL}/similar/${encodeURIComponent(trackId)}?limit=${limit}`,
+        { signal: controller.signal },
+      );
+      clearTimeout(timeout);
+
+      if (mlResponse.ok) {
+        const mlData: any = await mlResponse.json();
+        similarIds = (mlData.recommendations || []).map((r: any) => r.id).filter(Boolean);
+        logger.info(`[AI DJ] ML service returned ${similarIds.length} similar tracks, method: ${mlData.method || 'unknown'}`);
+      } else if (mlResponse.status !== 404) {
+        logger.error(`[AI DJ] ML service error: ${mlResponse.status} ${mlResponse.statusText}`);
+      }
+    } catch (mlError: any) {
+      logger.warn(`[AI DJ] ML service unavailable: ${mlError.message}`);
+    }
+
+    if (similarIds.length > 0) {
+      const found = await prisma.track.findMany({
+        where: { id: { in: similarIds }, isPublished: true },
+        include: trackInclude,
+      });
+      // Порядок ответа ML сервиса — по убыванию похожести
+      const byId = new Map(found.map(t => [t.id, t]));
+      const tracks = similarIds.map(id => byId.get(id)).filter((t): t is typeof found[number] => Boolean(t));
+      if (tracks.length > 0) {
+        return res.json({ tracks: tracks.slice(0, limit), source: 'ml-service' });
+      }
+    }
+
+    // Fallback: популярные треки того же артиста и жанра
+    const seed = await prisma.track.findUnique({ where: { id: trackId } });
+    if (!seed) {
+      return res.status(404).json({ error: 'Track not found' });
+    }
+    const tracks = await prisma.track.findMany({
+      where: {
+        isPublished: true,
+        id: { not: trackId },
+        OR: [{ artistId: seed.artistId }, ...(seed.genreId ? [{ genreId: seed.genreId }] : [])],
+      },
+      orderBy: { playsCount: 'desc' },
+      take: limit,
+      include: trackInclude,
+    });
+    res.json({ tracks, source: 'db-similar' });
+  } catch (error) {
+    const message = error instanceof Error ? error.message : 'Unknown error';
+    logger.error(`AI DJ similar tracks failed: ${message}`);
+    res.status(500).json({ error: 'Failed to get similar tracks' });
+  }
+});
@@ -0,0 +1,151 @@
+import logging
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from mmr import normalize_rows
+
+logger = logging.getLogger(__name__)
+
+ANN_INDEX_FILENAME = "db_ann_index.npz"
+
+# Размер блока строк при назначении треков кластерам (ограничивает пик памяти)
+ASSIGN_CHUNK_SIZE = 65536
+
+
+class IVFIndex:
+    """
+    IVF-индекс (inverted file) для приближенного поиска по косинусной близости.
+
+    Каталог разбивается сферическим k-means на n_lists кластеров. Запрос
+    сравнивается только с центроидами, после чего точная похожесть считается
+    по трекам из n_probe ближайших кластеров.
+
+    Списки хранятся в CSR-виде: list_ids — индексы треков, отсортированные по
+    кластеру, list_offsets[c]:list_offsets[c + 1] — границы кластера c.
+    """
+
+    def __init__(self, centroids: np.ndarray, list_offsets: np.ndarray, list_ids: np.ndarray):
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_ids = list_ids
+
+    @property
+    def n_lists(self) -> int:
+        return self.centroids.shape[0]
+
+    @property
+    def n_tracks(self) -> int:
+        return len(self.list_ids)
+
+    @classmethod
+    def build(
+        cls,
+        embeddings: np.ndarray,
+        n_lists: Optional[int] = None,
+        n_iter: int = 10,
+        sample_size: int = 100_000,
+        random_state: int = 42
+    ) -> "IVFIndex":
+        """
+        Строит индекс сферическим k-means.
+
+        Args:
+            embeddings: Матрица embeddings (N × D)
+            n_lists: Количество кластеров (по умолчанию sqrt(N))
+            n_iter: Количество итераций k-means
+            sample_size: Размер выборки для обучения центроидов
+            random_state: Seed для воспроизводимости
+
+        Returns:
+            IVFIndex: Построенный индекс
+        """
+        n_tracks = embeddings.shape[0]
+        if n_lists is None:
+            n_lists = int(np.sqrt(n_tracks))
+        n_lists = max(1, min(n_lists, n_tracks))
+
+        rng = np.random.default_rng(random_state)
+        sample_idx = rng.choice(n_tracks, size=min(sample_size, n_tracks), replace=False)
+        sample = normalize_rows(np.asarray(embeddings[np.sort(sample_idx)], dtype=np.float32))
+
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)]
+        for _ in range(n_iter):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            counts = np.bincount(assignments, minlength=n_lists)
+            order = np.argsort(assignments, kind='stable')
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+            sums = np.zeros_like(centroids)
+            non_empty = counts > 0
+            sums[non_empty] = np.add.reduceat(sample[order], starts[non_empty], axis=0)
+
+            # Пустые кластеры переинициализируем случайными точками выборки
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()), replace=False)]
+            centroids = normalize_rows(sums)
+
+        index = cls.from_centroids(centroids, embeddings)
+        logger.info(f"IVF индекс построен: {n_lists} кластеров, {n_tracks} треков")
+        return index
+
+    @classmethod
+    def from_centroids(cls, centroids: np.ndarray, embeddings: np.ndarray) -> "IVFIndex":
+        """
+        Раскладывает треки по готовым центроидам без обучения k-means.
+
+        Используется при инкрементальном обучении: новые треки попадают в
+        существующие кластеры, а центроиды пересчитываются при полном обучении.
+
+        Args:
+            centroids: Нормализованные центроиды (n_lists × D)
+            embeddings: Матрица embeddings (N × D)
+
+        Returns:
+            IVFIndex: Индекс с теми же центроидами
+        """
+        n_tracks, n_lists = embeddings.shape[0], centroids.shape[0]
+        assignments = np.empty(n_tracks, dtype=np.int32)
+        for start in range(0, n_tracks, ASSIGN_CHUNK_SIZE):
+            chunk = np.asarray(embeddings[start:start + ASSIGN_CHUNK_SIZE], dtype=np.float32)
+            assignments[start:start + ASSIGN_CHUNK_SIZE] = np.argmax(normalize_rows(chunk) @ centroids.T, axis=1)
+
+        list_ids = np.argsort(assignments, kind='stable').astype(np.int32)
+        list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=n_lists), out=list_offsets[1:])
+        return cls(centroids, list_offsets, list_ids)
+
+    def search_candidates(self, query: np.ndarray, n_probe: int) -> np.ndarray:
+        """
+        Возвращает индексы треков из n_probe ближайших к запросу кластеров.
+
+        Args:
+            query: Нормализованный вектор запроса (D,) или (1, D)
+            n_probe: Количество просматриваемых кластеров
+
+        Returns:
+            np.ndarray: Индексы треков-кандидатов (int32)
+        """
+        centroid_scores = self.centroids @ np.ravel(query).astype(np.float32)
+        n_probe = min(max(n_probe, 1), self.n_lists)
+        if n_probe < self.n_lists:
+            probed = np.argpartition(-centroid_scores, n_probe - 1)[:n_probe]
+        else:
+            probed = np.arange(self.n_lists)
+
+        return np.concatenate([
+            self.list_ids[self.list_offsets[c]:self.list_offsets[c + 1]]
+            for c in probed
+        ])
+
+    def save(self, path: Path):
+        """Сохраняет индекс в .npz"""
+        np.savez(path, centroids=self.centroids, list_offsets=self.list_offsets, list_ids=self.list_ids)
+
+    @classmethod
+    def load(cls, path: Path) -> "IVFIndex":
+        """Загружает индекс из .npz"""
+        with np.load(path) as data:
+            return cls(data['centroids'], data['list_offsets'], data['list_ids'])
@@ -0,0 +1,299 @@
+import json
+import logging
+import os
+import pickle
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+EMBEDDINGS_FILENAME = "db_embeddings.npy"
+TRACKS_DIRNAME = "db_tracks"
+MANIFEST_FILENAME = "manifest.json"
+
+# Старый формат (pickle), поддерживается только на чтение
+LEGACY_TRACKS_FILENAME = "db_tracks.pkl"
+LEGACY_MAPPING_FILENAME = "db_track_mapping.pkl"
+
+FORMAT_VERSION = 2
+
+# Строковые колонки, где почти все значения уникальны: словарь не экономит память, а в
+# каждом воркере превращается в частный список Python-строк. Хранятся байтами UTF-8
+# фиксированной ширины (.npy, открывается через mmap), декодируются только выбранные строки
+FIXED_WIDTH_COLUMNS = ("id", "title")
+
+# Версионированные модели: <data_dir>/versions/<версия>/, активная версия записана в <data_dir>/CURRENT
+VERSIONS_DIRNAME = "versions"
+CURRENT_FILENAME = "CURRENT"
+
+
+class TrackIdIndex:
+    """
+    Маппинг UUID трека → индекс в матрице embeddings поверх отсортированного массива.
+
+    Хранится как два memory-mapped массива (UUID в байтах по возрастанию и
+    соответствующие индексы), поэтому не создает Python-словарь на каждый трек
+    и разделяется между процессами через page cache. Поддерживает интерфейс
+    dict, который используется сервисом: in, [], get, len.
+    """
+
+    def __init__(self, sorted_ids: np.ndarray, positions: np.ndarray):
+        self.sorted_ids = sorted_ids
+        self.positions = positions
+
+    @classmethod
+    def from_mapping(cls, track_id_to_idx: Dict[str, int]) -> "TrackIdIndex":
+        keys = np.array([str(k).encode() for k in track_id_to_idx.keys()])
+        values = np.fromiter(track_id_to_idx.values(), dtype=np.int64, count=len(track_id_to_idx))
+        order = np.argsort(keys, kind='stable')
+        return cls(keys[order], values[order].astype(np.int32))
+
+    def _find(self, track_id) -> int:
+        key = str(track_id).encode()
+        if len(key) > self.sorted_ids.dtype.itemsize:
+            return -1
+        pos = int(np.searchsorted(self.sorted_ids, key))
+        if pos < len(self.sorted_ids) and self.sorted_ids[pos] == key:
+            return pos
+        return -1
+
+    def lookup(self, track_ids: Iterable) -> np.ndarray:
+        """
+        Векторный поиск индексов для списка UUID.
+
+        Returns:
+            np.ndarray: Индексы треков (-1 для неизвестных UUID)
+        """
+        encoded = [str(t).encode() for t in track_ids]
+        if len(encoded) == 0:
+            return np.empty(0, dtype=np.int64)
+        # Ключ длиннее ширины массива при приведении к S<n> обрезался бы и мог совпасть с чужим UUID
+        width = self.sorted_ids.dtype.itemsize
+        fits = np.fromiter((len(key) <= width for key in encoded), dtype=bool, count=len(encoded))
+        keys = np.array([key if ok else b"" for key, ok in zip(encoded, fits)], dtype=self.sorted_ids.dtype)
+        pos = np.minimum(np.searchsorted(self.sorted_ids, keys), len(self.sorted_ids) - 1)
+        found = (self.sorted_ids[pos] == keys) & fits
+        return np.where(found, self.positions[pos], -1).astype(np.int64)
+
+    def __contains__(self, track_id) -> bool:
+        return self._find(track_id) >= 0
+
+    def __getitem__(self, track_id) -> int:
+        pos = self._find(track_id)
+        if pos < 0:
+            raise KeyError(track_id)
+        return int(self.positions[pos])
+
+    def get(self, track_id, default=None):
+        pos = self._find(track_id)
+        return int(self.positions[pos]) if pos >= 0 else default
+
+    def __len__(self) -> int:
+        return len(self.sorted_ids)
+
+    def __iter__(self) -> Iterator[str]:
+        return (key.decode() for key in self.sorted_ids)
+
+
+def save_artifacts(
+    output_path: Path,
+    embeddings: np.ndarray,
+    tracks_df: pd.DataFrame,
+    track_id_to_idx: Dict[str, int]
+):
+    """
+    Сохраняет модель в колоночном формате, пригодном для memory-mapping.
+
+    Структура:
+        db_embeddings.npy          — C-contiguous матрица embeddings
+        db_tracks/manifest.json    — число треков и типы колонок
+        db_tracks/<col>.npy        — числовые колонки
+        db_tracks/<col>.codes.npy  — строковые колонки: коды (int32, -1 = NaN)
+        db_tracks/<col>.vocab.json — строковые колонки: словарь значений
+        db_tracks/<col>.npy        — FIXED_WIDTH_COLUMNS: UTF-8 байты фиксированной ширины
+                                     (S<n>, пропуски — "nan", как в ответе)
+        db_tracks/id_sorted.npy    — UUID (bytes) по возрастанию для TrackIdIndex
+        db_tracks/id_positions.npy — индексы треков для id_sorted
+
+    Args:
+        output_path: Директория модели
+        embeddings: Матрица embeddings
+        tracks_df: DataFrame с треками
+        track_id_to_idx: Маппинг UUID → индекс
+    """
+    np.save(output_path / EMBEDDINGS_FILENAME, np.ascontiguousarray(embeddings))
+
+    tracks_path = output_path / TRACKS_DIRNAME
+    tracks_path.mkdir(parents=True, exist_ok=True)
+
+    columns = {}
+    for column in tracks_df.columns:
+        series = tracks_df[column]
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            np.save(tracks_path / f"{column}.npy", series.to_numpy())
+            columns[column] = "numeric"
+        elif pd.api.types.is_bool_dtype(series):
+            np.save(tracks_path / f"{column}.npy", series.to_numpy(dtype=bool))
+            columns[column] = "bool"
+        elif column in FIXED_WIDTH_COLUMNS:
+            values = [("nan" if pd.isna(value) else str(value)).encode() for value in series.astype(object)]
+            np.save(tracks_path / f"{column}.npy", np.array(values, dtype=bytes) if values else np.empty(0, dtype="S1"))
+            columns[column] = "fixed"
+        else:
+            codes, uniques = pd.factorize(series.astype(object))
+            np.save(tracks_path / f"{column}.codes.npy", codes.astype(np.int32))
+            with open(tracks_path / f"{column}.vocab.json", "w", encoding="utf-8") as f:
+                json.dump([str(u) for u in uniques], f, ensure_ascii=False)
+            columns[column] = "string"
+
+    id_index = TrackIdIndex.from_mapping(track_id_to_idx)
+    np.save(tracks_path / "id_sorted.npy", id_index.sorted_ids)
+    np.save(tracks_path / "id_positions.npy", id_index.positions)
+
+    with open(tracks_path / MANIFEST_FILENAME, "w", encoding="utf-8") as f:
+        json.dump({
+            "format_version": FORMAT_VERSION,
+            "n_tracks": len(tracks_df),
+            "columns": columns
+        }, f, ensure_ascii=False, indent=2)
+
+
+def load_artifacts(
+    data_path: Path,
+    mmap: bool = True,
+    decode_fixed_width: bool = True
+) -> Tuple[np.ndarray, pd.DataFrame, object]:
+    """
+    Загружает модель: embeddings открываются через mmap, метаданные — из колонок.
+
+    Если колоночного формата нет, читает старые pickle-файлы.
+
+    Args:
+        data_path: Директория модели
+        mmap: Открывать embeddings и индекс UUID через mmap (read-only)
+        decode_fixed_width: Декодировать колонки фиксированной ширины (id, title) в строки
+            DataFrame; сервис их не декодирует и читает через load_fixed_width_columns
+
+    Returns:
+        Tuple: (embeddings, tracks_df, track_id_to_idx)
+    """
+    mmap_mode = 'r' if mmap else None
+    embeddings = np.load(data_path / EMBEDDINGS_FILENAME, mmap_mode=mmap_mode)
+
+    tracks_path = data_path / TRACKS_DIRNAME
+    manifest_path = tracks_path / MANIFEST_FILENAME
+    if not manifest_path.exists():
+        logger.info("Колоночные метаданные не найдены, читаю pickle (старый формат)")
+        tracks_df = pd.read_pickle(data_path / LEGACY_TRACKS_FILENAME)
+        with open(data_path / LEGACY_MAPPING_FILENAME, "rb") as f:
+            track_id_to_idx = pickle.load(f)
+        return embeddings, tracks_df, track_id_to_idx
+
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    data = {}
+    for column, kind in manifest["columns"].items():
+        if kind == "string":
+            codes = np.load(tracks_path / f"{column}.codes.npy")
+            with open(tracks_path / f"{column}.vocab.json", encoding="utf-8") as f:
+                vocab: List[str] = json.load(f)
+            data[column] = pd.Categorical.from_codes(codes, categories=vocab)
+        elif kind == "fixed":
+            if decode_fixed_width:
+                values = np.load(tracks_path / f"{column}.npy")
+                data[column] = np.array([value.decode() for value in values.tolist()], dtype=object)
+        else:
+            data[column] = np.load(tracks_path / f"{column}.npy", mmap_mode=mmap_mode)
+    tracks_df = pd.DataFrame(data)
+
+    track_id_to_idx = TrackIdIndex(
+        np.load(tracks_path / "id_sorted.npy", mmap_mode=mmap_mode),
+        np.load(tracks_path / "id_positions.npy", mmap_mode=mmap_mode)
+    )
+    return embeddings, tracks_df, track_id_to_idx
+
+
+def load_fixed_width_columns(data_path: Path, mmap: bool = True) -> Dict[str, np.ndarray]:
+    """
+    Колонки фиксированной ширины (S<n>, UTF-8) без декодирования.
+
+    Returns:
+        Dict: Имя колонки → массив байтов (пусто для моделей старого формата)
+    """
+    manifest_path = data_path / TRACKS_DIRNAME / MANIFEST_FILENAME
+    if not manifest_path.exists():
+        return {}
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    return {
+        column: np.load(data_path / TRACKS_DIRNAME / f"{column}.npy", mmap_mode='r' if mmap else None)
+        for column, kind in manifest["columns"].items() if kind == "fixed"
+    }
+
+
+def resolve_model_dir(data_path: Path) -> Tuple[Path, str]:
+    """
+    Находит директорию активной версии модели.
+
+    Если есть файл CURRENT, модель лежит в versions/<версия из CURRENT>.
+    Иначе модель лежит прямо в data_path (старая раскладка), а версией
+    считается время изменения файла embeddings.
+
+    Returns:
+        Tuple: (директория модели, версия)
+    """
+    current_path = data_path / CURRENT_FILENAME
+    if current_path.exists():
+        version = current_path.read_text(encoding="utf-8").strip()
+        return data_path / VERSIONS_DIRNAME / version, version
+
+    embeddings_path = data_path / EMBEDDINGS_FILENAME
+    mtime = int(embeddings_path.stat().st_mtime) if embeddings_path.exists() else 0
+    return data_path, f"unversioned-{mtime}"
+
+
+def create_version_dir(data_path: Path) -> Tuple[Path, str]:
+    """
+    Создает директорию новой версии модели (имя — время создания).
+
+    Returns:
+        Tuple: (директория версии, версия)
+    """
+    versions_path = data_path / VERSIONS_DIRNAME
+    versions_path.mkdir(parents=True, exist_ok=True)
+    base = datetime.now().strftime("%Y%m%d-%H%M%S")
+    version, suffix = base, 1
+    while (versions_path / version).exists():
+        version = f"{base}-{suffix}"
+        suffix += 1
+    (versions_path / version).mkdir()
+    return versions_path / version, version
+
+
+def publish_version(data_path: Path, version: str, keep: int = 3):
+    """
+    Делает версию активной (атомарная замена CURRENT) и удаляет старые версии.
+
+    Сервис, который еще работает со старой версией через mmap, не ломается:
+    удаленные файлы остаются доступны до закрытия отображения.
+
+    Args:
+        data_path: Корневая директория модели
+        version: Новая активная версия
+        keep: Сколько последних версий хранить (включая активную)
+    """
+    tmp_path = data_path / (CURRENT_FILENAME + ".tmp")
+    tmp_path.write_text(version + "\n", encoding="utf-8")
+    os.replace(tmp_path, data_path / CURRENT_FILENAME)
+
+    versions = sorted(p.name for p in (data_path / VERSIONS_DIRNAME).iterdir() if p.is_dir())
+    for old in versions[:-keep] if keep > 0 else []:
+        if old != version:
+            shutil.rmtree(data_path / VERSIONS_DIRNAME / old, ignore_errors=True)
+            logger.info(f"Удалена старая версия модели: {old}")
@@ -0,0 +1,78 @@
+"""
+Отчет recall@K / latency для IVF индекса против полного перебора.
+
+Каталог синтетический: кластеризованные L2-нормализованные векторы,
+запросы — нормализованные средние нескольких треков каталога (как профиль
+пользователя из истории).
+
+Запуск: python ml/ai_dj/benchmarks/bench_ann.py [n_tracks] [n_queries]
+"""
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ann_index import IVFIndex  # noqa: E402
+from mmr import normalize_rows  # noqa: E402
+
+EMBEDDING_DIM = 512
+TOP_K = 50
+NPROBE_VALUES = (1, 2, 4, 8, 16, 32, 64)
+
+
+def make_catalogue(n_tracks: int, rng: np.random.Generator) -> np.ndarray:
+    """Синтетический каталог: смесь гауссиан вокруг n_tracks / 500 центров"""
+    centers = rng.normal(size=(max(n_tracks // 500, 8), EMBEDDING_DIM))
+    labels = rng.integers(0, len(centers), size=n_tracks)
+    return normalize_rows(centers[labels] + rng.normal(scale=0.8, size=(n_tracks, EMBEDDING_DIM)))
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def main():
+    n_tracks = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    n_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    rng = np.random.default_rng(42)
+
+    embeddings = make_catalogue(n_tracks, rng)
+    queries = normalize_rows(np.stack([
+        embeddings[rng.choice(n_tracks, size=20, replace=False)].mean(axis=0)
+        for _ in range(n_queries)
+    ]))
+
+    start = time.perf_counter()
+    index = IVFIndex.build(embeddings)
+    print(f"Каталог: {n_tracks} треков, {index.n_lists} кластеров, построение {time.perf_counter() - start:.1f} с")
+
+    exact = []
+    start = time.perf_counter()
+    for q in queries:
+        exact.append(set(top_k(cosine_similarity(q[None, :], embeddings)[0], TOP_K)))
+    brute_ms = (time.perf_counter() - start) * 1000 / n_queries
+    print(f"Полный перебор: {brute_ms:.2f} ms/запрос")
+
+    print(f"{'nprobe':>7} {'recall@' + str(TOP_K):>10} {'candidates':>11} {'ms/query':>9} {'speedup':>8}")
+    for n_probe in NPROBE_VALUES:
+        if n_probe > index.n_lists:
+            break
+        recalls, sizes = [], []
+        start = time.perf_counter()
+        for q, truth in zip(queries, exact):
+            candidates = index.search_candidates(q, n_probe)
+            scores = cosine_similarity(q[None, :], embeddings[candidates])[0]
+            found = candidates[top_k(scores, min(TOP_K, len(candidates)))]
+            recalls.append(len(truth.intersection(found.tolist())) / TOP_K)
+            sizes.append(len(candidates))
+        ann_ms = (time.perf_counter() - start) * 1000 / n_queries
+        print(f"{n_probe:>7} {np.mean(recalls):>10.3f} {int(np.mean(sizes)):>11} {ann_ms:>9.2f} {brute_ms / ann_ms:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Бенчмарк кэша рекомендаций при нескольких воркерах: кэш в памяти процесса
+против общего SQLite кэша.
+
+Каждый воркер — отдельный процесс (как воркер gunicorn) со своим экземпляром
+кэша. Запросы распределяются между воркерами случайно, ключи выбираются по
+закону Ципфа (популярные пользователи спрашивают чаще). При промахе воркер
+"считает" рекомендации (ожидание miss_cost_ms) и кладет их в кэш.
+Для каждого варианта выводятся hit rate и латентность get/set.
+
+Запуск: python ml/ai_dj/benchmarks/bench_cache.py [requests_per_worker] [n_users]
+"""
+import multiprocessing as mp
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+AI_DJ_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(AI_DJ_DIR))
+
+from cache import create_cache  # noqa: E402
+
+WORKER_COUNTS = (1, 4, 8)
+RESPONSE = {
+    "recommendations": [{"id": f"{i:08x}-0000-4000-8000-{i:012x}", "score": 0.5} for i in range(25)],
+    "count": 25
+}
+
+
+def run_worker(backend: str, path: str, n_requests: int, n_users: int, seed: int,
+               miss_cost_ms: float, results):
+    cache = create_cache(backend, path=Path(path), max_entries=1000, ttl_seconds=300)
+    rng = np.random.default_rng(seed)
+    users = np.minimum(rng.zipf(1.2, size=n_requests), n_users)
+
+    get_ms, set_ms = [], []
+    for user in users:
+        key = f"user-{user}"
+        start = time.perf_counter()
+        value = cache.get(key)
+        get_ms.append((time.perf_counter() - start) * 1000)
+        if value is None:
+            time.sleep(miss_cost_ms / 1000)
+            start = time.perf_counter()
+            cache.set(key, RESPONSE)
+            set_ms.append((time.perf_counter() - start) * 1000)
+
+    results.put((cache.hits, cache.misses, get_ms, set_ms))
+
+
+def run(backend: str, n_workers: int, n_requests: int, n_users: int, miss_cost_ms: float) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "cache.sqlite")
+        if backend == "sqlite":
+            # Схема создается до старта воркеров, как при импорте сервиса в gunicorn --preload
+            create_cache(backend, path=Path(path))
+
+        results = mp.Queue()
+        workers = [
+            mp.Process(target=run_worker, args=(backend, path, n_requests, n_users, seed, miss_cost_ms, results))
+            for seed in range(n_workers)
+        ]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        collected = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+
+    hits = sum(c[0] for c in collected)
+    misses = sum(c[1] for c in collected)
+    get_ms = np.concatenate([c[2] for c in collected])
+    set_ms = np.concatenate([c[3] for c in collected]) if any(c[3] for c in collected) else np.zeros(1)
+    return {
+        "hit_rate": hits / (hits + misses),
+        "get_p50": np.percentile(get_ms, 50),
+        "get_p99": np.percentile(get_ms, 99),
+        "set_p50": np.percentile(set_ms, 50),
+        "set_p99": np.percentile(set_ms, 99),
+        "rps": n_workers * n_requests / elapsed
+    }
+
+
+def main():
+    n_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    n_users = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    miss_cost_ms = 1.0
+    # Запросы одного и того же общего потока делятся между воркерами
+    print(f"{'backend':>8} {'workers':>8} {'hit rate':>9} {'get p50':>9} {'get p99':>9} "
+          f"{'set p50':>9} {'set p99':>9} {'req/s':>9}")
+    for n_workers in WORKER_COUNTS:
+        per_worker = n_requests // n_workers
+        for backend in ("memory", "sqlite"):
+            r = run(backend, n_workers, per_worker, n_users, miss_cost_ms)
+            print(f"{backend:>8} {n_workers:>8} {r['hit_rate']:>9.3f} {r['get_p50']:>7.3f}ms {r['get_p99']:>7.3f}ms "
+                  f"{r['set_p50']:>7.3f}ms {r['set_p99']:>7.3f}ms {r['rps']:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Микробатчинг /recommend: одновременные запросы по отдельности (каждый —
+свой проход 1 × D на D × N) против RequestCoalescer (профили батча
+скорятся одним умножением на каждый блок каталога).
+
+Модель генерируется synthetic.py без IVF индекса (меряется полный
+перебор), сервер разработки Flask запускается отдельным процессом, нагрузку
+дают concurrency потоков клиента, кэш ответов выключен. Для каждой
+конфигурации выводятся p50/p99, запросов/с, прирост пропускной способности
+относительно запросов по отдельности и сводка батчей из /metrics (средний
+размер батча и ожидание в очереди). Логи сервера пишутся в /dev/null.
+
+Результаты сохраняются в results/coalescing-<коммит>.json (см. report.py).
+
+Запуск: python ml/ai_dj/benchmarks/bench_coalescing.py [n_tracks] [n_requests] [concurrency] [max_batch]
+"""
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from bench_server import PORT, run_load
+from report import save_results
+from synthetic import AI_DJ_DIR, make_histories, make_model
+
+WINDOWS_MS = (0, 2, 5)
+
+
+def start_server(data_dir: str, max_batch: int, window_ms: float) -> subprocess.Popen:
+    env = dict(os.environ, AI_DJ_COALESCE_MAX_BATCH=str(max_batch), AI_DJ_COALESCE_WINDOW_MS=str(window_ms),
+               AI_DJ_CACHE_TTL_SECONDS="0", AI_DJ_PROFILE_STORE_MAX_USERS="0",
+               AI_DJ_PROFILE_SNAPSHOT_SECONDS="0", AI_DJ_MODEL_WATCH_SECONDS="0", AI_DJ_TRACE_SAMPLE_RATE="0")
+    process = subprocess.Popen([sys.executable, str(AI_DJ_DIR / "service.py"), data_dir, str(PORT)], env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Сервер завершился с кодом {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=1)
+            conn.request("GET", "/health")
+            if conn.getresponse().status == 200:
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("Сервер не запустился за 120 с")
+
+
+def coalescing_stats() -> dict:
+    conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=10)
+    conn.request("GET", "/metrics")
+    return json.loads(conn.getresponse().read())["coalescing"] or {}
+
+
+def main():
+    n_tracks = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    n_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+    max_batch = int(sys.argv[4]) if len(sys.argv) > 4 else 32
+
+    configs = {"unbatched": (0, 0)}
+    configs.update({f"coalesced_{window}ms": (max_batch, window) for window in WINDOWS_MS})
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        tracks_df, _ = make_model(Path(tmp), n_tracks)
+        for path in Path(tmp).glob("db_ann_index*"):
+            path.unlink()
+        histories = make_histories(tracks_df, n_requests, 50)
+        payloads = [
+            json.dumps({"historyWithDates": h, "history": [p["id"] for p in h], "limit": 25}).encode()
+            for h in histories
+        ]
+        for name, (batch, window) in configs.items():
+            process = start_server(tmp, batch, window)
+            try:
+                # Прогрев: первые запросы подтягивают страницы mmap
+                run_load(payloads[:concurrency], concurrency)
+                results[name] = run_load(payloads, concurrency)
+                stats = coalescing_stats()
+                if stats:
+                    results[name]["mean_batch_size"] = stats["mean_batch_size"]
+                    results[name]["mean_queue_ms"] = stats["mean_queue_ms"]
+            finally:
+                process.terminate()
+                process.wait()
+
+    base = results["unbatched"]["throughput_rps"]
+    print(f"Каталог: {n_tracks} треков, запросов: {n_requests}, параллельных клиентов: {concurrency}, "
+          f"батч до {max_batch}, CPU: {os.cpu_count()}")
+    print(f"{'конфигурация':>16} {'p50, ms':>9} {'p99, ms':>9} {'запр/с':>8} {'прирост':>8} {'батч':>6} {'очередь, ms':>12}")
+    for name, r in results.items():
+        r["throughput_gain"] = r["throughput_rps"] / base if base else 0.0
+        print(f"{name:>16} {r['p50_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['throughput_rps']:>8.1f} "
+              f"{r['throughput_gain']:>7.2f}x {r.get('mean_batch_size', 1.0):>6.1f} {r.get('mean_queue_ms', 0.0):>12.2f}")
+
+    path = save_results("coalescing", {
+        "n_tracks": n_tracks,
+        "n_requests": n_requests,
+        "concurrency": concurrency,
+        "max_batch": max_batch
+    }, results)
+    print(f"Результаты: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Микробенчмарк выбора треков холодного старта: прежняя фильтрация DataFrame
+(copy всего каталога, isin, nlargest, sample) против PopularityIndex
+(заранее отсортированные списки жанров/артистов и кэшированная выборка).
+
+Для каждого вида запроса выводится время выбора индексов треков в мкс и
+проверяется, что выбраны те же треки в том же порядке.
+
+Запуск: python ml/ai_dj/benchmarks/bench_cold_start.py [n_tracks] [repeats]
+"""
+import sys
+import time
+
+import numpy as np
+
+from synthetic import AI_DJ_DIR, make_tracks
+
+sys.path.insert(0, str(AI_DJ_DIR))
+
+from popularity import PopularityIndex, sample_positions  # noqa: E402
+from service import build_category_codes  # noqa: E402
+
+LIMIT = 25
+
+
+def legacy_select(tracks_df, genres, artists, limit):
+    """Прежний cold_start_recommendations без сборки ответа"""
+    filtered_df = tracks_df.copy()
+    if genres:
+        filtered_df = filtered_df[filtered_df['genre'].isin(genres)]
+    if artists:
+        filtered_df = filtered_df[filtered_df['artist'].isin(artists)]
+    if len(filtered_df) == 0:
+        filtered_df = tracks_df
+    top_tracks = filtered_df.nlargest(limit * 2, 'plays')
+    return top_tracks.sample(n=min(limit, len(top_tracks)), random_state=42).index.to_numpy()
+
+
+def indexed_select(index, genres, artists, limit):
+    top_tracks = index.top(genres, artists, limit * 2)
+    return top_tracks[sample_positions(len(top_tracks), min(limit, len(top_tracks)))]
+
+
+def measure(fn, repeats: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats * 1e6
+
+
+def main():
+    n_tracks = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    tracks_df = make_tracks(n_tracks)
+    genre_codes, genre_lookup = build_category_codes(tracks_df, 'genre')
+    artist_codes, artist_lookup = build_category_codes(tracks_df, 'artist')
+    start = time.perf_counter()
+    index = PopularityIndex(n_tracks, tracks_df['plays'].to_numpy(), {
+        'genre': (genre_codes, genre_lookup), 'artist': (artist_codes, artist_lookup)
+    })
+    build_ms = (time.perf_counter() - start) * 1000
+
+    genres = list(tracks_df['genre'].value_counts().index)
+    artists = list(tracks_df['artist'].value_counts().index)
+    queries = {
+        "без фильтров": ([], []),
+        "1 жанр": (genres[:1], []),
+        "3 жанра": (genres[:3], []),
+        "2 артиста": ([], artists[:2]),
+        "жанр+артисты": (genres[:2], artists[:20]),
+        "неизвестный": (["No such genre"], []),
+    }
+
+    print(f"Каталог: {n_tracks} треков, построение индекса: {build_ms:.0f} ms, "
+          f"{index.nbytes / 1024 / 1024:.1f} MB, limit={LIMIT}")
+    print(f"{'запрос':>14} {'DataFrame, мкс':>15} {'индекс, мкс':>12} {'ускорение':>10} {'совпадает':>10}")
+    for name, (g, a) in queries.items():
+        same = np.array_equal(legacy_select(tracks_df, g, a, LIMIT), indexed_select(index, g, a, LIMIT))
+        legacy_us = measure(lambda: legacy_select(tracks_df, g, a, LIMIT), repeats)
+        indexed_us = measure(lambda: indexed_select(index, g, a, LIMIT), repeats * 20)
+        print(f"{name:>14} {legacy_us:>15.0f} {indexed_us:>12.1f} {legacy_us / indexed_us:>9.0f}x {str(same):>10}")
+
+
+if __name__ == "__main__":
+    main()
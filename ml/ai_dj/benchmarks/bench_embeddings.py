@@ -0,0 +1,88 @@
+"""
+Бенчмарк построения embeddings: PCA по плотной TF-IDF матрице (прежний
+способ) против усеченного SVD по разреженной (SparseSVD).
+
+Каждый запуск выполняется в отдельном процессе: генерируется синтетический
+каталог (названия из слов с распределением Ципфа, артисты, жанры, годы),
+затем TrackEmbedder.fit_transform пишет embeddings в memory-mapped файл.
+Выводятся время и пик RSS процесса сверх памяти, занятой самим каталогом.
+PCA запускается только до pca_max_tracks: плотная матрица занимает
+16 KB на трек.
+
+Запуск: python ml/ai_dj/benchmarks/bench_embeddings.py [размеры через запятую] [pca_max_tracks]
+"""
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+AI_DJ_DIR = Path(__file__).resolve().parent.parent
+
+CHILD_CODE = """
+import json, resource, sys, tempfile, time
+sys.path.insert(0, sys.argv[1])
+import numpy as np, pandas as pd
+from embedder import TrackEmbedder
+from train_model import create_text_features
+
+n_tracks, reduction = int(sys.argv[2]), sys.argv[3]
+rng = np.random.default_rng(42)
+words = np.array([f"w{i}" for i in range(50000)])
+word_ids = np.minimum(rng.zipf(1.3, size=(n_tracks, 3)), len(words)) - 1
+df = pd.DataFrame({
+    "title": [" ".join(row) for row in words[word_ids]],
+    "artist": [f"artist{i}" for i in rng.integers(0, max(n_tracks // 20, 1), size=n_tracks)],
+    "genre": [f"genre{i}" for i in rng.integers(0, 40, size=n_tracks)],
+    "album_year": rng.integers(1970, 2025, size=n_tracks),
+    "plays": rng.integers(0, 1_000_000, size=n_tracks),
+    "duration": rng.integers(60, 400, size=n_tracks),
+    "likes_count": rng.integers(0, 1000, size=n_tracks),
+})
+text_features = create_text_features(df)
+base_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+embedder = TrackEmbedder(512, reduction=reduction)
+with tempfile.NamedTemporaryFile(suffix=".npy") as tmp:
+    start = time.perf_counter()
+    out = np.lib.format.open_memmap(tmp.name, mode="w+", dtype=np.float64, shape=(n_tracks, 512))
+    embedder.fit_transform(text_features, df, out=out)
+    out.flush()
+    elapsed = time.perf_counter() - start
+
+print(json.dumps({
+    "seconds": elapsed,
+    "peak_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base_kb) / 1024,
+    "dim": int(embedder.output_dim)
+}))
+"""
+
+
+def run(n_tracks: int, reduction: str) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD_CODE, str(AI_DJ_DIR), str(n_tracks), reduction],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        return {"error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"exit {result.returncode}"}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    sizes = [int(s) for s in sys.argv[1].split(",")] if len(sys.argv) > 1 else [10_000, 100_000, 1_000_000]
+    pca_max_tracks = int(sys.argv[2]) if len(sys.argv) > 2 else 100_000
+
+    print(f"{'треков':>9} {'способ':>7} {'время, с':>9} {'пик RSS, MB':>12}")
+    for n_tracks in sizes:
+        for reduction in ("pca", "svd"):
+            if reduction == "pca" and n_tracks > pca_max_tracks:
+                print(f"{n_tracks:>9} {reduction:>7} {'пропущен (> pca_max_tracks)':>30}")
+                continue
+            r = run(n_tracks, reduction)
+            if "error" in r:
+                print(f"{n_tracks:>9} {reduction:>7} ошибка: {r['error']}")
+            else:
+                print(f"{n_tracks:>9} {reduction:>7} {r['seconds']:>9.1f} {r['peak_mb']:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Бенчмарк извлечения треков: один read_sql_query с подзапросом COUNT(*) на
+каждый трек против потокового извлечения порциями (train_model.iter_tracks_from_db)
+с агрегированным join лайков.
+
+БД — локальный SQLite файл со схемой таблиц backend (tracks, artists, genres,
+albums, liked_tracks; первичный ключ liked_tracks — (user_id, track_id), как в
+schema.prisma). Для каждого варианта выводятся строки/с и пик памяти Python
+(tracemalloc), а также проверяется, что результаты совпадают.
+
+Подзапрос на каждый трек без индекса по liked_tracks.track_id работает за
+O(треков × лайков), поэтому старый вариант запускается только до legacy_max_tracks.
+
+Запуск: python ml/ai_dj/benchmarks/bench_extract.py [n_tracks] [likes_per_track] [chunk_size] [legacy_max_tracks]
+"""
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+AI_DJ_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(AI_DJ_DIR))
+
+from train_model import iter_tracks_from_db  # noqa: E402
+
+LEGACY_QUERY = """
+SELECT
+    t.id,
+    t.title,
+    COALESCE(a.name, 'Unknown Artist') as artist,
+    COALESCE(g.name, 'Unknown') as genre,
+    COALESCE(t.plays_count, 0) as plays,
+    COALESCE(t.duration, 0) as duration,
+    COALESCE(alb.year, 0) as album_year,
+    (SELECT COUNT(*) FROM liked_tracks lt WHERE lt.track_id = t.id) as likes_count
+FROM tracks t
+LEFT JOIN artists a ON t.artist_id = a.id
+LEFT JOIN genres g ON t.genre_id = g.id
+LEFT JOIN albums alb ON t.album_id = alb.id
+WHERE t.is_published = true
+ORDER BY t.plays_count DESC
+"""
+
+SCHEMA = """
+    CREATE TABLE artists (id TEXT PRIMARY KEY, name TEXT, updated_at TEXT);
+    CREATE TABLE genres (id TEXT PRIMARY KEY, name TEXT, updated_at TEXT);
+    CREATE TABLE albums (id TEXT PRIMARY KEY, title TEXT, year INTEGER, updated_at TEXT);
+    CREATE TABLE tracks (
+        id TEXT PRIMARY KEY, title TEXT, duration INTEGER, plays_count INTEGER,
+        artist_id TEXT, album_id TEXT, genre_id TEXT, is_explicit BOOLEAN, is_published BOOLEAN, updated_at TEXT
+    );
+    CREATE TABLE liked_tracks (user_id TEXT, track_id TEXT, PRIMARY KEY (user_id, track_id));
+"""
+
+
+def make_database(path: Path, n_tracks: int, likes_per_track: int):
+    rng = np.random.default_rng(42)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    now = "2026-01-01 00:00:00"
+    n_artists, n_albums = max(n_tracks // 20, 1), max(n_tracks // 10, 1)
+    conn.executemany("INSERT INTO artists VALUES (?, ?, ?)", ((f"a{i}", f"Artist {i}", now) for i in range(n_artists)))
+    conn.executemany("INSERT INTO genres VALUES (?, ?, ?)", ((f"g{i}", f"Genre {i}", now) for i in range(40)))
+    conn.executemany("INSERT INTO albums VALUES (?, ?, ?, ?)",
+                     ((f"al{i}", f"Album {i}", int(1970 + i % 55), now) for i in range(n_albums)))
+    plays = rng.integers(0, 1_000_000, size=n_tracks)
+    conn.executemany("INSERT INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+        (f"t{i}", f"Track {i}", 60 + i % 300, int(plays[i]), f"a{i % n_artists}", f"al{i % n_albums}",
+         f"g{i % 40}", i % 10 == 0, i % 50 != 0, now)
+        for i in range(n_tracks)
+    ))
+    liked = rng.integers(0, n_tracks, size=n_tracks * likes_per_track)
+    conn.executemany("INSERT OR IGNORE INTO liked_tracks VALUES (?, ?)",
+                     ((f"u{j % 5000}", f"t{t}") for j, t in enumerate(liked)))
+    conn.commit()
+    conn.close()
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    df = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return df, elapsed, peak / 1024 / 1024
+
+
+def main():
+    n_tracks = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    likes_per_track = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    chunk_size = int(sys.argv[3]) if len(sys.argv) > 3 else 50_000
+    legacy_max_tracks = int(sys.argv[4]) if len(sys.argv) > 4 else 20_000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "tracks.sqlite"
+        make_database(path, n_tracks, likes_per_track)
+        conn = sqlite3.connect(path)
+
+        legacy = None
+        if n_tracks <= legacy_max_tracks:
+            legacy, legacy_s, legacy_mb = measure(lambda: pd.read_sql_query(LEGACY_QUERY, conn))
+
+        # Порции обрабатываются и отбрасываются: так ведет себя потребитель, который
+        # сразу строит признаки; пик памяти — одна порция
+        def stream():
+            return sum(len(chunk) for chunk in iter_tracks_from_db(conn, chunk_size=chunk_size))
+        _, stream_s, stream_mb = measure(stream)
+
+        streamed = {}
+        for chunk in iter_tracks_from_db(conn, chunk_size=chunk_size):
+            streamed.update(zip(chunk['id'], chunk['likes_count']))
+        conn.close()
+
+    rows = len(streamed)
+    print(f"треков: {rows}, лайков на трек: {likes_per_track}, порция: {chunk_size}")
+    print(f"{'вариант':>24} {'время, с':>9} {'строк/с':>10} {'пик, MB':>8}")
+    if legacy is not None:
+        print(f"{'read_sql + подзапрос':>24} {legacy_s:>9.2f} {rows / legacy_s:>10.0f} {legacy_mb:>8.1f}")
+    else:
+        print(f"{'read_sql + подзапрос':>24} {'пропущен (> legacy_max_tracks)':>30}")
+    print(f"{'порции + join лайков':>24} {stream_s:>9.2f} {rows / stream_s:>10.0f} {stream_mb:>8.1f}")
+    if legacy is not None:
+        print(f"лайки совпадают: {dict(zip(legacy['id'], legacy['likes_count'])) == streamed}")
+
+
+if __name__ == "__main__":
+    main()
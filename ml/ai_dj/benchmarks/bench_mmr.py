@@ -0,0 +1,85 @@
+"""
+Бенчмарк MMR: старый попарный цикл против векторизованного mmr_rerank.
+
+Запуск: python ml/ai_dj/benchmarks/bench_mmr.py [repeats] [legacy_max_k]
+
+Старый цикл кубический по k (k=200 занимает десятки минут), поэтому по
+умолчанию он измеряется только до legacy_max_k=50.
+"""
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from mmr import mmr_rerank  # noqa: E402
+
+EMBEDDING_DIM = 512
+DIVERSITY_FACTOR = 0.2
+
+
+def legacy_add_diversity(embeddings: np.ndarray, similarities: np.ndarray, top_indices: np.ndarray, diversity_factor: float) -> np.ndarray:
+    """Прежняя реализация add_diversity (cosine_similarity на каждую пару)"""
+    selected = [top_indices[0]]
+    remaining = list(top_indices[1:])
+
+    while remaining:
+        best_score = -np.inf
+        best_idx = None
+        for idx in remaining:
+            max_similarity = max(
+                cosine_similarity(embeddings[idx:idx + 1], embeddings[sel:sel + 1])[0, 0]
+                for sel in selected
+            )
+            score = (1 - diversity_factor) * similarities[idx] + diversity_factor * (1 - max_similarity)
+            if score > best_score:
+                best_score = score
+                best_idx = idx
+        selected.append(best_idx)
+        remaining.remove(best_idx)
+
+    return np.array(selected)
+
+
+def time_call(fn, repeats: int) -> float:
+    """Возвращает медианное время вызова в миллисекундах"""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    legacy_max_k = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    rng = np.random.default_rng(42)
+
+    print(f"{'k':>5} {'legacy, ms':>12} {'vectorized, ms':>15} {'speedup':>9} {'same order':>11}")
+    for k in (10, 50, 200):
+        embeddings = rng.normal(size=(k * 5, EMBEDDING_DIM))
+        similarities = rng.uniform(-1, 1, size=k * 5)
+        top_indices = np.argsort(-similarities)[:k]
+
+        vectorized = top_indices[mmr_rerank(embeddings[top_indices], similarities[top_indices], DIVERSITY_FACTOR)]
+        vectorized_ms = time_call(
+            lambda: mmr_rerank(embeddings[top_indices], similarities[top_indices], DIVERSITY_FACTOR),
+            repeats * 10
+        )
+
+        if k > legacy_max_k:
+            print(f"{k:>5} {'skipped':>12} {vectorized_ms:>15.3f} {'-':>9} {'-':>11}")
+            continue
+
+        start = time.perf_counter()
+        legacy = legacy_add_diversity(embeddings, similarities, top_indices, DIVERSITY_FACTOR)
+        legacy_ms = (time.perf_counter() - start) * 1000
+        print(f"{k:>5} {legacy_ms:>12.2f} {vectorized_ms:>15.3f} {legacy_ms / vectorized_ms:>8.0f}x {str(np.array_equal(legacy, vectorized)):>11}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Масштабирование полного перебора каталога по ядрам: однопроходный скоринг
+(cosine_similarity по всему каталогу, бонусы, top_k_indices) против
+ParallelScorer (блоки строк в пуле потоков, top-k по блокам и слияние) с
+1..threads потоками и несколькими размерами блока.
+
+Запросы — профили синтетических историй с предпочитаемым жанром (бонусы
+включены), IVF индекс не используется. Для каждой конфигурации выводятся
+p50/p99 в мс, ускорение относительно однопроходного скоринга и совпадение
+топа с ним. Результаты сохраняются в results/scoring-<коммит>.json.
+
+Потоки пула и потоки BLAS делят одни ядра: при AI_DJ_SCORING_THREADS > 1
+стоит ограничить BLAS (OPENBLAS_NUM_THREADS=1 / OMP_NUM_THREADS=1).
+
+Запуск: python ml/ai_dj/benchmarks/bench_scoring.py [n_tracks] [n_requests] [max_threads]
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from report import latency_summary, save_results
+from synthetic import AI_DJ_DIR, make_histories, make_model
+
+sys.path.insert(0, str(AI_DJ_DIR))
+
+os.environ.setdefault("AI_DJ_CACHE_BACKEND", "memory")
+os.environ.setdefault("AI_DJ_PROFILE_SNAPSHOT_SECONDS", "0")
+
+import service  # noqa: E402
+from parallel_scoring import ParallelScorer  # noqa: E402
+
+K = 75
+BLOCK_SIZES = (1024, 4096, 16384)
+
+
+def serial_top(profile, tables, history_indices, genres, artists):
+    similarities = service.score_catalogue(profile, None)
+    history_genres, history_artists = service.collect_history_attributes(history_indices)
+    similarities = service.compute_dynamic_bonuses(similarities, genres, artists, history_genres, history_artists)
+    similarities[history_indices] = -1
+    top = service.top_k_indices(similarities, K)
+    return top, similarities[top]
+
+
+def measure(queries, fn):
+    latencies_ms = []
+    tops = []
+    for query in queries:
+        start = time.perf_counter()
+        top, _ = fn(*query)
+        latencies_ms.append((time.perf_counter() - start) * 1000)
+        tops.append(top)
+    result = latency_summary(latencies_ms, sum(latencies_ms) / 1000)
+    return result, tops
+
+
+def main():
+    n_tracks = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    n_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    max_threads = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    with tempfile.TemporaryDirectory() as tmp:
+        # Без IVF индекса: меряется именно полный перебор
+        tracks_df, _ = make_model(Path(tmp), n_tracks, seed=7)
+        for path in Path(tmp).glob("db_ann_index*"):
+            path.unlink()
+        if not service.load_model(tmp):
+            sys.exit("Не удалось загрузить модель")
+
+        queries = []
+        for history in make_histories(tracks_df, n_requests, 50):
+            history_indices = service.find_history_indices([h["id"] for h in history])
+            genre = str(tracks_df["genre"].iat[history_indices[0]])
+            profile = service.build_user_profile(history_indices, history)
+            history_genres, history_artists = service.collect_history_attributes(history_indices)
+            tables = service.bonus_tables([genre], [], history_genres, history_artists)
+            queries.append((profile, tables, history_indices, [genre], []))
+
+        results = {}
+        serial, serial_tops = measure(queries, serial_top)
+        results["single_pass"] = serial
+        thread_counts = sorted({1, 2, 4, max_threads} & set(range(1, max_threads + 1)))
+        same = {}
+        for block_size in BLOCK_SIZES:
+            for threads in thread_counts:
+                service.parallel_scorer = ParallelScorer(threads, block_size)
+                name = f"blocks_{block_size}_x{threads}"
+                results[name], tops = measure(queries, lambda profile, tables, history_indices, genres, artists:
+                                              service.rank_catalogue_blocks(profile, tables, history_indices, None, K))
+                same[name] = all(set(a) == set(b) for a, b in zip(serial_tops, tops))
+
+    print(f"Каталог: {n_tracks} треков, k={K}, запросов: {n_requests}, CPU: {os.cpu_count()}")
+    print(f"{'конфигурация':>22} {'p50, ms':>9} {'p99, ms':>9} {'ускорение':>10} {'совпадает':>10}")
+    for name, r in results.items():
+        speedup = serial["p50_ms"] / r["p50_ms"] if r["p50_ms"] else 0.0
+        print(f"{name:>22} {r['p50_ms']:>9.2f} {r['p99_ms']:>9.2f} {speedup:>9.2f}x {str(same.get(name, True)):>10}")
+
+    path = save_results("scoring", {
+        "n_tracks": n_tracks,
+        "n_requests": n_requests,
+        "k": K,
+        "max_threads": max_threads
+    }, results)
+    print(f"Результаты: {path}")
+
+
+if __name__ == "__main__":
+    main()
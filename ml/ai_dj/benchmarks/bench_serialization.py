@@ -0,0 +1,114 @@
+"""
+Микробенчмарк сборки ответа /recommend: прежний сериализатор (iterrows по
+tracks_df.iloc[top_indices], row.get и str()/int() на каждое поле, jsonify)
+против колоночных метаданных TrackMetadata (выборка по индексам и склейка
+готовых JSON-строк).
+
+Модель из synthetic.py сохраняется и загружается так же, как в сервисе
+(колоночный формат: строковые колонки — pandas.Categorical). Для каждого
+размера ответа выводится время сборки тела ответа в мкс и проверяется, что
+тела совпадают байт в байт (перемешивание с одинаковым seed).
+
+Запуск: python ml/ai_dj/benchmarks/bench_serialization.py [n_tracks] [repeats]
+"""
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from flask import Flask, jsonify
+
+from synthetic import AI_DJ_DIR, make_tracks, write_model
+
+sys.path.insert(0, str(AI_DJ_DIR))
+
+from artifacts import load_artifacts  # noqa: E402
+from track_metadata import TrackMetadata, render_response  # noqa: E402
+
+RESPONSE_SIZES = (10, 25, 50)
+
+
+def legacy_body(tracks_df, top_indices, top_scores) -> bytes:
+    """Прежний format_recommendations + jsonify"""
+    recommended_tracks = tracks_df.iloc[top_indices]
+    recommendations = []
+    for idx, (_, row) in enumerate(recommended_tracks.iterrows()):
+        recommendations.append({
+            "id": str(row['id']),
+            "artist": str(row.get('artist', 'Unknown')),
+            "title": str(row.get('title', 'Unknown')),
+            "genre": str(row.get('genre', 'Unknown')),
+            "plays": int(row.get('plays', 0)),
+            "similarity": float(top_scores[idx])
+        })
+    if len(recommendations) > 3:
+        rest = recommendations[3:]
+        random.shuffle(rest)
+        recommendations = recommendations[:3] + rest
+    return jsonify({
+        "recommendations": recommendations,
+        "count": len(recommendations),
+        "method": "ml_db_embeddings",
+        "cached": False
+    }).get_data()
+
+
+def columnar_body(metadata, top_indices, top_scores) -> bytes:
+    """Новый format_recommendations + render_response"""
+    order = np.arange(len(top_indices))
+    if len(order) > 3:
+        rest = order[3:].tolist()
+        random.shuffle(rest)
+        order[3:] = rest
+    rendered = metadata.render(top_indices[order], top_scores[order])
+    return render_response({
+        "recommendations": rendered,
+        "count": str(len(order)),
+        "method": '"ml_db_embeddings"',
+        "cached": "false"
+    }).encode()
+
+
+def measure(fn, repeats: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats * 1e6
+
+
+def main():
+    n_tracks = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    tracks_df = make_tracks(n_tracks)
+    with tempfile.TemporaryDirectory() as tmp:
+        write_model(Path(tmp), tracks_df, np.zeros((n_tracks, 1)), ann_min_tracks=n_tracks + 1)
+        _, tracks_df, _ = load_artifacts(Path(tmp), mmap=False)
+
+    start = time.perf_counter()
+    metadata = TrackMetadata(tracks_df)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    rng = np.random.default_rng(42)
+    app = Flask(__name__)
+    print(f"Каталог: {n_tracks} треков, подготовка TrackMetadata: {build_ms:.0f} ms")
+    print(f"{'треков в ответе':>16} {'iterrows, мкс':>14} {'колонки, мкс':>13} {'ускорение':>10} {'совпадает':>10}")
+    with app.app_context():
+        for size in RESPONSE_SIZES:
+            top_indices = rng.choice(n_tracks, size=size, replace=False)
+            top_scores = np.sort(rng.uniform(0, 1, size=size))[::-1]
+
+            random.seed(7)
+            legacy = legacy_body(tracks_df, top_indices, top_scores)
+            random.seed(7)
+            columnar = columnar_body(metadata, top_indices, top_scores)
+
+            legacy_us = measure(lambda: legacy_body(tracks_df, top_indices, top_scores), repeats)
+            columnar_us = measure(lambda: columnar_body(metadata, top_indices, top_scores), repeats)
+            print(f"{size:>16} {legacy_us:>14.0f} {columnar_us:>13.0f} {legacy_us / columnar_us:>9.1f}x {str(legacy == columnar):>10}")
+
+
+if __name__ == "__main__":
+    main()
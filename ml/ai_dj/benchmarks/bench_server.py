@@ -0,0 +1,144 @@
+"""
+Пропускная способность HTTP сервера AI DJ: сервер разработки Flask против
+gunicorn (preload, воркеры gthread, см. gunicorn.conf.py).
+
+Модель генерируется synthetic.py, сервер запускается отдельным процессом,
+нагрузку дают concurrency потоков клиента (http.client, соединение на поток).
+Каждый запрос — своя история пользователя, поэтому кэш не помогает.
+Логи сервера пишутся в /dev/null.
+
+Для каждой конфигурации выводятся p50/p99 и запросов/с, результаты
+сохраняются в results/server-<коммит>.json (см. report.py).
+
+Запуск: python ml/ai_dj/benchmarks/bench_server.py [n_tracks] [n_requests] [concurrency] [workers] [threads]
+"""
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from report import latency_summary, save_results
+from synthetic import AI_DJ_DIR, make_histories, make_model
+
+PORT = 5077
+
+
+def start_server(mode: str, data_dir: str, workers: int, threads: int) -> subprocess.Popen:
+    env = dict(os.environ, AI_DJ_DATA_DIR=data_dir, AI_DJ_BIND=f"127.0.0.1:{PORT}",
+               AI_DJ_WORKERS=str(workers), AI_DJ_THREADS=str(threads),
+               AI_DJ_CACHE_PATH=str(Path(data_dir) / "cache.sqlite"),
+               AI_DJ_PROFILE_SNAPSHOT_SECONDS="0", AI_DJ_MODEL_WATCH_SECONDS="0")
+    if mode == "dev":
+        command = [sys.executable, str(AI_DJ_DIR / "service.py"), data_dir, str(PORT)]
+    else:
+        command = [sys.executable, "-m", "gunicorn", "-c", str(AI_DJ_DIR / "gunicorn.conf.py")]
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Сервер {mode} завершился с кодом {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=1)
+            conn.request("GET", "/health")
+            if conn.getresponse().status == 200:
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"Сервер {mode} не запустился за 120 с")
+
+
+def run_load(payloads, concurrency: int) -> dict:
+    latencies_ms = []
+    errors = []
+    position = iter(range(len(payloads)))
+    lock = threading.Lock()
+
+    def client():
+        conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=60)
+        while True:
+            with lock:
+                i = next(position, None)
+            if i is None:
+                return
+            request_start = time.perf_counter()
+            conn.request("POST", "/recommend", body=payloads[i], headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            response.read()
+            latency = (time.perf_counter() - request_start) * 1000
+            with lock:
+                latencies_ms.append(latency)
+                if response.status != 200:
+                    errors.append(response.status)
+
+    start = time.perf_counter()
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    for t in clients:
+        t.start()
+    for t in clients:
+        t.join()
+    elapsed = time.perf_counter() - start
+    if errors:
+        raise RuntimeError(f"/recommend вернул ошибки: {errors[:5]}")
+    return latency_summary(latencies_ms, elapsed)
+
+
+def main():
+    n_tracks = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    n_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    workers = int(sys.argv[4]) if len(sys.argv) > 4 else os.cpu_count()
+    threads = int(sys.argv[5]) if len(sys.argv) > 5 else 4
+
+    configs = {
+        "dev_server": ("dev", 1, 1),
+        f"gunicorn_{workers}x{threads}": ("gunicorn", workers, threads),
+    }
+    if workers > 1:
+        configs[f"gunicorn_1x{threads}"] = ("gunicorn", 1, threads)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        tracks_df, _ = make_model(Path(tmp), n_tracks)
+        histories = make_histories(tracks_df, n_requests, 50)
+        payloads = [
+            json.dumps({"historyWithDates": h, "history": [p["id"] for p in h], "limit": 25}).encode()
+            for h in histories
+        ]
+        for name, (mode, n_workers, n_threads) in configs.items():
+            process = start_server(mode, tmp, n_workers, n_threads)
+            try:
+                # Прогрев: первые запросы подтягивают страницы mmap и инициализируют воркеры
+                run_load(payloads[:concurrency * 2], concurrency)
+                results[name] = run_load(payloads, concurrency)
+            finally:
+                process.terminate()
+                process.wait()
+            # Ответы кэшируются в SQLite файле модели: следующему серверу — пустой кэш
+            for path in Path(tmp).glob("cache.sqlite*"):
+                path.unlink()
+
+    print(f"Каталог: {n_tracks} треков, запросов: {n_requests}, параллельных клиентов: {concurrency}, "
+          f"CPU: {os.cpu_count()}")
+    print(f"{'сервер':>16} {'p50, ms':>9} {'p99, ms':>9} {'запр/с':>8}")
+    for name, r in results.items():
+        print(f"{name:>16} {r['p50_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['throughput_rps']:>8.1f}")
+
+    path = save_results("server", {
+        "n_tracks": n_tracks,
+        "n_requests": n_requests,
+        "concurrency": concurrency,
+        "workers": workers,
+        "threads": threads
+    }, results)
+    print(f"Результаты: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Нагрузочный бенчмарк /recommend на синтетическом каталоге.
+
+Модель генерируется synthetic.py и загружается service.load_model, запросы
+идут через тестовый клиент Flask (без сети: меряется сам обработчик вместе с
+разбором JSON, кэшем, логированием и сериализацией ответа). Логи сервиса
+форматируются как обычно, но пишутся в /dev/null.
+
+Сценарии:
+- cold_cache: у каждого запроса своя история, кэш не помогает
+- warm_cache: те же запросы повторно, ответы берутся из кэша
+- no_diversity: как cold_cache, но без MMR (useDiversity=false)
+- filtered: как cold_cache, но с фильтрами каталога (без explicit, без
+  трех жанров, альбомы с 2000 года)
+- session_next: следующая страница сессии AI DJ (/recommend/next); сессии
+  создаются запросами с "session": true вне замера
+- cold_start: запросы без истории, только предпочитаемый жанр (кэш очищается
+  перед каждым запросом вне замера: жанров всего 40)
+
+Для каждого сценария выводятся p50/p95/p99, запросов/с и пик RSS процесса,
+результаты сохраняются в results/service-<коммит>.json (см. report.py).
+
+Запуск: python ml/ai_dj/benchmarks/bench_service.py [n_tracks] [n_requests] [history_size]
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from report import latency_summary, peak_rss_mb, save_results
+from synthetic import AI_DJ_DIR, make_histories, make_model
+
+sys.path.insert(0, str(AI_DJ_DIR))
+
+# Конфигурация сервиса читается при импорте
+os.environ.setdefault("AI_DJ_CACHE_BACKEND", "memory")
+os.environ.setdefault("AI_DJ_PROFILE_SNAPSHOT_SECONDS", "0")
+
+import service  # noqa: E402
+
+
+def run_scenario(client, payloads, clear_cache: bool = False, path: str = "/recommend") -> dict:
+    latencies_ms = []
+    elapsed = 0.0
+    for payload in payloads:
+        if clear_cache:
+            service.recommendation_cache.clear()
+        request_start = time.perf_counter()
+        response = client.post(path, json=payload)
+        latencies_ms.append((time.perf_counter() - request_start) * 1000)
+        elapsed += time.perf_counter() - request_start
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} вернул {response.status_code}: {response.get_data(as_text=True)}")
+    result = latency_summary(latencies_ms, elapsed)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def main():
+    n_tracks = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    n_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    history_size = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+
+    devnull = open(os.devnull, "w")
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, logging.StreamHandler):
+            handler.setStream(devnull)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        tracks_df, _ = make_model(Path(tmp), n_tracks)
+        generate_s = time.perf_counter() - start
+        histories = make_histories(tracks_df, n_requests, history_size)
+        genres = tracks_df["genre"].unique()
+
+        if not service.load_model(tmp):
+            sys.exit("Не удалось загрузить модель")
+        client = service.app.test_client()
+        rss_after_load = peak_rss_mb()
+
+        personalized = [{"historyWithDates": h, "history": [p["id"] for p in h], "limit": 25} for h in histories]
+        scenarios = {
+            "cold_cache": personalized,
+            "warm_cache": personalized,
+            "no_diversity": [dict(p, useDiversity=False) for p in personalized],
+            "filtered": [dict(p, filters={"explicit": False, "excludeGenres": list(genres[:3]), "yearFrom": 2000})
+                         for p in personalized],
+            "cold_start": [{"genres": [genres[i % len(genres)]], "limit": 25} for i in range(n_requests)],
+        }
+
+        results = {}
+        for name, payloads in scenarios.items():
+            if name == "no_diversity":
+                service.recommendation_cache.clear()
+            results[name] = run_scenario(client, payloads, clear_cache=name == "cold_start")
+
+        cursors = [client.post("/recommend", json=dict(p, session=True)).get_json()["cursor"] for p in personalized]
+        results["session_next"] = run_scenario(
+            client, [{"cursor": cursor, "history": p["history"]} for cursor, p in zip(cursors, personalized)],
+            path="/recommend/next"
+        )
+
+    print(f"Каталог: {n_tracks} треков (генерация {generate_s:.1f} с), запросов на сценарий: {n_requests}, "
+          f"история: {history_size}, RSS после загрузки: {rss_after_load:.0f} MB")
+    print(f"{'сценарий':>14} {'p50, ms':>9} {'p95, ms':>9} {'p99, ms':>9} {'запр/с':>8} {'пик RSS, MB':>12}")
+    for name, r in results.items():
+        print(f"{name:>14} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} "
+              f"{r['throughput_rps']:>8.1f} {r['peak_rss_mb']:>12.0f}")
+
+    path = save_results("service", {
+        "n_tracks": n_tracks,
+        "n_requests": n_requests,
+        "history_size": history_size,
+        "quantization": service.QUANTIZATION or None,
+        "ann_nprobe": service.ANN_NPROBE
+    }, results)
+    print(f"Результаты: {path}")
+
+
+if __name__ == "__main__":
+    main()
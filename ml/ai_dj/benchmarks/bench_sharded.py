@@ -0,0 +1,188 @@
+"""
+Шардированный сервинг (coordinator.py + процессы шардов service.py с
+AI_DJ_SHARD) против одного процесса service.py на том же каталоге.
+
+Модель генерируется synthetic.py, шарды пишутся sharding.save_shards (без
+IVF: меряется полный перебор, при котором ответы должны совпадать). Оба
+варианта запускаются отдельными процессами (серверы разработки Flask),
+нагрузку дают concurrency потоков клиента. Выводятся p50/p99 и запросов/с
+для персональных запросов и холодного старта, RSS каждого процесса после
+прогона (RssAnon / RssFile: embeddings открыты через mmap и после полного
+перебора целиком в page cache) и совпадение ответов с одним процессом:
+набор треков для персональных запросов (порядок после топ-3
+перемешивается), ответ целиком для холодного старта.
+
+Результаты сохраняются в results/sharded-<коммит>.json (см. report.py).
+
+Запуск: python ml/ai_dj/benchmarks/bench_sharded.py [n_tracks] [n_requests] [n_shards] [concurrency]
+"""
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from report import latency_summary, save_results
+from synthetic import AI_DJ_DIR, make_histories, make_model
+
+sys.path.insert(0, str(AI_DJ_DIR))
+
+from sharding import save_shards  # noqa: E402
+
+SINGLE_PORT = 5078
+COORDINATOR_PORT = 5080
+
+
+def start(command: List[str], port: int, data_dir: str) -> subprocess.Popen:
+    env = dict(os.environ, AI_DJ_CACHE_TTL_SECONDS="0", AI_DJ_CACHE_BACKEND="memory",
+               AI_DJ_PROFILE_STORE_MAX_USERS="0", AI_DJ_PROFILE_SNAPSHOT_SECONDS="0",
+               AI_DJ_MODEL_WATCH_SECONDS="0", AI_DJ_SHARD_WATCH_SECONDS="0", AI_DJ_TRACE_SAMPLE_RATE="0")
+    process = subprocess.Popen(command + [data_dir, str(port)], env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 180
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{command[-1]} завершился с кодом {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/health")
+            if conn.getresponse().status == 200:
+                return process
+        except OSError:
+            pass
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{command[-1]} не запустился за 180 с")
+
+
+def process_tree(pid: int) -> List[int]:
+    """Процесс и его дочерние процессы (шарды координатора)"""
+    children = Path(f"/proc/{pid}/task/{pid}/children").read_text().split()
+    return [pid] + [int(child) for child in children]
+
+
+def rss_mb(pid: int) -> Dict[str, float]:
+    status = dict(line.split(":", 1) for line in Path(f"/proc/{pid}/status").read_text().splitlines() if ":" in line)
+    return {
+        "rss_anon_mb": int(status["RssAnon"].split()[0]) / 1024,
+        "rss_file_mb": int(status["RssFile"].split()[0]) / 1024
+    }
+
+
+def run_load(port: int, payloads: List[bytes], concurrency: int):
+    latencies_ms = []
+    bodies = [None] * len(payloads)
+    position = iter(range(len(payloads)))
+    lock = threading.Lock()
+
+    def client():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        while True:
+            with lock:
+                i = next(position, None)
+            if i is None:
+                return
+            request_start = time.perf_counter()
+            conn.request("POST", "/recommend", body=payloads[i], headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            body = response.read()
+            latency = (time.perf_counter() - request_start) * 1000
+            if response.status != 200:
+                raise RuntimeError(f"/recommend вернул {response.status}: {body[:200]!r}")
+            with lock:
+                latencies_ms.append(latency)
+                bodies[i] = json.loads(body)
+
+    start_time = time.perf_counter()
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    for t in clients:
+        t.start()
+    for t in clients:
+        t.join()
+    if len(latencies_ms) != len(payloads):
+        raise RuntimeError("Часть запросов завершилась ошибкой")
+    return latency_summary(latencies_ms, time.perf_counter() - start_time), bodies
+
+
+def main():
+    n_tracks = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    n_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    n_shards = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    concurrency = int(sys.argv[4]) if len(sys.argv) > 4 else 4
+
+    results, memory, same = {}, {}, {}
+    with tempfile.TemporaryDirectory() as tmp:
+        tracks_df, embeddings = make_model(Path(tmp), n_tracks)
+        for path in Path(tmp).glob("db_ann_index*"):
+            path.unlink()
+        save_shards(Path(tmp), embeddings, tracks_df, n_shards)
+        del embeddings
+
+        histories = make_histories(tracks_df, n_requests, 50)
+        genres = tracks_df["genre"].to_numpy()
+        workloads = {
+            "personalized": [json.dumps({
+                "history": [p["id"] for p in h], "historyWithDates": h, "limit": 25,
+                "genres": [str(genres[i % len(genres)])], "nprobe": 0
+            }).encode() for i, h in enumerate(histories)],
+            "cold_start": [json.dumps({
+                "history": [], "genres": [f"Genre {i % 40}"], "limit": 25, "filters": {"explicit": False}
+            }).encode() for i in range(n_requests)],
+        }
+
+        servers = {
+            "single": ([sys.executable, str(AI_DJ_DIR / "service.py")], SINGLE_PORT),
+            f"sharded_{n_shards}": ([sys.executable, str(AI_DJ_DIR / "coordinator.py")], COORDINATOR_PORT),
+        }
+        bodies = {}
+        for name, (command, port) in servers.items():
+            process = start(command, port, tmp)
+            try:
+                for workload, payloads in workloads.items():
+                    # Прогрев: первые запросы подтягивают страницы mmap
+                    run_load(port, payloads[:concurrency * 2], concurrency)
+                    results[f"{name}_{workload}"], bodies[(name, workload)] = run_load(port, payloads, concurrency)
+                memory[name] = [rss_mb(pid) for pid in process_tree(process.pid)]
+            finally:
+                for pid in reversed(process_tree(process.pid)):
+                    os.kill(pid, 15)
+                process.wait()
+
+        sharded = f"sharded_{n_shards}"
+        same["personalized"] = all(
+            {r["id"] for r in a["recommendations"]} == {r["id"] for r in b["recommendations"]}
+            for a, b in zip(bodies[("single", "personalized")], bodies[(sharded, "personalized")])
+        )
+        same["cold_start"] = bodies[("single", "cold_start")] == bodies[(sharded, "cold_start")]
+
+    print(f"Каталог: {n_tracks} треков, шардов: {n_shards}, запросов: {n_requests}, "
+          f"параллельных клиентов: {concurrency}, CPU: {os.cpu_count()}")
+    print(f"{'конфигурация':>32} {'p50, ms':>9} {'p99, ms':>9} {'запр/с':>8}")
+    for name, r in results.items():
+        print(f"{name:>32} {r['p50_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['throughput_rps']:>8.1f}")
+    for name, processes in memory.items():
+        print(f"RSS {name}: " + ", ".join(f"{p['rss_anon_mb']:.0f}+{p['rss_file_mb']:.0f} MB" for p in processes))
+    print(f"Ответы совпадают с одним процессом: {same}")
+
+    results["memory"] = {name: {
+        "processes": len(processes),
+        "max_process_rss_mb": max(p["rss_anon_mb"] + p["rss_file_mb"] for p in processes),
+        "total_rss_mb": sum(p["rss_anon_mb"] + p["rss_file_mb"] for p in processes)
+    } for name, processes in memory.items()}
+    results["same"] = same
+    path = save_results("sharded", {
+        "n_tracks": n_tracks,
+        "n_requests": n_requests,
+        "n_shards": n_shards,
+        "concurrency": concurrency
+    }, results)
+    print(f"Результаты: {path}")
+
+
+if __name__ == "__main__":
+    main()
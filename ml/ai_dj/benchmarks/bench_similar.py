@@ -0,0 +1,114 @@
+"""
+Бенчмарк "похожих треков": /recommend с историей из одного трека (полный
+скоринг каталога, профиль, бонусы, MMR) против /similar по графу соседей
+(NeighbourGraph, срез строки int32/float16).
+
+Граф строится так же, как в train_model (точный перебор блоками); выводятся
+время построения, размер графа и совпадение соседей с полным перебором
+(recall@limit по выборке треков, потери — только из-за float16 похожести).
+Запросы идут через тестовый клиент Flask, логи сервиса пишутся в /dev/null.
+
+Результаты сохраняются в results/similar-<коммит>.json (см. report.py).
+
+Запуск: python ml/ai_dj/benchmarks/bench_similar.py [n_tracks] [n_requests] [k]
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from report import latency_summary, save_results
+from synthetic import AI_DJ_DIR, make_model
+
+sys.path.insert(0, str(AI_DJ_DIR))
+
+os.environ.setdefault("AI_DJ_CACHE_BACKEND", "memory")
+os.environ.setdefault("AI_DJ_PROFILE_SNAPSHOT_SECONDS", "0")
+
+import service  # noqa: E402
+from mmr import normalize_rows  # noqa: E402
+from neighbours import NeighbourGraph  # noqa: E402
+
+LIMIT = 25
+
+
+def exact_recall(embeddings: np.ndarray, graph: NeighbourGraph, rows: np.ndarray, limit: int) -> float:
+    """Доля соседей из графа среди limit ближайших по полному перебору"""
+    normalized = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+    scores = normalized[rows] @ normalized.T
+    scores[np.arange(len(rows)), rows] = -np.inf
+    exact = np.argpartition(-scores, limit - 1, axis=1)[:, :limit]
+    return float(np.mean([
+        len(set(exact[i]) & set(graph.ids[row, :limit])) / limit for i, row in enumerate(rows)
+    ]))
+
+
+def run(client, requests) -> dict:
+    latencies_ms = []
+    for method, path, payload in requests:
+        request_start = time.perf_counter()
+        response = client.open(path, method=method, json=payload)
+        latencies_ms.append((time.perf_counter() - request_start) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} вернул {response.status_code}: {response.get_data(as_text=True)}")
+    return latency_summary(latencies_ms, sum(latencies_ms) / 1000)
+
+
+def main():
+    n_tracks = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    n_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    k = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+
+    devnull = open(os.devnull, "w")
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, logging.StreamHandler):
+            handler.setStream(devnull)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tracks_df, embeddings = make_model(Path(tmp), n_tracks)
+        start = time.perf_counter()
+        graph = NeighbourGraph.build(embeddings, k)
+        build_s = time.perf_counter() - start
+        graph.save(Path(tmp))
+
+        rng = np.random.default_rng(0)
+        rows = rng.choice(n_tracks, size=min(n_requests, n_tracks), replace=False)
+        recall = exact_recall(embeddings, graph, rows[:200], LIMIT)
+
+        if not service.load_model(tmp):
+            sys.exit("Не удалось загрузить модель")
+        client = service.app.test_client()
+        track_ids = [str(tracks_df["id"].iat[row]) for row in rows]
+
+        results = {
+            "recommend_one_track": run(client, [
+                ("POST", "/recommend", {"history": [tid], "historyWithDates": [], "limit": LIMIT})
+                for tid in track_ids
+            ]),
+            "similar": run(client, [("GET", f"/similar/{tid}?limit={LIMIT}", None) for tid in track_ids]),
+            "similar_filtered": run(client, [
+                ("POST", f"/similar/{tid}", {"limit": LIMIT, "filters": {"explicit": False}}) for tid in track_ids
+            ]),
+        }
+
+    print(f"Каталог: {n_tracks} треков, k={k}: построение графа {build_s:.1f} с, "
+          f"{graph.nbytes / 1024 / 1024:.1f} MB, recall@{LIMIT} против полного перебора {recall:.3f}")
+    print(f"{'сценарий':>20} {'p50, ms':>9} {'p99, ms':>9} {'запр/с':>8}")
+    for name, r in results.items():
+        print(f"{name:>20} {r['p50_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['throughput_rps']:>8.1f}")
+
+    results["graph"] = {
+        "build_s": build_s,
+        "size_mb": graph.nbytes / 1024 / 1024,
+        "recall": recall
+    }
+    path = save_results("similar", {"n_tracks": n_tracks, "n_requests": n_requests, "k": k, "limit": LIMIT}, results)
+    print(f"Результаты: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Бенчмарк старта сервиса: pickle-формат против колоночного формата с mmap.
+
+Для каждого формата загрузка выполняется в отдельном процессе дважды:
+холодный старт (файлы вытеснены из page cache через posix_fadvise) и
+теплый старт. После загрузки процесс делает один проход скоринга по всему
+каталогу и сообщает RssAnon (приватная память процесса) и RssFile
+(страницы файлов, общие для всех процессов через page cache).
+
+Запуск: python ml/ai_dj/benchmarks/bench_startup.py [n_tracks] [embedding_dim]
+"""
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+AI_DJ_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(AI_DJ_DIR))
+
+from artifacts import EMBEDDINGS_FILENAME, LEGACY_MAPPING_FILENAME, LEGACY_TRACKS_FILENAME, save_artifacts  # noqa: E402
+
+CHILD_CODE = """
+import json, sys, time
+sys.path.insert(0, sys.argv[1])
+from pathlib import Path
+import numpy as np
+start = time.perf_counter()
+from artifacts import load_artifacts
+embeddings, tracks_df, mapping = load_artifacts(Path(sys.argv[2]), mmap=sys.argv[3] == "1")
+load_s = time.perf_counter() - start
+np.asarray(embeddings @ np.ones(embeddings.shape[1]))
+status = dict(line.split(":", 1) for line in open("/proc/self/status") if line.startswith("Rss"))
+print(json.dumps({
+    "load_s": load_s,
+    "rss_anon_mb": int(status["RssAnon"].split()[0]) / 1024,
+    "rss_file_mb": int(status["RssFile"].split()[0]) / 1024
+}))
+"""
+
+
+def make_catalogue(n_tracks: int, dim: int):
+    rng = np.random.default_rng(42)
+    embeddings = rng.normal(size=(n_tracks, dim))
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    tracks_df = pd.DataFrame({
+        "id": [f"{i:08x}-0000-4000-8000-{i:012x}" for i in range(n_tracks)],
+        "title": [f"Track {i}" for i in range(n_tracks)],
+        "artist": [f"Artist {i % 5000}" for i in range(n_tracks)],
+        "genre": [f"Genre {i % 40}" for i in range(n_tracks)],
+        "plays": rng.integers(0, 1_000_000, size=n_tracks),
+        "duration": rng.integers(60, 400, size=n_tracks),
+        "album_year": rng.integers(1970, 2025, size=n_tracks),
+        "likes_count": rng.integers(0, 1000, size=n_tracks),
+    })
+    track_id_to_idx = {track_id: idx for idx, track_id in enumerate(tracks_df["id"])}
+    return embeddings, tracks_df, track_id_to_idx
+
+
+def evict_from_page_cache(path: Path):
+    for file in [path] if path.is_file() else path.rglob("*"):
+        if file.is_file():
+            fd = os.open(file, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+
+
+def run_child(data_path: Path, mmap: bool) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD_CODE, str(AI_DJ_DIR), str(data_path), "1" if mmap else "0"],
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    n_tracks = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 512
+    embeddings, tracks_df, track_id_to_idx = make_catalogue(n_tracks, dim)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = Path(tmp) / "legacy"
+        columnar_path = Path(tmp) / "columnar"
+        legacy_path.mkdir()
+        columnar_path.mkdir()
+
+        np.save(legacy_path / EMBEDDINGS_FILENAME, embeddings)
+        tracks_df.to_pickle(legacy_path / LEGACY_TRACKS_FILENAME)
+        with open(legacy_path / LEGACY_MAPPING_FILENAME, "wb") as f:
+            pickle.dump(track_id_to_idx, f)
+        save_artifacts(columnar_path, embeddings, tracks_df, track_id_to_idx)
+
+        print(f"Каталог: {n_tracks} треков × {dim}, embeddings {embeddings.nbytes / 1024 / 1024:.0f} MB")
+        print(f"{'format':>18} {'start':>6} {'load, s':>8} {'RssAnon, MB':>12} {'RssFile, MB':>12}")
+        for name, path, mmap in (("pickle", legacy_path, False), ("columnar + mmap", columnar_path, True)):
+            evict_from_page_cache(path)
+            for start in ("cold", "warm"):
+                result = run_child(path, mmap)
+                print(f"{name:>18} {start:>6} {result['load_s']:>8.3f} {result['rss_anon_mb']:>12.1f} {result['rss_file_mb']:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
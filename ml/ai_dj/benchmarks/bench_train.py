@@ -0,0 +1,156 @@
+"""
+Бенчмарк этапов полного обучения train_model на синтетическом каталоге.
+
+Каталог из synthetic.make_tracks записывается в SQLite файл со схемой
+таблиц backend (см. bench_extract.py), после чего по очереди выполняются
+этапы train_model.train_full, каждый со своим замером:
+
+- extract: потоковое извлечение треков (iter_tracks_from_db)
+- text_features: текстовые признаки (create_text_features)
+- embeddings: TF-IDF + снижение размерности (create_embeddings)
+- ann_index: IVF индекс (только начиная с AI_DJ_ANN_MIN_TRACKS треков)
+- neighbours: граф соседей для /similar (AI_DJ_NEIGHBOURS_K, 0 — пропустить)
+- save: запись версии модели (save_model)
+
+Для этапа выводятся время, пропускная способность (треков/с) и пик RSS
+процесса после этапа; результаты сохраняются в results/train-<коммит>.json.
+
+Запуск: python ml/ai_dj/benchmarks/bench_train.py [n_tracks] [likes_per_track]
+"""
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from bench_extract import SCHEMA
+from report import peak_rss_mb, save_results
+from synthetic import AI_DJ_DIR, make_tracks
+
+sys.path.insert(0, str(AI_DJ_DIR))
+
+import train_model  # noqa: E402
+from ann_index import IVFIndex  # noqa: E402
+from neighbours import NeighbourGraph  # noqa: E402
+
+
+def write_database(path: Path, tracks_df: pd.DataFrame, likes_per_track: int):
+    """Записывает треки в SQLite со схемой backend, лайки распределены по прослушиваниям"""
+    rng = np.random.default_rng(42)
+    now = "2026-01-01 00:00:00"
+    artist_codes, artists = pd.factorize(tracks_df["artist"])
+    genre_codes, genres = pd.factorize(tracks_df["genre"])
+    years = tracks_df["album_year"].to_numpy()
+
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.executemany("INSERT INTO artists VALUES (?, ?, ?)", ((f"a{i}", name, now) for i, name in enumerate(artists)))
+    conn.executemany("INSERT INTO genres VALUES (?, ?, ?)", ((f"g{i}", name, now) for i, name in enumerate(genres)))
+    conn.executemany("INSERT INTO albums VALUES (?, ?, ?, ?)",
+                     ((f"al{year}", f"Album {year}", int(year), now) for year in np.unique(years)))
+    conn.executemany("INSERT INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+        (track_id, title, int(duration), int(plays), f"a{a}", f"al{year}", f"g{g}", bool(explicit), True, now)
+        for track_id, title, duration, plays, a, year, g, explicit in zip(
+            tracks_df["id"], tracks_df["title"], tracks_df["duration"], tracks_df["plays"],
+            artist_codes, years, genre_codes, tracks_df["is_explicit"]
+        )
+    ))
+    weights = np.log1p(tracks_df["plays"].to_numpy(dtype=np.float64)) + 1
+    liked = rng.choice(len(tracks_df), size=len(tracks_df) * likes_per_track, p=weights / weights.sum())
+    ids = tracks_df["id"].to_numpy()
+    conn.executemany("INSERT OR IGNORE INTO liked_tracks VALUES (?, ?)",
+                     ((f"u{j % 5000}", ids[t]) for j, t in enumerate(liked)))
+    conn.commit()
+    conn.close()
+
+
+def main():
+    n_tracks = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    likes_per_track = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    devnull = open(os.devnull, "w")
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, logging.StreamHandler):
+            handler.setStream(devnull)
+
+    results = {}
+    state = {}
+
+    def stage(name, fn, tracks: int):
+        rss_before = peak_rss_mb()
+        start = time.perf_counter()
+        fn()
+        seconds = time.perf_counter() - start
+        results[name] = {
+            "seconds": seconds,
+            "tracks_per_s": tracks / seconds if seconds > 0 else 0.0,
+            "peak_rss_mb": peak_rss_mb(),
+            "rss_growth_mb": peak_rss_mb() - rss_before
+        }
+
+    def extract():
+        state["tracks_df"] = pd.concat(list(train_model.iter_tracks_from_db(conn)), ignore_index=True)
+        state["tracks_df"].pop("updated_at")
+
+    def text_features():
+        state["text_features"] = train_model.create_text_features(state["tracks_df"])
+
+    def embeddings():
+        state["embeddings"], state["embedder"] = train_model.create_embeddings(
+            state["text_features"], state["tracks_df"], embedding_dim=512
+        )
+
+    def ann_index():
+        state["ann_index"] = IVFIndex.build(state["embeddings"], n_lists=train_model.ANN_LISTS or None)
+
+    def neighbours():
+        state["neighbour_graph"] = NeighbourGraph.build(state["embeddings"], train_model.NEIGHBOURS_K)
+
+    def save():
+        tracks_df = state["tracks_df"]
+        track_id_to_idx = {str(track_id): idx for idx, track_id in enumerate(tracks_df["id"])}
+        train_model.save_model(state["embeddings"], tracks_df, track_id_to_idx, str(Path(tmp) / "model"),
+                               ann_index=state.get("ann_index"), embedder=state["embedder"],
+                               train_state={"mode": "full", "fit_tracks": len(tracks_df)},
+                               neighbour_graph=state.get("neighbour_graph"))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "tracks.sqlite"
+        write_database(db_path, make_tracks(n_tracks), likes_per_track)
+        conn = sqlite3.connect(db_path)
+
+        stage("extract", extract, n_tracks)
+        stage("text_features", text_features, n_tracks)
+        stage("embeddings", embeddings, n_tracks)
+        if n_tracks >= train_model.ANN_MIN_TRACKS:
+            stage("ann_index", ann_index, n_tracks)
+        if train_model.NEIGHBOURS_K > 0:
+            stage("neighbours", neighbours, n_tracks)
+        stage("save", save, n_tracks)
+        conn.close()
+
+    total = sum(r["seconds"] for r in results.values())
+    results["total"] = {"seconds": total, "tracks_per_s": n_tracks / total, "peak_rss_mb": peak_rss_mb()}
+
+    print(f"Каталог: {n_tracks} треков, лайков на трек: {likes_per_track}, снижение размерности: {train_model.REDUCTION}")
+    print(f"{'этап':>14} {'время, с':>9} {'треков/с':>10} {'пик RSS, MB':>12}")
+    for name, r in results.items():
+        print(f"{name:>14} {r['seconds']:>9.2f} {r['tracks_per_s']:>10.0f} {r['peak_rss_mb']:>12.0f}")
+
+    path = save_results("train", {
+        "n_tracks": n_tracks,
+        "likes_per_track": likes_per_track,
+        "reduction": train_model.REDUCTION,
+        "ann_min_tracks": train_model.ANN_MIN_TRACKS,
+        "neighbours_k": train_model.NEIGHBOURS_K
+    }, results)
+    print(f"Результаты: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Машиночитаемые результаты бенчмарков и сравнение между коммитами.
+
+Бенчмарки набора (bench_service.py, bench_train.py) сохраняют результаты в
+ml/ai_dj/benchmarks/results/<набор>-<коммит>.json. Этот скрипт сравнивает два
+таких файла и показывает изменение каждой метрики.
+
+Запуск: python ml/ai_dj/benchmarks/report.py <old.json> <new.json>
+"""
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+# Метрики, для которых меньше — лучше (остальные: больше — лучше)
+LOWER_IS_BETTER = ("_ms", "_s", "_mb", "seconds")
+
+
+def latency_summary(latencies_ms: Iterable[float], elapsed_s: float) -> Dict[str, float]:
+    """
+    Перцентили латентности и пропускная способность.
+
+    Args:
+        latencies_ms: Латентности запросов в миллисекундах
+        elapsed_s: Общее время прогона в секундах
+
+    Returns:
+        Dict: requests, p50_ms, p95_ms, p99_ms, max_ms, throughput_rps
+    """
+    values = np.asarray(list(latencies_ms), dtype=np.float64)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "requests": int(len(values)),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "max_ms": float(values.max()),
+        "throughput_rps": float(len(values) / elapsed_s) if elapsed_s > 0 else 0.0
+    }
+
+
+def peak_rss_mb() -> float:
+    """Пик RSS текущего процесса (ru_maxrss, на Linux — в KB)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def git_commit() -> str:
+    """Короткий хэш текущего коммита (или "unknown" вне git)"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=RESULTS_DIR.parent, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=RESULTS_DIR.parent, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        return f"{commit}-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def save_results(suite: str, params: Dict, results: Dict, output: Optional[Path] = None) -> Path:
+    """
+    Сохраняет результаты набора вместе с коммитом и описанием машины.
+
+    Args:
+        suite: Имя набора (service, train)
+        params: Параметры прогона (размер каталога, число запросов и т.д.)
+        results: Метрики по сценариям/этапам: {сценарий: {метрика: число}}
+        output: Путь файла (по умолчанию results/<набор>-<коммит>.json)
+
+    Returns:
+        Path: Путь сохраненного файла
+    """
+    commit = git_commit()
+    if output is None:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        output = RESULTS_DIR / f"{suite}-{commit}.json"
+    document = {
+        "suite": suite,
+        "commit": commit,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "machine": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count()
+        },
+        "params": params,
+        "results": results
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(document, f, ensure_ascii=False, indent=2)
+    return output
+
+
+def compare(old: Dict, new: Dict):
+    """Печатает изменение каждой общей метрики двух результатов одного набора"""
+    print(f"{old['suite']}: {old['commit']} -> {new['commit']}")
+    if old["params"] != new["params"]:
+        print(f"Внимание: параметры прогонов различаются: {old['params']} / {new['params']}")
+    print(f"{'сценарий':>24} {'метрика':>16} {'было':>10} {'стало':>10} {'изменение':>10}")
+    for scenario, metrics in new["results"].items():
+        for name, value in metrics.items():
+            before = old["results"].get(scenario, {}).get(name)
+            if not isinstance(value, (int, float)) or not isinstance(before, (int, float)):
+                continue
+            change = (value - before) / before * 100 if before else 0.0
+            worse = change > 0 if name.endswith(LOWER_IS_BETTER) else change < 0
+            mark = " !" if worse and abs(change) >= 10 else ""
+            print(f"{scenario:>24} {name:>16} {before:>10.2f} {value:>10.2f} {change:>+9.1f}%{mark}")
+
+
+def main():
+    if len(sys.argv) != 3:
+        print(__doc__)
+        sys.exit(1)
+    with open(sys.argv[1], encoding="utf-8") as f:
+        old = json.load(f)
+    with open(sys.argv[2], encoding="utf-8") as f:
+        new = json.load(f)
+    compare(old, new)
+
+
+if __name__ == "__main__":
+    main()
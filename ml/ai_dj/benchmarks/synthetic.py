@@ -0,0 +1,203 @@
+"""
+Генератор синтетического каталога и истории прослушиваний для бенчмарков.
+
+Каталог повторяет структуру данных из train_model: у треков есть жанры,
+артисты (популярность по закону Ципфа), годы, прослушивания и лайки.
+Embeddings — L2-нормализованные векторы вокруг центра артиста, который сам
+лежит рядом с центром жанра, поэтому похожие по метаданным треки близки и
+в пространстве embeddings, как у настоящей модели. История пользователя
+берется из одного-двух любимых жанров.
+
+Модель пишется в формате, который загружает service.load_model: колоночный
+(по умолчанию) или старый db_embeddings.npy + db_tracks.pkl. Если задан
+AI_DJ_QUANTIZATION, рядом сохраняются квантованные коды (как в train_model).
+
+Запуск: python ml/ai_dj/benchmarks/synthetic.py <output_dir> [n_tracks] [columnar|legacy]
+"""
+import os
+import pickle
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+AI_DJ_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(AI_DJ_DIR))
+
+from ann_index import ANN_INDEX_FILENAME, IVFIndex  # noqa: E402
+from artifacts import EMBEDDINGS_FILENAME, LEGACY_MAPPING_FILENAME, LEGACY_TRACKS_FILENAME, save_artifacts  # noqa: E402
+from mmr import normalize_rows  # noqa: E402
+from quantization import QuantizedEmbeddings, measure_recall  # noqa: E402
+
+EMBEDDING_DIM = 512
+N_GENRES = 40
+TITLE_VOCABULARY = 50_000
+
+
+def make_tracks(n_tracks: int, seed: int = 42) -> pd.DataFrame:
+    """
+    Метаданные треков в виде, который отдает train_model.iter_tracks_from_db.
+
+    Args:
+        n_tracks: Количество треков
+        seed: Seed генератора
+
+    Returns:
+        pd.DataFrame: Колонки id, title, artist, genre, plays, duration, album_year, likes_count, is_explicit
+    """
+    rng = np.random.default_rng(seed)
+    n_artists = max(n_tracks // 20, 1)
+    artist_ids = np.minimum(rng.zipf(1.5, size=n_tracks), n_artists) - 1
+    # Жанр определяется артистом: у артиста почти всегда один жанр
+    artist_genres = rng.integers(0, N_GENRES, size=n_artists)
+
+    words = np.array([f"word{i}" for i in range(TITLE_VOCABULARY)])
+    word_ids = np.minimum(rng.zipf(1.3, size=(n_tracks, 3)), TITLE_VOCABULARY) - 1
+    plays = (rng.pareto(1.2, size=n_tracks) * 1000).astype(np.int64)
+
+    return pd.DataFrame({
+        "id": [f"{i:08x}-0000-4000-8000-{i:012x}" for i in range(n_tracks)],
+        "title": [" ".join(row) for row in words[word_ids]],
+        "artist": [f"Artist {a}" for a in artist_ids],
+        "genre": [f"Genre {g}" for g in artist_genres[artist_ids]],
+        "plays": plays,
+        "duration": rng.integers(60, 400, size=n_tracks),
+        "album_year": rng.integers(1970, 2026, size=n_tracks),
+        "likes_count": (plays * rng.uniform(0, 0.05, size=n_tracks)).astype(np.int64),
+        "is_explicit": rng.uniform(size=n_tracks) < 0.1,
+    })
+
+
+def make_embeddings(tracks_df: pd.DataFrame, dim: int = EMBEDDING_DIM, seed: int = 42) -> np.ndarray:
+    """
+    Embeddings каталога: центр жанра + смещение артиста + шум трека.
+
+    Args:
+        tracks_df: Треки из make_tracks
+        dim: Размерность embeddings
+        seed: Seed генератора
+
+    Returns:
+        np.ndarray: L2-нормализованная матрица (N × dim, float64, как у train_model)
+    """
+    rng = np.random.default_rng(seed + 1)
+    genre_codes, genres = pd.factorize(tracks_df["genre"])
+    artist_codes, artists = pd.factorize(tracks_df["artist"])
+    genre_centers = rng.normal(size=(len(genres), dim))
+    artist_offsets = rng.normal(scale=0.6, size=(len(artists), dim))
+
+    embeddings = np.empty((len(tracks_df), dim))
+    chunk_size = 65536
+    for start in range(0, len(tracks_df), chunk_size):
+        rows = slice(start, start + chunk_size)
+        block = genre_centers[genre_codes[rows]] + artist_offsets[artist_codes[rows]]
+        block += rng.normal(scale=0.8, size=block.shape)
+        embeddings[rows] = normalize_rows(block)
+    return embeddings
+
+
+def make_histories(tracks_df: pd.DataFrame, n_users: int, history_size: int = 50,
+                   seed: int = 42) -> List[List[Dict]]:
+    """
+    Истории прослушиваний в формате historyWithDates запроса /recommend.
+
+    У каждого пользователя один-два любимых жанра, треки внутри жанра
+    выбираются пропорционально прослушиваниям, даты — за последние 60 дней.
+
+    Args:
+        tracks_df: Треки из make_tracks
+        n_users: Количество пользователей
+        history_size: Длина истории
+        seed: Seed генератора
+
+    Returns:
+        List[List[Dict]]: Для каждого пользователя список {"id", "playedAt"}
+    """
+    rng = np.random.default_rng(seed + 2)
+    genre_codes, genres = pd.factorize(tracks_df["genre"])
+    by_genre = [np.flatnonzero(genre_codes == g) for g in range(len(genres))]
+    weights = np.log1p(tracks_df["plays"].to_numpy(dtype=np.float64)) + 1
+    ids = tracks_df["id"].to_numpy()
+    now = datetime(2026, 1, 1)
+
+    histories = []
+    for _ in range(n_users):
+        favourite = rng.choice(len(genres), size=min(2, len(genres)), replace=False)
+        pool = np.concatenate([by_genre[g] for g in favourite])
+        p = weights[pool] / weights[pool].sum()
+        picked = rng.choice(pool, size=history_size, p=p)
+        played = [now - timedelta(days=float(d)) for d in np.sort(rng.uniform(0, 60, size=history_size))]
+        histories.append([
+            {"id": str(ids[idx]), "playedAt": played_at.strftime("%Y-%m-%dT%H:%M:%SZ")}
+            for idx, played_at in zip(picked, played)
+        ])
+    return histories
+
+
+def write_model(output_dir: Path, tracks_df: pd.DataFrame, embeddings: np.ndarray,
+                layout: str = "columnar", ann_min_tracks: int = 10_000) -> Path:
+    """
+    Сохраняет модель так, как ее сохраняет train_model (без версионирования).
+
+    Args:
+        output_dir: Директория модели
+        tracks_df: Треки
+        embeddings: Embeddings треков
+        layout: "columnar" (текущий формат) или "legacy" (db_tracks.pkl + db_track_mapping.pkl)
+        ann_min_tracks: Начиная с какого размера каталога строить IVF индекс
+
+    Returns:
+        Path: output_dir
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    track_id_to_idx = {track_id: idx for idx, track_id in enumerate(tracks_df["id"])}
+
+    if layout == "legacy":
+        np.save(output_dir / EMBEDDINGS_FILENAME, embeddings)
+        tracks_df.to_pickle(output_dir / LEGACY_TRACKS_FILENAME)
+        with open(output_dir / LEGACY_MAPPING_FILENAME, "wb") as f:
+            pickle.dump(track_id_to_idx, f)
+    else:
+        save_artifacts(output_dir, embeddings, tracks_df, track_id_to_idx)
+
+    if len(tracks_df) >= ann_min_tracks:
+        IVFIndex.build(embeddings).save(output_dir / ANN_INDEX_FILENAME)
+
+    quantization = os.getenv("AI_DJ_QUANTIZATION", "")
+    if quantization and layout != "legacy":
+        rerank_size = int(os.getenv("AI_DJ_RERANK_SIZE", "300"))
+        quantized = QuantizedEmbeddings.build(embeddings, quantization)
+        quantized.stats = {"recall_at_50": measure_recall(embeddings, quantized, rerank_size),
+                           "recall_rerank_size": rerank_size}
+        quantized.save(output_dir)
+    return output_dir
+
+
+def make_model(output_dir: Path, n_tracks: int, layout: str = "columnar",
+               seed: int = 42) -> Tuple[pd.DataFrame, np.ndarray]:
+    """Генерирует каталог и сохраняет модель в output_dir"""
+    tracks_df = make_tracks(n_tracks, seed)
+    embeddings = make_embeddings(tracks_df, seed=seed)
+    write_model(output_dir, tracks_df, embeddings, layout=layout)
+    return tracks_df, embeddings
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    output_dir = Path(sys.argv[1])
+    n_tracks = int(sys.argv[2]) if len(sys.argv) > 2 else 100_000
+    layout = sys.argv[3] if len(sys.argv) > 3 else "columnar"
+
+    tracks_df, embeddings = make_model(output_dir, n_tracks, layout=layout)
+    print(f"Модель записана в {output_dir}: {len(tracks_df)} треков, "
+          f"embeddings {embeddings.nbytes / 1024 / 1024:.0f} MB, формат {layout}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CACHE_BACKENDS = ("memory", "sqlite")
+
+
+class RecommendationCache:
+    """
+    LRU кэш рекомендаций с TTL и ограничением по размеру (в памяти процесса).
+
+    Записи хранятся в OrderedDict в порядке обращений, поэтому вытеснение
+    самой давней записи — O(1). Запись удаляется, если ее TTL истек, если
+    записей больше max_entries или если суммарный размер значений (в байтах
+    JSON) превышает max_bytes.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 300, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        # key → (время записи, значение, размер в байтах)
+        self._entries: "OrderedDict[str, Tuple[float, Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if now - entry[0] >= self.ttl_seconds:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: Any):
+        size = len(json.dumps(value, ensure_ascii=False).encode())
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic(), value, size)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": "memory",
+            "size": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+class SQLiteRecommendationCache:
+    """
+    Кэш рекомендаций в SQLite файле (WAL), общий для всех процессов на машине.
+
+    Интерфейс совпадает с RecommendationCache. TTL считается по времени
+    записи (wall clock, одинаковому для всех процессов). Время последнего
+    обращения обновляется не чаще раза в ttl / 10, чтобы попадания почти не
+    требовали записи. Лимиты max_entries и max_bytes проверяются раз в
+    trim_every записей: удаляются устаревшие записи, затем самые давние по
+    обращению.
+
+    Счетчики hits/misses/evictions — свои у каждого процесса (обновляются под
+    блокировкой: соединения у потоков свои, счетчики общие), size/bytes —
+    общие (из таблицы).
+    """
+
+    def __init__(self, path: Path, max_entries: int = 1000, ttl_seconds: float = 300,
+                 max_bytes: int = 64 * 1024 * 1024, trim_every: int = 64):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.trim_every = trim_every
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._sets = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS recommendation_cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL,"
+            " size INTEGER NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS recommendation_cache_accessed ON recommendation_cache (accessed_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # Соединение на поток и на процесс: после fork соединение родителя использовать нельзя
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM recommendation_cache").fetchone()[0]
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT value, created_at, accessed_at FROM recommendation_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            with self._stats_lock:
+                self.misses += 1
+            return None
+
+        value, created_at, accessed_at = row
+        if now - created_at >= self.ttl_seconds:
+            conn.execute("DELETE FROM recommendation_cache WHERE key = ? AND created_at = ?", (key, created_at))
+            with self._stats_lock:
+                self.expirations += 1
+                self.misses += 1
+            return None
+
+        if now - accessed_at > self.ttl_seconds / 10:
+            conn.execute("UPDATE recommendation_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        with self._stats_lock:
+            self.hits += 1
+        return json.loads(value)
+
+    def set(self, key: str, value: Any):
+        payload = json.dumps(value, ensure_ascii=False)
+        size = len(payload.encode())
+        if size > self.max_bytes:
+            return
+
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO recommendation_cache (key, value, created_at, accessed_at, size) VALUES (?, ?, ?, ?, ?)",
+            (key, payload, now, now, size)
+        )
+        with self._stats_lock:
+            self._sets += 1
+            trim = self._sets % self.trim_every == 0
+        if trim:
+            self._trim(now)
+
+    def _trim(self, now: float):
+        conn = self._conn()
+        expired = conn.execute(
+            "DELETE FROM recommendation_cache WHERE created_at <= ?", (now - self.ttl_seconds,)
+        ).rowcount
+        with self._stats_lock:
+            self.expirations += max(expired, 0)
+
+        count, total_bytes = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM recommendation_cache"
+        ).fetchone()
+        if count <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+
+        # Удаляем самые давние по обращению записи, пока не уложимся в лимиты
+        excess = count - self.max_entries
+        rows = conn.execute("SELECT key, size FROM recommendation_cache ORDER BY accessed_at").fetchall()
+        to_delete = []
+        for key, row_size in rows:
+            if excess <= 0 and total_bytes <= self.max_bytes:
+                break
+            to_delete.append((key,))
+            excess -= 1
+            total_bytes -= row_size
+        conn.executemany("DELETE FROM recommendation_cache WHERE key = ?", to_delete)
+        with self._stats_lock:
+            self.evictions += len(to_delete)
+
+    def clear(self):
+        self._conn().execute("DELETE FROM recommendation_cache")
+
+    def stats(self) -> Dict:
+        count, total_bytes = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM recommendation_cache"
+        ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "backend": "sqlite",
+            "path": str(self.path),
+            "size": count,
+            "bytes": total_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+def create_cache(backend: str, path: Optional[Path] = None, **kwargs):
+    """
+    Создает кэш рекомендаций выбранного типа.
+
+    Args:
+        backend: memory (в памяти процесса) или sqlite (общий файл для всех процессов)
+        path: Путь к SQLite файлу для backend=sqlite
+        **kwargs: max_entries, ttl_seconds, max_bytes
+    """
+    if backend == "memory":
+        return RecommendationCache(**kwargs)
+    if backend == "sqlite":
+        if path is None:
+            raise ValueError("Для sqlite кэша нужен путь к файлу")
+        logger.info(f"Общий SQLite кэш рекомендаций: {path}")
+        return SQLiteRecommendationCache(path, **kwargs)
+    raise ValueError(f"Неизвестный backend кэша: {backend} (доступны: {', '.join(CACHE_BACKENDS)})")
@@ -0,0 +1,95 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RequestCoalescer:
+    """
+    Объединяет одновременные запросы в батчи (микробатчинг).
+
+    Поток запроса кладет задачу в очередь и ждет результат. Фоновый поток
+    берет первую задачу, добирает следующие в течение window_seconds (или
+    пока в батче не наберется max_batch задач) и вызывает process один раз
+    на весь батч; результаты раздаются ожидающим потокам. Пока батч
+    считается, новые задачи копятся в очереди и уходят следующим батчем,
+    поэтому при нагрузке батчи растут и с нулевым окном. Ошибка process
+    передается каждому запросу батча, ошибка on_batch только логируется.
+
+    Поток создается при первом запросе в каждом процессе (после fork
+    воркеров gunicorn потоки мастера недоступны).
+
+    Args:
+        process: Список задач → список результатов в том же порядке
+        window_seconds: Сколько ждать следующих задач после первой задачи батча
+        max_batch: Максимум задач в батче
+        on_batch: (размер батча, время ожидания задач в очереди, секунды) — для метрик
+    """
+
+    def __init__(
+        self,
+        process: Callable[[List[Any]], List[Any]],
+        window_seconds: float,
+        max_batch: int,
+        on_batch: Optional[Callable[[int, List[float]], None]] = None
+    ):
+        self.process = process
+        self.window_seconds = max(0.0, window_seconds)
+        self.max_batch = max(1, max_batch)
+        self.on_batch = on_batch
+        self._queue: Optional[queue.SimpleQueue] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _tasks(self) -> queue.SimpleQueue:
+        if self._queue is None or self._pid != os.getpid():
+            with self._lock:
+                if self._queue is None or self._pid != os.getpid():
+                    self._queue = queue.SimpleQueue()
+                    self._pid = os.getpid()
+                    threading.Thread(target=self._run, args=(self._queue,), name="ai-dj-coalescer", daemon=True).start()
+        return self._queue
+
+    def submit(self, task: Any) -> Any:
+        """Обрабатывает задачу в составе батча и возвращает ее результат (блокирует поток запроса)"""
+        future: Future = Future()
+        self._tasks().put((task, future, time.perf_counter()))
+        return future.result()
+
+    def _collect(self, tasks: queue.SimpleQueue) -> List:
+        batch = [tasks.get()]
+        deadline = time.perf_counter() + self.window_seconds
+        while len(batch) < self.max_batch:
+            try:
+                timeout = deadline - time.perf_counter()
+                # Окно истекло: забираем только то, что уже лежит в очереди
+                batch.append(tasks.get(timeout=timeout) if timeout > 0 else tasks.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, tasks: queue.SimpleQueue):
+        while True:
+            batch = self._collect(tasks)
+            started = time.perf_counter()
+            if self.on_batch is not None:
+                # Ошибка метрик не должна останавливать поток: запросы батча ждут свои результаты
+                try:
+                    self.on_batch(len(batch), [started - enqueued for _, _, enqueued in batch])
+                except Exception as e:
+                    logger.warning(f"Ошибка записи метрик батча: {e}")
+            try:
+                results = self.process([task for task, _, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"Обработчик батча вернул {len(results)} результатов на {len(batch)} задач")
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
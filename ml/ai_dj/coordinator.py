@@ -0,0 +1,391 @@
+"""
+Координатор шардированного сервинга AI DJ (scatter-gather top-k).
+
+Каталог, сохраненный train_model с AI_DJ_SHARDS=N, разбит на N шардов
+(<версия>/shards/<номер>, см. sharding.py). Шард — обычный service.py с
+AI_DJ_SHARD=<номер>: он загружает только свою часть embeddings, метаданных и
+IVF индекса и отвечает на /shard/*. Координатор каталог не загружает:
+
+- /recommend с историей: треки истории ищутся во всех шардах
+  (/shard/lookup), профиль и бонусы считаются по найденным embeddings и
+  жанрам/артистам так же, как в service.py; профиль рассылается шардам
+  (/shard/score), каждый отдает свой топ limit * 2, координатор сливает
+  частичные топы (по оценке, при равенстве — по позиции в каталоге),
+  применяет MMR и собирает ответ;
+- холодный старт: популярные треки шардов (/shard/popular) сливаются по
+  plays, выборка — как у service.cold_start_ranking.
+
+При полном переборе ответ совпадает с одиночным сервисом (тот же набор
+треков, порядок после топ-3 перемешивается). IVF индексы у шардов свои,
+поэтому с ANN кандидаты могут немного отличаться. Сессии, /recommend/batch,
+/similar и хранилище профилей (userId) в шардированном режиме не
+поддерживаются: координатор отвечает на /recommend, /health и /metrics/prometheus.
+
+Запуск:
+    python ml/ai_dj/coordinator.py <data_dir> [port]
+Процессы шардов запускаются по shards.json активной версии (порты port+1..port+N);
+с AI_DJ_SHARD_URLS=http://host:port,... используются уже запущенные шарды.
+
+Переменные окружения:
+    AI_DJ_SHARD_URLS — адреса шардов по порядку номеров (пусто — запустить самому)
+    AI_DJ_SHARD_TIMEOUT_SECONDS — таймаут запроса к шарду (по умолчанию 10)
+    AI_DJ_SHARD_WATCH_SECONDS — как часто проверять версии моделей шардов (0 — не проверять)
+"""
+import hashlib
+import logging
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from flask import Flask, Response, jsonify, request
+
+import service
+from artifacts import resolve_model_dir
+from mmr import mmr_rerank
+from popularity import sample_positions
+from sharding import ShardClient, decode_array, encode_array, load_shards_manifest
+from telemetry import PROMETHEUS_CONTENT_TYPE, RecommendTelemetry, StageTimer, render_gauges
+from track_metadata import TrackMetadata
+
+logger = logging.getLogger(__name__)
+
+app = Flask(__name__)
+
+SHARD_URLS = os.getenv('AI_DJ_SHARD_URLS', '')
+SHARD_TIMEOUT_SECONDS = float(os.getenv('AI_DJ_SHARD_TIMEOUT_SECONDS', '10'))
+SHARD_WATCH_SECONDS = int(os.getenv('AI_DJ_SHARD_WATCH_SECONDS', '10'))
+
+shard_client: Optional[ShardClient] = None
+# Отпечатки моделей шардов через "|": входит в ключ кэша вместо отпечатка модели
+shards_fingerprint = ""
+
+telemetry = RecommendTelemetry(trace_sample_rate=service.TRACE_SAMPLE_RATE)
+
+
+def connect_shards(urls: List[str]):
+    """Подключает координатор к процессам шардов (адреса по порядку номеров)"""
+    global shard_client
+    shard_client = ShardClient(urls, timeout=SHARD_TIMEOUT_SECONDS)
+    refresh_fingerprint()
+    logger.info(f"Координатор подключен к {len(urls)} шардам: {shards_fingerprint}")
+
+
+def refresh_fingerprint():
+    """Обновляет отпечаток моделей шардов по /health"""
+    global shards_fingerprint
+    shards_fingerprint = "|".join(str(h.get("model_fingerprint")) for h in shard_client.scatter("/health", method="GET"))
+
+
+def start_shard_watch():
+    """Фоновая проверка версий моделей шардов (шарды перезагружают модель сами, см. service.start_model_watch)"""
+    if SHARD_WATCH_SECONDS <= 0:
+        return
+
+    def loop():
+        while True:
+            time.sleep(SHARD_WATCH_SECONDS)
+            try:
+                refresh_fingerprint()
+            except RuntimeError as e:
+                logger.warning(f"Не удалось проверить шарды: {e}")
+
+    threading.Thread(target=loop, name="shard-watch", daemon=True).start()
+
+
+def get_cache_key(params: Dict) -> str:
+    """Ключ кэша service.get_cache_key с отпечатками моделей всех шардов"""
+    return hashlib.md5(f"{service.get_cache_key(params)}:{shards_fingerprint}".encode()).hexdigest()
+
+
+def lookup_history(history_ids: List[str]) -> Tuple[np.ndarray, List[str], List[str], List[str]]:
+    """
+    Треки истории из всех шардов в порядке истории (повторы сохраняются,
+    неизвестные треки пропускаются, как в service.find_history_indices).
+
+    Returns:
+        Tuple: (embeddings по прослушиванию, их UUID, жанры истории, артисты истории — без пропусков)
+    """
+    found = {}
+    for part in shard_client.scatter("/shard/lookup", {"ids": list(dict.fromkeys(history_ids))}):
+        rows = decode_array(part["embeddings"])
+        for row, track_id, genre, artist in zip(rows, part["ids"], part["genres"], part["artists"]):
+            found[track_id] = (row, genre, artist)
+
+    track_ids = [tid for tid in history_ids if tid in found]
+    if not track_ids:
+        return np.empty((0, 0)), [], [], []
+    history_embeddings = np.stack([found[tid][0] for tid in track_ids])
+    genres = [found[tid][1] for tid in track_ids if found[tid][1] is not None]
+    artists = [found[tid][2] for tid in track_ids if found[tid][2] is not None]
+    return history_embeddings, track_ids, genres, artists
+
+
+def merge_columns(parts: List[Dict]) -> Dict[str, List]:
+    """Склеивает колонки метаданных ответов шардов (TrackMetadata.columns) в порядке шардов"""
+    return {field: [value for part in parts for value in part[field]] for field in parts[0]} if parts else {}
+
+
+def gather_ranking(parts: List[Dict], keys: List[np.ndarray], n: int) -> Tuple[np.ndarray, Dict[str, List]]:
+    """
+    Общий топ n по частичным топам шардов.
+
+    Args:
+        parts: Ответы шардов (поля indices и tracks), в порядке шардов
+        keys: Ключи порядка треков каждого шарда (больше — выше)
+        n: Сколько треков оставить
+
+    Returns:
+        Tuple: (позиции выбранных треков в склеенных ответах, склеенные колонки метаданных)
+    """
+    # Шарды — подряд идущие части каталога: (номер шарда, локальный индекс) упорядочены как индекс в каталоге
+    shard_numbers = np.concatenate([np.full(len(p["indices"]), i) for i, p in enumerate(parts)])
+    local = np.concatenate([np.asarray(p["indices"], dtype=np.int64) for p in parts])
+    order = np.lexsort((local, shard_numbers, -np.concatenate(keys)))[:n]
+    return order, merge_columns([p["tracks"] for p in parts])
+
+
+def personalized_recommendations(params: Dict, timer: StageTimer) -> Optional[Tuple[Tuple[str, int], bool]]:
+    """
+    Персональные рекомендации по шардам (None — ни одного трека истории нет в каталоге).
+
+    Returns:
+        Optional[Tuple]: ((JSON-массив рекомендаций, количество), можно ли кэшировать ответ)
+    """
+    history_ids = [str(tid) for tid in params["history_ids"]]
+    history_embeddings, track_ids, history_genres, history_artists = lookup_history(history_ids)
+    timer.lap("index_mapping")
+    if not track_ids:
+        return None
+    timer.note("history_found", len(track_ids))
+
+    counts = Counter(track_ids)
+    user_profile = service.weighted_profile(
+        history_embeddings, track_ids, params["history_with_dates"], [counts[tid] for tid in track_ids]
+    )
+    genre_bonuses = service.preference_multipliers_by_name(
+        params["preferred_genres"], history_genres, service.GENRE_BONUS_MAX_EXTRA
+    )
+    artist_bonuses = service.preference_multipliers_by_name(
+        params["preferred_artists"], history_artists, service.ARTIST_BONUS_MAX_EXTRA
+    )
+    timer.lap("user_profile")
+
+    k = params["limit"] * 2  # Берем больше для разнообразия
+    parts = shard_client.scatter("/shard/score", {
+        "profile": encode_array(user_profile),
+        "k": k,
+        "genreBonuses": genre_bonuses,
+        "artistBonuses": artist_bonuses,
+        "exclude": list(counts),
+        "filters": params["filters"],
+        "nprobe": params["n_probe"]
+    })
+    timer.lap("similarity")
+
+    scores = [decode_array(p["scores"]) for p in parts]
+    order, columns = gather_ranking(parts, scores, k)
+    top_scores = np.concatenate(scores)[order]
+    top_embeddings = np.concatenate([decode_array(p["embeddings"]) for p in parts])[order]
+    timer.lap("top_k")
+
+    if params["use_diversity"]:
+        positions = mmr_rerank(top_embeddings, top_scores, params["diversity_factor"])
+        order, top_scores = order[positions], top_scores[positions]
+    order, top_scores = order[:params["limit"]], top_scores[:params["limit"]]
+    timer.lap("diversity")
+
+    # Перемешиваем рекомендации для разнообразия (сохраняя топ-3 в начале), как service.format_recommendations
+    shuffled = np.arange(len(order))
+    if len(shuffled) > 3:
+        rest = shuffled[3:].tolist()
+        random.shuffle(rest)
+        shuffled[3:] = rest
+    metadata = TrackMetadata(pd.DataFrame(columns))
+    recommendations = metadata.render(order[shuffled], top_scores[shuffled]), len(order)
+
+    if "|".join(str(p["model"]) for p in parts) != shards_fingerprint:
+        # Шард сменил версию модели после обновления отпечатка: такой ответ не кэшируется
+        refresh_fingerprint()
+        return recommendations, False
+    return recommendations, True
+
+
+def cold_start_recommendations(params: Dict) -> Tuple[str, int]:
+    """
+    Холодный старт по шардам: популярные треки под предпочтения и фильтры.
+
+    Общий топ по популярности подбирается только из шардов, где под
+    предпочтения нашлись треки; если их нет ни в одном шарде — из общего
+    топа всех шардов (как PopularityIndex.top для всего каталога).
+
+    Returns:
+        Tuple: (JSON-массив рекомендаций, количество)
+    """
+    n = params["limit"] * 2
+    parts = shard_client.scatter("/shard/popular", {
+        "genres": params["preferred_genres"],
+        "artists": params["preferred_artists"],
+        "n": n,
+        "filters": params["filters"]
+    })
+    if any(p["matched"] for p in parts):
+        parts = [p for p in parts if p["matched"]]
+
+    order, columns = gather_ranking(parts, [decode_array(p["keys"]) for p in parts], n)
+    sampled = order[sample_positions(len(order), min(params["limit"], len(order)))]
+    return TrackMetadata(pd.DataFrame(columns)).render_cold_start(sampled), len(sampled)
+
+
+@app.route('/health', methods=['GET'])
+def health():
+    """Проверка работоспособности координатора и шардов"""
+    try:
+        shards = shard_client.scatter("/health", method="GET")
+    except RuntimeError as e:
+        return jsonify({"status": "degraded", "error": str(e)}), 503
+    return jsonify({
+        "status": "ok",
+        "model_loaded": all(s["model_loaded"] for s in shards),
+        "tracks_count": sum(s["tracks_count"] for s in shards),
+        "model_type": "sharded",
+        "cache_size": len(service.recommendation_cache),
+        "cache_hit_rate": service.recommendation_cache.stats()["hit_rate"],
+        "shards": [{"url": url, "model_version": s["model_version"], "tracks_count": s["tracks_count"]}
+                   for url, s in zip(shard_client.urls, shards)]
+    })
+
+
+@app.route('/recommend', methods=['POST'])
+def recommend():
+    """
+    /recommend в шардированном режиме: тело запроса и ответ как у
+    service.recommend (без session и профилей из хранилища по userId).
+    """
+    timer = telemetry.timer()
+
+    try:
+        params = service.parse_recommend_params(request.get_json() or {})
+        if params["session"]:
+            timer.finish("error")
+            return jsonify({"error": "Sessions are not supported in sharded mode"}), 400
+        timer.lap("parse")
+
+        cache_key = get_cache_key(params)
+        cached_result = service.get_cached_recommendations(cache_key)
+        timer.lap("cache_lookup")
+        if cached_result:
+            timer.note("count", cached_result[1])
+            response = service.recommendation_response(cached_result, "ml_db_embeddings", cached=True)
+            timer.lap("serialization")
+            timer.finish("cached")
+            return response
+
+        result = personalized_recommendations(params, timer) if params["history_ids"] else None
+        if result is not None:
+            recommendations, cacheable = result
+            timer.lap("serialization")
+            if cacheable:
+                service.cache_recommendations(cache_key, recommendations)
+            timer.lap("cache_store")
+            timer.note("count", recommendations[1])
+
+            response = service.recommendation_response(recommendations, "ml_db_embeddings", cached=False)
+            timer.lap("serialization")
+            timer.finish("ml_db_embeddings")
+            return response
+
+        # Fallback: холодный старт (новые пользователи)
+        timer.lap("index_mapping")
+        recommendations = cold_start_recommendations(params)
+        timer.lap("cold_start")
+        timer.note("count", recommendations[1])
+
+        response = service.recommendation_response(recommendations, "cold_start", cached=False)
+        timer.lap("serialization")
+        timer.finish("cold_start")
+        return response
+
+    except Exception as e:
+        logger.error(f"Ошибка рекомендации: {e}", exc_info=True)
+        timer.note("error", str(e))
+        timer.finish("error")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/metrics/prometheus', methods=['GET'])
+def metrics_prometheus():
+    """Метрики координатора в формате Prometheus (латентность /recommend по этапам и кэш)"""
+    cache_stats = service.recommendation_cache.stats()
+    lines = telemetry.render() + render_gauges({
+        "ai_dj_cache_entries": ("Number of cached recommendation responses", len(service.recommendation_cache)),
+        "ai_dj_cache_hit_rate": ("Recommendation cache hit rate", cache_stats["hit_rate"]),
+        "ai_dj_shards": ("Number of catalogue shards", len(shard_client.urls) if shard_client else 0),
+    })
+    return Response("\n".join(lines) + "\n", content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+def start_shards(data_dir: str, port: int) -> Tuple[List[subprocess.Popen], List[str]]:
+    """
+    Запускает процессы шардов (service.py с AI_DJ_SHARD) по shards.json активной версии.
+
+    Returns:
+        Tuple: (процессы, адреса шардов)
+    """
+    model_path, _ = resolve_model_dir(Path(data_dir))
+    manifest = load_shards_manifest(model_path)
+    if manifest is None:
+        raise RuntimeError(f"В {model_path} нет шардов: обучите модель с AI_DJ_SHARDS=N")
+
+    processes, urls = [], []
+    for shard in manifest["shards"]:
+        shard_port = port + 1 + shard["shard"]
+        # Профили по userId координатор не использует: хранилище у шардов выключено
+        env = dict(os.environ, AI_DJ_SHARD=str(shard["shard"]), AI_DJ_PROFILE_STORE_MAX_USERS="0")
+        processes.append(subprocess.Popen(
+            [sys.executable, str(Path(__file__).resolve().parent / "service.py"), data_dir, str(shard_port)], env=env
+        ))
+        urls.append(f"http://127.0.0.1:{shard_port}")
+    return processes, urls
+
+
+def wait_for_shards(urls: List[str], timeout: float = 120.0):
+    """Ждет, пока все шарды ответят на /health"""
+    client = ShardClient(urls, timeout=1.0)
+    deadline = time.time() + timeout
+    while True:
+        try:
+            client.scatter("/health", method="GET")
+            return
+        except RuntimeError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.5)
+
+
+if __name__ == '__main__':
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else "ml/ai_dj/data"
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 5001
+
+    processes = []
+    if SHARD_URLS:
+        urls = [url.strip() for url in SHARD_URLS.split(",") if url.strip()]
+    else:
+        processes, urls = start_shards(data_dir, port)
+
+    try:
+        wait_for_shards(urls)
+        connect_shards(urls)
+        start_shard_watch()
+        logger.info(f"AI DJ координатор запущен на порту {port}: {len(urls)} шардов")
+        app.run(host='0.0.0.0', port=port, debug=False, threaded=True)
+    finally:
+        for process in processes:
+            process.terminate()
@@ -0,0 +1,230 @@
+import logging
+import pickle
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+from sklearn.decomposition import PCA
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import StandardScaler
+
+logger = logging.getLogger(__name__)
+
+EMBEDDER_FILENAME = "db_embedder.pkl"
+
+# svd — усеченное SVD по разреженной TF-IDF матрице, pca — PCA по плотной (прежний способ)
+REDUCTION_METHODS = ("svd", "pca")
+# Размер блока строк при построении embeddings (ограничивает пик памяти)
+TRANSFORM_CHUNK_SIZE = 65536
+
+
+class SparseSVD:
+    """
+    Усеченное SVD разреженной матрицы через матрицу Грама X^T X.
+
+    Правые сингулярные векторы X — собственные векторы X^T X (признаки ×
+    признаки, для 2000 признаков TF-IDF — 32 MB). Матрица Грама накапливается
+    по блокам строк, поэтому X никогда не разворачивается в плотную, а память
+    не зависит от количества треков. Как и TruncatedSVD, данные не центрируются.
+    """
+
+    def __init__(self, n_components: int):
+        self.n_components = n_components
+        self.components_: Optional[np.ndarray] = None
+        self.explained_variance_ratio_: Optional[np.ndarray] = None
+
+    def fit(self, matrix, chunk_size: int = TRANSFORM_CHUNK_SIZE) -> "SparseSVD":
+        n_features = matrix.shape[1]
+        gram = np.zeros((n_features, n_features))
+        for start in range(0, matrix.shape[0], chunk_size):
+            block = matrix[start:start + chunk_size]
+            gram += (block.T @ block).toarray()
+
+        eigenvalues, eigenvectors = np.linalg.eigh(gram)
+        top = np.argsort(eigenvalues)[::-1][:self.n_components]
+        self.components_ = np.ascontiguousarray(eigenvectors[:, top].T)
+        self.explained_variance_ratio_ = np.maximum(eigenvalues[top], 0) / max(np.trace(gram), 1e-12)
+        return self
+
+    def transform(self, matrix) -> np.ndarray:
+        return np.asarray(matrix @ self.components_.T)
+
+
+class TrackEmbedder:
+    """
+    Обученные преобразования признаков трека в embedding: TF-IDF + снижение
+    размерности и числовые признаки.
+
+    fit_transform обучает все преобразования на каталоге, transform применяет их к любым
+    трекам, поэтому новые и измененные треки можно встраивать без переобучения
+    (см. train_model.train_incremental).
+
+    По умолчанию размерность снижается усеченным SVD (SparseSVD) прямо по
+    разреженной TF-IDF матрице: она не разворачивается в плотную (2000
+    признаков × 8 байт на трек), а embeddings строятся блоками по
+    TRANSFORM_CHUNK_SIZE строк. reduction="pca" оставляет прежний способ.
+    """
+
+    def __init__(self, embedding_dim: int = 512, reduction: str = "svd"):
+        if reduction not in REDUCTION_METHODS:
+            raise ValueError(f"Неизвестный способ снижения размерности: {reduction}")
+        self.embedding_dim = embedding_dim
+        self.reduction = reduction
+        self.vectorizer: Optional[TfidfVectorizer] = None
+        self.duration_scaler: Optional[StandardScaler] = None
+        self.numeric_scaler: Optional[StandardScaler] = None
+        self.reducer = None
+
+    def __setstate__(self, state):
+        # Сохраненные до появления SVD преобразования хранили PCA в поле pca
+        if "pca" in state:
+            state["reducer"] = state.pop("pca")
+            state["reduction"] = "pca"
+        self.__dict__.update(state)
+
+    def fit_transform(self, text_features: List[str], df: pd.DataFrame,
+                      out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Обучает TF-IDF, скейлеры числовых признаков и снижение размерности и строит embeddings каталога.
+
+        Args:
+            text_features: Текстовые признаки треков
+            df: DataFrame с треками
+            out: Массив для результата (например, np.memmap), по умолчанию создается новый
+
+        Returns:
+            np.ndarray: Матрица embeddings (N треков × размерность)
+        """
+        # TF-IDF векторизация с улучшенными параметрами
+        self.vectorizer = TfidfVectorizer(
+            max_features=2000,  # Увеличено до 2000 признаков для лучшего качества
+            min_df=1,  # Минимум 1 вхождение (для малых датасетов)
+            max_df=0.85,  # Максимум 85% документов (более строгий фильтр)
+            ngram_range=(1, 4),  # Униграммы, биграммы, триграммы и 4-граммы
+            stop_words='english',  # Удаляем стоп-слова
+            sublinear_tf=True,  # Логарифмическое масштабирование TF
+            analyzer='word',  # Анализ по словам
+            norm='l2'  # L2 нормализация для лучшей стабильности
+        )
+        tfidf_matrix = self.vectorizer.fit_transform(text_features)
+        logger.info(f"TF-IDF матрица: {tfidf_matrix.shape}")
+
+        # Длительность нормализуется, только если она вообще заполнена
+        duration = df['duration'].fillna(0).values.reshape(-1, 1)
+        self.duration_scaler = StandardScaler().fit(duration) if duration.max() > 0 else None
+        self.numeric_scaler = StandardScaler().fit(self._raw_numeric(df))
+
+        # Используем PCA/SVD для уменьшения размерности
+        numeric_dim = 3
+        pca_dim = self.embedding_dim - numeric_dim
+
+        # Ограничиваем размерность количеством доступных признаков и треков
+        max_pca_components = min(tfidf_matrix.shape[0] - 1, tfidf_matrix.shape[1], pca_dim)
+
+        if tfidf_matrix.shape[1] > max_pca_components and max_pca_components > 0:
+            if self.reduction == "pca":
+                self.reducer = PCA(n_components=max_pca_components, random_state=42)
+                tfidf_reduced = self.reducer.fit_transform(tfidf_matrix.toarray())
+                logger.info(f"PCA применен: {tfidf_reduced.shape} (запрошено {pca_dim}, доступно {max_pca_components})")
+                return self._combine(tfidf_reduced, df, out=out)
+
+            self.reducer = SparseSVD(max_pca_components).fit(tfidf_matrix)
+            logger.info(f"SVD применен: {max_pca_components} компонент (запрошено {pca_dim}), "
+                        f"доля энергии {self.reducer.explained_variance_ratio_.sum():.3f}")
+        else:
+            # Если треков мало, используем все доступные признаки
+            self.reducer = None
+            logger.info(f"Снижение размерности пропущено: используем все {tfidf_matrix.shape[1]} TF-IDF признаков")
+
+        return self._transform_tfidf(tfidf_matrix, df, out=out)
+
+    def _raw_numeric(self, df: pd.DataFrame) -> np.ndarray:
+        # Популярность (логарифмическая шкала для уменьшения влияния выбросов)
+        plays_log = np.log1p(df['plays'].fillna(0).values).reshape(-1, 1)
+
+        # Длительность трека (нормализованная)
+        duration = df['duration'].fillna(0).values.reshape(-1, 1)
+        if self.duration_scaler is not None:
+            duration = self.duration_scaler.transform(duration)
+
+        # Количество лайков (логарифмическая шкала)
+        likes = df.get('likes_count', pd.Series([0] * len(df))).fillna(0).values.reshape(-1, 1)
+        likes_log = np.log1p(likes)
+
+        return np.hstack([plays_log, duration, likes_log])
+
+    def transform(self, text_features: List[str], df: pd.DataFrame,
+                  out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Строит L2-нормализованные embeddings треков обученными преобразованиями.
+
+        Args:
+            text_features: Текстовые признаки треков
+            df: DataFrame с треками (в том же порядке)
+            out: Массив для результата (например, np.memmap), по умолчанию создается новый
+
+        Returns:
+            np.ndarray: Матрица embeddings (N треков × размерность)
+        """
+        return self._transform_tfidf(self.vectorizer.transform(text_features), df, out=out)
+
+    @property
+    def output_dim(self) -> int:
+        """Размерность embeddings (меньше embedding_dim, если треков или признаков мало)"""
+        text_dim = self.reducer.n_components if self.reducer is not None else len(self.vectorizer.vocabulary_)
+        return text_dim + 3
+
+    def _transform_tfidf(self, tfidf_matrix, df: pd.DataFrame, out: Optional[np.ndarray] = None) -> np.ndarray:
+        # Блоками: плотными бывают только TRANSFORM_CHUNK_SIZE строк TF-IDF матрицы (для PCA)
+        n_tracks = tfidf_matrix.shape[0]
+        if out is None:
+            out = np.empty((n_tracks, self.output_dim))
+        for start in range(0, n_tracks, TRANSFORM_CHUNK_SIZE):
+            block = tfidf_matrix[start:start + TRANSFORM_CHUNK_SIZE]
+            if self.reduction == "pca" or self.reducer is None:
+                block = block.toarray()
+            reduced = self.reducer.transform(block) if self.reducer is not None else block
+            self._combine(reduced, df.iloc[start:start + TRANSFORM_CHUNK_SIZE], out=out[start:start + TRANSFORM_CHUNK_SIZE])
+        return out
+
+    def _combine(self, tfidf_reduced: np.ndarray, df: pd.DataFrame, out: Optional[np.ndarray] = None) -> np.ndarray:
+        numeric_normalized = self.numeric_scaler.transform(self._raw_numeric(df))
+
+        # Объединяем TF-IDF и числовые признаки
+        embeddings = np.hstack([tfidf_reduced, numeric_normalized])
+
+        # L2 нормализация для лучшей работы cosine similarity
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1  # Избегаем деления на ноль
+        if out is None:
+            return embeddings / norms
+        np.divide(embeddings, norms, out=out)
+        return out
+
+    def oov_rate(self, text_features: List[str]) -> float:
+        """
+        Доля слов (униграмм после анализатора TF-IDF), которых нет в словаре.
+
+        Сравнение с долей на обучающем каталоге показывает дрейф словаря:
+        если у новых треков она заметно выше, их embeddings теряют текстовую
+        часть. n-граммы не учитываются: почти все они редкие и вне словаря у
+        любых треков, поэтому только размывают сигнал.
+        """
+        analyzer = self.vectorizer.build_analyzer()
+        vocabulary = self.vectorizer.vocabulary_
+        total = missing = 0
+        for text in text_features:
+            words = [term for term in analyzer(text) if ' ' not in term]
+            total += len(words)
+            missing += sum(1 for word in words if word not in vocabulary)
+        return missing / total if total else 0.0
+
+    def save(self, path: Path):
+        with open(path, "wb") as f:
+            pickle.dump(self, f)
+
+    @classmethod
+    def load(cls, path: Path) -> "TrackEmbedder":
+        with open(path, "rb") as f:
+            return pickle.load(f)
@@ -0,0 +1,146 @@
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Сколько масок разных наборов фильтров держать готовыми (маска — 1 байт на трек)
+MASK_CACHE_SIZE = 32
+
+# Фильтры по атрибутам треков: маска по ним кэшируется (excludeTracks — свой у каждого запроса)
+ATTRIBUTE_FILTERS = ("explicit", "genres", "excludeGenres", "excludeArtists", "yearFrom", "yearTo")
+
+
+def parse_filters(data: Any) -> Dict:
+    """
+    Разбирает фильтры из тела запроса в нормализованный вид (для маски и ключа кэша).
+
+    {
+        "explicit": false,            // false — без explicit треков, true — только explicit
+        "genres": ["Rock"],           // только эти жанры
+        "excludeGenres": ["Metal"],
+        "excludeArtists": ["..."],
+        "yearFrom": 2000,             // год альбома; треки без года под фильтр по году не проходят
+        "yearTo": 2015,
+        "excludeTracks": ["track_id"] // например, снятые с публикации после обучения
+    }
+
+    Raises:
+        ValueError: Если фильтры заданы не объектом или значения неверного типа
+    """
+    if not data:
+        return {}
+    if not isinstance(data, dict):
+        raise ValueError("filters must be an object")
+
+    spec = {}
+    if data.get("explicit") is not None:
+        spec["explicit"] = bool(data["explicit"])
+    for name in ("genres", "excludeGenres", "excludeArtists", "excludeTracks"):
+        values = data.get(name)
+        if values is None:
+            continue
+        if not isinstance(values, list):
+            raise ValueError(f"filters.{name} must be a list")
+        spec[name] = sorted({str(v) for v in values})
+    for name in ("yearFrom", "yearTo"):
+        if data.get(name) is not None:
+            spec[name] = int(data[name])
+    return spec
+
+
+class CatalogueFilters:
+    """
+    Маски допустимых треков для фильтров запроса.
+
+    При загрузке модели атрибуты каталога раскладываются в плоские массивы:
+    explicit — булева колонка, год альбома — int32, жанр и артист — коды
+    (общие с бонусами). Маска набора фильтров собирается векторно (таблица
+    по кодам + gather, сравнения по году) и применяется к similarities до
+    выбора топа, поэтому запрос с фильтрами скорится так же, как без них.
+    Маски по атрибутам кэшируются (LRU на MASK_CACHE_SIZE наборов): частые
+    фильтры, например explicit=false, собираются один раз на версию модели.
+
+    Args:
+        tracks_df: Метаданные треков модели
+        categories: Колонка → (коды треков, -1 для пропусков; словарь значение → код)
+        track_id_to_idx: Маппинг UUID → индекс (для excludeTracks)
+    """
+
+    def __init__(self, tracks_df: pd.DataFrame,
+                 categories: Dict[str, Tuple[Optional[np.ndarray], Dict[str, int]]],
+                 track_id_to_idx):
+        self.n_tracks = len(tracks_df)
+        # Модели, обученные до появления колонки, считают все треки не explicit (значение по умолчанию в БД)
+        self.explicit = (
+            tracks_df['is_explicit'].fillna(False).to_numpy(dtype=bool) if 'is_explicit' in tracks_df.columns
+            else np.zeros(self.n_tracks, dtype=bool)
+        )
+        self.year = (
+            pd.to_numeric(tracks_df['album_year'], errors='coerce').fillna(0).to_numpy(dtype=np.int32)
+            if 'album_year' in tracks_df.columns else np.zeros(self.n_tracks, dtype=np.int32)
+        )
+        self.categories = categories
+        self.track_id_to_idx = track_id_to_idx
+        self._masks: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _category_mask(self, column: str, values, keep: bool) -> Optional[np.ndarray]:
+        """Маска треков, у которых значение колонки в values (keep) или не в values (not keep)"""
+        codes, lookup = self.categories.get(column, (None, {}))
+        if codes is None:
+            return None if not keep else np.zeros(self.n_tracks, dtype=bool)
+        # Последний элемент таблицы — пропуск (код -1)
+        table = np.full(len(lookup) + 1, not keep, dtype=bool)
+        table[[lookup[v] for v in values if v in lookup]] = keep
+        return table[codes]
+
+    def _attribute_mask(self, spec: Dict) -> np.ndarray:
+        allowed = np.ones(self.n_tracks, dtype=bool)
+        if "explicit" in spec:
+            allowed &= self.explicit == spec["explicit"]
+        if "genres" in spec:
+            allowed &= self._category_mask("genre", spec["genres"], keep=True)
+        for name, column in (("excludeGenres", "genre"), ("excludeArtists", "artist")):
+            if name in spec:
+                mask = self._category_mask(column, spec[name], keep=False)
+                if mask is not None:
+                    allowed &= mask
+        if "yearFrom" in spec:
+            allowed &= self.year >= spec["yearFrom"]
+        if "yearTo" in spec:
+            allowed &= (self.year <= spec["yearTo"]) & (self.year > 0)
+        allowed.setflags(write=False)
+        return allowed
+
+    def mask(self, spec: Dict) -> Optional[np.ndarray]:
+        """
+        Маска допустимых треков для нормализованных фильтров (parse_filters).
+
+        Returns:
+            np.ndarray: Булев массив по всему каталогу (только для чтения) или None без фильтров
+        """
+        attributes = {name: spec[name] for name in ATTRIBUTE_FILTERS if name in spec}
+        allowed = None
+        if attributes:
+            key = json.dumps(attributes, sort_keys=True)
+            with self._lock:
+                allowed = self._masks.get(key)
+                if allowed is not None:
+                    self._masks.move_to_end(key)
+            if allowed is None:
+                allowed = self._attribute_mask(attributes)
+                with self._lock:
+                    self._masks[key] = allowed
+                    while len(self._masks) > MASK_CACHE_SIZE:
+                        self._masks.popitem(last=False)
+
+        excluded = spec.get("excludeTracks")
+        if excluded and self.track_id_to_idx is not None:
+            indices = [self.track_id_to_idx[tid] for tid in excluded if tid in self.track_id_to_idx]
+            if indices:
+                allowed = np.ones(self.n_tracks, dtype=bool) if allowed is None else allowed.copy()
+                allowed[indices] = False
+        return allowed
@@ -0,0 +1,39 @@
+"""
+Конфигурация gunicorn для AI DJ сервиса в продакшене.
+
+Модель загружается один раз в мастер-процессе (preload_app, см. wsgi.py) и
+разделяется воркерами; каждый воркер обслуживает запросы несколькими
+потоками (gthread): numpy отпускает GIL на матричных операциях.
+
+Запуск: gunicorn -c ml/ai_dj/gunicorn.conf.py
+
+Переменные окружения:
+    AI_DJ_WORKERS — количество воркеров (по умолчанию число CPU)
+    AI_DJ_THREADS — потоков на воркер (по умолчанию 4)
+    AI_DJ_BIND — адрес (по умолчанию 0.0.0.0:5001)
+    AI_DJ_TIMEOUT — таймаут запроса воркера, секунды (по умолчанию 60)
+    AI_DJ_DATA_DIR — директория модели (wsgi.py)
+"""
+import multiprocessing
+import os
+from pathlib import Path
+
+workers = int(os.getenv('AI_DJ_WORKERS', str(multiprocessing.cpu_count())))
+threads = int(os.getenv('AI_DJ_THREADS', '4'))
+worker_class = 'gthread'
+bind = os.getenv('AI_DJ_BIND', '0.0.0.0:5001')
+timeout = int(os.getenv('AI_DJ_TIMEOUT', '60'))
+
+preload_app = True
+pythonpath = str(Path(__file__).resolve().parent)
+wsgi_app = 'wsgi:app'
+
+if workers > 1:
+    # Кэш в памяти у каждого воркера свой: по умолчанию общий SQLite кэш
+    os.environ.setdefault('AI_DJ_CACHE_BACKEND', 'sqlite')
+
+
+def post_worker_init(worker):
+    # Потоки мастера не переживают fork: фоновые задачи запускаются в каждом воркере
+    import service
+    service.start_background_tasks()
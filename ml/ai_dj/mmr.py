@@ -0,0 +1,61 @@
+import numpy as np
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    L2-нормализует строки матрицы (нулевые строки остаются нулевыми).
+
+    Повторяет поведение sklearn cosine_similarity: у нулевого вектора
+    похожесть с любым другим равна 0.
+    """
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+def mmr_rerank(
+    candidate_embeddings: np.ndarray,
+    relevance: np.ndarray,
+    diversity_factor: float = 0.3
+) -> np.ndarray:
+    """
+    Переранжирует кандидатов по MMR (Maximal Marginal Relevance).
+
+    Матрица попарных косинусных похожестей кандидатов (Gram) считается один раз,
+    а для каждого кандидата хранится максимальная похожесть на уже выбранные.
+    Каждый шаг выбора — одно векторное обновление вместо цикла по парам,
+    итого O(k²·D) на матрицу и O(k²) на выбор.
+
+    Args:
+        candidate_embeddings: Embeddings кандидатов (k × D), в порядке убывания релевантности
+        relevance: Похожесть кандидатов на пользователя (k,)
+        diversity_factor: Фактор разнообразия (0 = только похожие, 1 = только разнообразные)
+
+    Returns:
+        np.ndarray: Позиции кандидатов (0..k-1) в порядке выбора
+    """
+    k = len(relevance)
+    if k <= 1 or diversity_factor == 0:
+        return np.arange(k)
+
+    normalized = normalize_rows(np.asarray(candidate_embeddings, dtype=np.float64))
+    gram = normalized @ normalized.T
+
+    relevance_part = (1 - diversity_factor) * np.asarray(relevance, dtype=np.float64)
+
+    # Первый - самый похожий, дальше поддерживаем max похожесть на выбранные
+    order = np.empty(k, dtype=np.intp)
+    order[0] = 0
+    max_similarity = gram[:, 0].copy()
+    available = np.ones(k, dtype=bool)
+    available[0] = False
+
+    for step in range(1, k):
+        scores = relevance_part + diversity_factor * (1 - max_similarity)
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        order[step] = best
+        available[best] = False
+        np.maximum(max_similarity, gram[:, best], out=max_similarity)
+
+    return order
@@ -0,0 +1,234 @@
+import logging
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+
+from mmr import normalize_rows
+
+logger = logging.getLogger(__name__)
+
+NEIGHBOUR_IDS_FILENAME = "db_neighbours.ids.npy"
+NEIGHBOUR_SCORES_FILENAME = "db_neighbours.scores.npy"
+
+# Блок запросов × порция каталога: скоры блока занимают QUERY_BLOCK_SIZE × CATALOGUE_BLOCK_SIZE × 4 байта
+# (32 MB), вместе с временными массивами argpartition (int64) пик около 4× от этого
+QUERY_BLOCK_SIZE = 1024
+CATALOGUE_BLOCK_SIZE = 8192
+
+
+def merge_top_k(ids: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Построчно оставляет k лучших пар (индекс, скор) без сортировки"""
+    if scores.shape[1] <= k:
+        return ids, scores
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(ids, top, axis=1), np.take_along_axis(scores, top, axis=1)
+
+
+def fill_exact_rows(
+    embeddings: np.ndarray,
+    rows: np.ndarray,
+    ids: np.ndarray,
+    scores: np.ndarray,
+    query_block: int = QUERY_BLOCK_SIZE,
+    catalogue_block: int = CATALOGUE_BLOCK_SIZE
+):
+    """
+    Точным перебором по блокам находит соседей треков rows и записывает строки ids/scores.
+
+    Блок rows сравнивается с каталогом порциями, после каждой порции остается
+    текущий top-K; строки отсортированы по убыванию похожести, сам трек исключен.
+    """
+    n_tracks, k = embeddings.shape[0], ids.shape[1]
+    for q_start in range(0, len(rows), query_block):
+        query_rows = rows[q_start:q_start + query_block]
+        query = normalize_rows(np.asarray(embeddings[query_rows], dtype=np.float32))
+        positions = np.arange(len(query))
+        best_ids = np.empty((len(query), 0), dtype=np.int32)
+        best_scores = np.empty((len(query), 0), dtype=np.float32)
+
+        for c_start in range(0, n_tracks, catalogue_block):
+            block = normalize_rows(np.asarray(embeddings[c_start:c_start + catalogue_block], dtype=np.float32))
+            block_scores = query @ block.T
+            # Сам трек исключается, если его строка попадает в эту порцию каталога
+            own = query_rows - c_start
+            inside = (own >= 0) & (own < len(block))
+            block_scores[positions[inside], own[inside]] = -np.inf
+
+            block_ids = np.broadcast_to(np.arange(c_start, c_start + len(block), dtype=np.int32), block_scores.shape)
+            block_ids, block_scores = merge_top_k(block_ids, block_scores, k)
+            best_ids, best_scores = merge_top_k(
+                np.hstack([best_ids, block_ids]), np.hstack([best_scores, block_scores]), k
+            )
+
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        ids[query_rows] = np.take_along_axis(best_ids, order, axis=1)
+        scores[query_rows] = np.take_along_axis(best_scores, order, axis=1)
+
+
+class NeighbourGraph:
+    """
+    Граф ближайших соседей трека: K самых похожих треков по косинусной близости.
+
+    Строится при обучении блоками: на блок из QUERY_BLOCK_SIZE треков
+    каталог скорится порциями по CATALOGUE_BLOCK_SIZE, и после каждой
+    порции у строк остается только текущий top-K (argpartition по
+    объединению с предыдущим топом), поэтому матрица N × N не создается.
+
+    Хранится двумя массивами N × K, открываемыми через mmap: индексы
+    соседей (int32) и похожесть (float16), строки отсортированы по
+    убыванию похожести, сам трек в свои соседи не входит. Ответ для трека —
+    срез строки, без скоринга каталога.
+    """
+
+    def __init__(self, ids: np.ndarray, scores: np.ndarray):
+        self.ids = ids
+        self.scores = scores
+
+    @property
+    def n_tracks(self) -> int:
+        return self.ids.shape[0]
+
+    @property
+    def k(self) -> int:
+        return self.ids.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.ids.nbytes + self.scores.nbytes
+
+    @classmethod
+    def build(
+        cls,
+        embeddings: np.ndarray,
+        k: int,
+        query_block: int = QUERY_BLOCK_SIZE,
+        catalogue_block: int = CATALOGUE_BLOCK_SIZE
+    ) -> "NeighbourGraph":
+        """
+        Строит граф точным перебором по блокам.
+
+        Args:
+            embeddings: Матрица embeddings (N × D)
+            k: Количество соседей трека (не больше N - 1)
+            query_block: Размер блока треков, для которых ищутся соседи
+            catalogue_block: Размер порции каталога, с которой сравнивается блок
+
+        Returns:
+            NeighbourGraph: Построенный граф
+        """
+        started = time.perf_counter()
+        n_tracks = embeddings.shape[0]
+        k = max(0, min(k, n_tracks - 1))
+        ids = np.empty((n_tracks, k), dtype=np.int32)
+        scores = np.empty((n_tracks, k), dtype=np.float16)
+        if k == 0:
+            return cls(ids, scores)
+
+        fill_exact_rows(embeddings, np.arange(n_tracks), ids, scores, query_block, catalogue_block)
+
+        logger.info(f"Граф соседей построен: {n_tracks} треков × {k} соседей за {time.perf_counter() - started:.1f} с, "
+                    f"{(ids.nbytes + scores.nbytes) / 1024 / 1024:.1f} MB")
+        return cls(ids, scores)
+
+    def update(
+        self,
+        keep: np.ndarray,
+        embeddings: np.ndarray,
+        query_block: int = QUERY_BLOCK_SIZE,
+        catalogue_block: int = CATALOGUE_BLOCK_SIZE
+    ) -> "NeighbourGraph":
+        """
+        Граф для каталога после инкрементального обучения без перебора N × N.
+
+        Новый каталог — сохраненные треки старого (keep, в прежнем порядке), за
+        ними новые и измененные треки. Строки добавленных треков и сохраненных
+        треков, потерявших соседа (удаленного или измененного), считаются
+        точным перебором по всему каталогу. Остальные строки сравниваются
+        только с добавленными треками и объединяются с прежним top-K: соседи
+        среди сохраненных треков не изменились. Стоимость — (добавленные +
+        потерявшие соседа) × N плюс N × добавленные вместо N × N; результат
+        совпадает с build (с точностью до float16 прежних оценок).
+
+        Args:
+            keep: Маска сохраненных треков старого каталога
+            embeddings: Embeddings нового каталога (N × D)
+
+        Returns:
+            NeighbourGraph: Граф нового каталога
+        """
+        started = time.perf_counter()
+        n_tracks, k = embeddings.shape[0], self.k
+        if k > n_tracks - 1:
+            return NeighbourGraph.build(embeddings, k, query_block, catalogue_block)
+        n_kept = int(keep.sum())
+        remap = np.full(len(keep), -1, dtype=np.int32)
+        remap[keep] = np.arange(n_kept, dtype=np.int32)
+        kept_ids = remap[np.asarray(self.ids)[keep]]
+        kept_scores = np.asarray(self.scores)[keep].astype(np.float32)
+        lost = (kept_ids < 0).any(axis=1)
+
+        ids = np.empty((n_tracks, k), dtype=np.int32)
+        scores = np.empty((n_tracks, k), dtype=np.float16)
+
+        # Строки без потерь: прежний top-K плюс похожесть на добавленные треки
+        clean = np.flatnonzero(~lost)
+        for q_start in range(0, len(clean), query_block):
+            rows = clean[q_start:q_start + query_block]
+            query = normalize_rows(np.asarray(embeddings[rows], dtype=np.float32))
+            best_ids, best_scores = kept_ids[rows], kept_scores[rows]
+            for c_start in range(n_kept, n_tracks, catalogue_block):
+                block = normalize_rows(np.asarray(embeddings[c_start:c_start + catalogue_block], dtype=np.float32))
+                block_scores = query @ block.T
+                block_ids = np.broadcast_to(np.arange(c_start, c_start + len(block), dtype=np.int32), block_scores.shape)
+                best_ids, best_scores = merge_top_k(
+                    np.hstack([best_ids, block_ids]), np.hstack([best_scores, block_scores]), k
+                )
+            order = np.argsort(-best_scores, axis=1, kind='stable')
+            ids[rows] = np.take_along_axis(best_ids, order, axis=1)
+            scores[rows] = np.take_along_axis(best_scores, order, axis=1)
+
+        # Добавленные треки и строки, потерявшие соседа, — точным перебором
+        recompute = np.concatenate([np.flatnonzero(lost), np.arange(n_kept, n_tracks)])
+        fill_exact_rows(embeddings, recompute, ids, scores, query_block, catalogue_block)
+
+        logger.info(f"Граф соседей обновлен: {n_tracks} треков, пересчитано строк {len(recompute)} "
+                    f"(добавлено {n_tracks - n_kept}, потеряли соседа {int(lost.sum())}) "
+                    f"за {time.perf_counter() - started:.1f} с")
+        return NeighbourGraph(ids, scores)
+
+    def neighbours(self, track_idx: int, n: int, allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Соседи трека по убыванию похожести.
+
+        Args:
+            track_idx: Индекс трека
+            n: Сколько соседей вернуть (не больше K)
+            allowed: Маска допустимых треков (фильтры запроса): недопустимые пропускаются
+
+        Returns:
+            Tuple: (индексы соседей, похожесть float32)
+        """
+        ids = self.ids[track_idx]
+        scores = self.scores[track_idx]
+        if allowed is not None:
+            keep = allowed[ids]
+            ids, scores = ids[keep], scores[keep]
+        return np.asarray(ids[:n], dtype=np.int64), np.asarray(scores[:n], dtype=np.float32)
+
+    def save(self, path: Path):
+        """Сохраняет граф в директорию модели (два .npy для mmap)"""
+        np.save(path / NEIGHBOUR_IDS_FILENAME, self.ids)
+        np.save(path / NEIGHBOUR_SCORES_FILENAME, self.scores)
+
+    @classmethod
+    def load(cls, path: Path, mmap: bool = True) -> Optional["NeighbourGraph"]:
+        """Загружает граф из директории модели (None, если модель обучена без графа)"""
+        if not (path / NEIGHBOUR_IDS_FILENAME).exists():
+            return None
+        mmap_mode = 'r' if mmap else None
+        return cls(
+            np.load(path / NEIGHBOUR_IDS_FILENAME, mmap_mode=mmap_mode),
+            np.load(path / NEIGHBOUR_SCORES_FILENAME, mmap_mode=mmap_mode)
+        )
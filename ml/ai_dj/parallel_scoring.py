@@ -0,0 +1,103 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+
+def block_top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Позиции k наибольших значений блока (без сортировки)"""
+    if k <= 0:
+        return np.arange(0)
+    if k >= len(scores):
+        return np.arange(len(scores))
+    return np.argpartition(-scores, k - 1)[:k]
+
+
+class ParallelScorer:
+    """
+    Скоринг каталога блоками строк в пуле потоков с top-k по блокам.
+
+    Каталог делится на блоки по block_size треков; функция блока (косинус,
+    бонусы, исключения) выполняется в пуле из threads потоков — NumPy и BLAS
+    отпускают GIL, поэтому блоки считаются на разных ядрах. Из каждого блока
+    берется k лучших через argpartition, затем кандидаты блоков сливаются:
+    полный массив оценок не сортируется и не собирается целиком.
+
+    Пул создается при первом запросе в каждом процессе (после fork воркеров
+    gunicorn потоки мастера недоступны).
+
+    Args:
+        threads: Количество потоков (1 — блоки считаются в потоке запроса)
+        block_size: Размер блока строк каталога
+    """
+
+    def __init__(self, threads: int, block_size: int):
+        self.threads = max(1, threads)
+        self.block_size = max(1, block_size)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(self.threads, thread_name_prefix="ai-dj-scoring")
+                    self._pid = os.getpid()
+        return self._executor
+
+    def blocks(self, n_items: int) -> List[Tuple[int, int]]:
+        """Границы блоков [start, stop) для каталога из n_items треков"""
+        return [(start, min(start + self.block_size, n_items)) for start in range(0, n_items, self.block_size)]
+
+    def top_k(
+        self,
+        n_items: int,
+        score_block: Callable[[int, int], np.ndarray],
+        k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        k лучших треков каталога по оценкам score_block.
+
+        Args:
+            n_items: Размер каталога
+            score_block: (start, stop) → оценки треков блока (float, длина stop - start)
+            k: Сколько треков вернуть
+
+        Returns:
+            Tuple: (индексы треков, оценки) по убыванию оценки; при равных оценках — по индексу
+        """
+        def run(bounds: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+            start, stop = bounds
+            scores = score_block(start, stop)
+            top = block_top_k(scores, k)
+            return top + start, scores[top]
+
+        blocks = self.blocks(n_items)
+        if self.threads > 1 and len(blocks) > 1:
+            parts = list(self._pool().map(run, blocks))
+        else:
+            parts = [run(bounds) for bounds in blocks]
+        return merge_block_tops(parts, k)
+
+
+def merge_block_tops(parts: List[Tuple[np.ndarray, np.ndarray]], k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Сливает top-k блоков в общий топ.
+
+    Args:
+        parts: (индексы треков, оценки) лучших треков каждого блока
+        k: Сколько треков вернуть
+
+    Returns:
+        Tuple: (индексы треков, оценки) по убыванию оценки; при равных оценках — по индексу
+    """
+    if not parts:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    indices = np.concatenate([p[0] for p in parts])
+    scores = np.concatenate([p[1] for p in parts])
+    top = block_top_k(scores, k)
+    order = np.lexsort((indices[top], -scores[top]))
+    return indices[top[order]], scores[top[order]]
@@ -0,0 +1,133 @@
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Seed выборки холодного старта (как random_state=42 у DataFrame.sample)
+COLD_START_SEED = 42
+
+
+@lru_cache(maxsize=256)
+def sample_positions(population: int, size: int) -> np.ndarray:
+    """
+    Позиции выборки без повторений, как DataFrame.sample(n=size, random_state=42).
+
+    Результат зависит только от размеров, поэтому кэшируется: на запрос не
+    создается RandomState. Массив только для чтения.
+    """
+    positions = np.random.RandomState(COLD_START_SEED).choice(population, size=size, replace=False)
+    positions.setflags(write=False)
+    return positions
+
+
+class PopularityIndex:
+    """
+    Треки, отсортированные по популярности, для холодного старта.
+
+    При загрузке модели строится общий порядок треков (plays по убыванию,
+    при равенстве — по позиции, как у DataFrame.nlargest) и для каждого
+    жанра и артиста — его треки в том же порядке. Запрос холодного старта
+    берет списки выбранных жанров/артистов и сливает их по рангу, не
+    копируя и не фильтруя весь каталог.
+
+    Args:
+        n_tracks: Количество треков модели
+        plays: Прослушивания треков (None — порядок каталога, как head)
+        categories: Колонка → (коды треков, -1 для пропусков; словарь значение → код)
+    """
+
+    def __init__(self, n_tracks: int, plays: Optional[np.ndarray],
+                 categories: Dict[str, Tuple[Optional[np.ndarray], Dict[str, int]]]):
+        if plays is None:
+            self.order = np.arange(n_tracks, dtype=np.int32)
+        else:
+            # Треки без plays — в конце (в ответ попадают, только если других не хватает)
+            keys = np.nan_to_num(np.asarray(plays, dtype=np.float64), nan=-np.inf)
+            self.order = np.argsort(-keys, kind="stable").astype(np.int32)
+        self.rank = np.empty(n_tracks, dtype=np.int32)
+        self.rank[self.order] = np.arange(n_tracks, dtype=np.int32)
+
+        # Колонка → (коды, словарь, треки по коду подряд в порядке популярности, границы групп)
+        self._groups = {}
+        for column, (codes, lookup) in categories.items():
+            if codes is None:
+                continue
+            ordered_codes = codes[self.order]
+            perm = np.argsort(ordered_codes, kind="stable")
+            grouped = self.order[perm]
+            bounds = np.searchsorted(ordered_codes[perm], np.arange(len(lookup) + 1))
+            self._groups[column] = (codes, lookup, grouped, bounds)
+
+    @property
+    def nbytes(self) -> int:
+        return self.order.nbytes + self.rank.nbytes + sum(g[2].nbytes + g[3].nbytes for g in self._groups.values())
+
+    def _popular(self, n: int, allowed: Optional[np.ndarray]) -> np.ndarray:
+        """n самых популярных треков каталога (среди допустимых)"""
+        if allowed is None:
+            return self.order[:n]
+        # Обычно фильтры пропускают большую часть каталога: просматриваем порядок порциями, а не целиком
+        found, start, step = [], 0, max(4 * n, 1024)
+        while start < len(self.order) and sum(len(f) for f in found) < n:
+            block = self.order[start:start + step]
+            found.append(block[allowed[block]])
+            start, step = start + step, step * 4
+        return np.concatenate(found)[:n] if found else self.order[:0]
+
+    def _members(self, column: str, values: List[str]) -> Optional[List[np.ndarray]]:
+        """Списки треков значений колонки в порядке популярности (None — фильтра нет)"""
+        if not values or column not in self._groups:
+            return None
+        _, lookup, grouped, bounds = self._groups[column]
+        return [grouped[bounds[code]:bounds[code + 1]] for code in {lookup[v] for v in values if v in lookup}]
+
+    def top(self, genres: List[str], artists: List[str], n: int,
+            allowed: Optional[np.ndarray] = None, fallback: bool = True) -> np.ndarray:
+        """
+        Самые популярные треки с жанром из genres и артистом из artists.
+
+        Пустой список — фильтра нет; если под фильтры не подходит ни один
+        трек, берется весь каталог (как в прежней фильтрации DataFrame).
+
+        Args:
+            allowed: Маска допустимых треков (фильтры запроса, см. CatalogueFilters)
+            fallback: False — без подбора по всему каталогу (пустой результат, если треков
+                под фильтры нет; шард каталога решает это вместе с координатором)
+
+        Returns:
+            np.ndarray: До n индексов треков по убыванию популярности
+        """
+        genre_members = self._members("genre", genres)
+        artist_members = self._members("artist", artists)
+        if allowed is not None:
+            genre_members = None if genre_members is None else [m[allowed[m]] for m in genre_members]
+            artist_members = None if artist_members is None else [m[allowed[m]] for m in artist_members]
+        if genre_members is None and artist_members is None:
+            return self._popular(n, allowed)
+
+        if genre_members is not None and artist_members is not None:
+            # Пересечение: перебираем меньшую сторону и проверяем коды другой
+            sides = [("genre", genre_members, genres), ("artist", artist_members, artists)]
+            sides.sort(key=lambda side: sum(len(m) for m in side[1]))
+            (_, members, _), (other, _, other_values) = sides
+            candidates = np.concatenate(members) if members else np.empty(0, dtype=np.int32)
+            other_codes, other_lookup = self._groups[other][:2]
+            # Таблица по кодам; последний элемент — пропуск (код -1)
+            wanted = np.zeros(len(other_lookup) + 1, dtype=bool)
+            wanted[[other_lookup[v] for v in other_values if v in other_lookup]] = True
+            candidates = candidates[wanted[other_codes[candidates]]]
+        else:
+            # Одна сторона: из каждого списка достаточно первых n треков
+            members = [m[:n] for m in (genre_members if genre_members is not None else artist_members)]
+            candidates = np.concatenate(members) if members else np.empty(0, dtype=np.int32)
+
+        if len(candidates) == 0:
+            return self._popular(n, allowed) if fallback else candidates
+        ranks = self.rank[candidates]
+        if len(candidates) > n:
+            # Ранги уникальны: достаточно отобрать n лучших и отсортировать только их
+            top = np.argpartition(ranks, n - 1)[:n]
+            return candidates[top[np.argsort(ranks[top])]]
+        if len(members) > 1:
+            return candidates[np.argsort(ranks)]
+        return candidates
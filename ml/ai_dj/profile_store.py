@@ -0,0 +1,171 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SECONDS_PER_DAY = 86400
+
+
+class ProfileStore:
+    """
+    Хранилище профилей пользователей с экспоненциальным затуханием.
+
+    Для каждого пользователя хранится затухающая сумма embeddings прослушанных
+    треков и время ее последнего обновления. Новое прослушивание добавляется
+    с весом exp(-возраст / decay_days), а накопленная сумма при каждом
+    обновлении домножается на exp(-прошедшее время / decay_days), поэтому
+    профиль не нужно пересобирать из истории.
+
+    Память ограничена max_users профилями: при переполнении вытесняется
+    пользователь, к которому дольше всего не обращались (LRU), а профили без
+    обращений дольше idle_seconds удаляются.
+    """
+
+    def __init__(self, dim: int, max_users: int = 50000, idle_seconds: float = 30 * SECONDS_PER_DAY,
+                 decay_days: float = 30.0):
+        self.dim = dim
+        self.max_users = max_users
+        self.idle_seconds = idle_seconds
+        self.decay_seconds = decay_days * SECONDS_PER_DAY
+        # user_id → (затухающая сумма embeddings, время суммы, время последнего обращения)
+        self._profiles: "OrderedDict[str, Tuple[np.ndarray, float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._profiles)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._profiles
+
+    def update(self, user_id: str, play_embeddings: np.ndarray, play_weights: np.ndarray,
+               played_at: np.ndarray, now: Optional[float] = None):
+        """
+        Добавляет прослушивания в профиль пользователя.
+
+        Args:
+            user_id: Идентификатор пользователя
+            play_embeddings: Embeddings прослушанных треков (n × D)
+            play_weights: Базовые веса прослушиваний (n,)
+            played_at: Время прослушиваний, unix timestamp (n,)
+            now: Текущее время (по умолчанию time.time())
+        """
+        now = time.time() if now is None else now
+        ages = np.maximum(now - np.asarray(played_at, dtype=np.float64), 0)
+        weights = np.asarray(play_weights, dtype=np.float64) * np.exp(-ages / self.decay_seconds)
+        contribution = (weights[:, None] * np.asarray(play_embeddings, dtype=np.float64)).sum(axis=0)
+
+        with self._lock:
+            entry = self._profiles.pop(user_id, None)
+            if entry is None:
+                total = contribution.astype(np.float32)
+            else:
+                previous, updated_at, _ = entry
+                decay = np.exp(-max(now - updated_at, 0) / self.decay_seconds)
+                total = (previous * decay + contribution).astype(np.float32)
+            self._profiles[user_id] = (total, now, now)
+            self._evict(now)
+
+    def get(self, user_id: str, now: Optional[float] = None) -> Optional[np.ndarray]:
+        """
+        Возвращает нормализованный профиль пользователя (1 × D) или None.
+
+        Затухание общее для всей суммы и на направление вектора не влияет,
+        поэтому при чтении сумма не пересчитывается.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._profiles.get(user_id)
+            if entry is None:
+                return None
+            if now - entry[2] > self.idle_seconds:
+                del self._profiles[user_id]
+                return None
+            self._profiles[user_id] = (entry[0], entry[1], now)
+            self._profiles.move_to_end(user_id)
+            profile = entry[0].astype(np.float64)
+
+        norm = np.linalg.norm(profile)
+        if norm == 0:
+            return None
+        return (profile / norm).reshape(1, -1)
+
+    def updated_at(self, user_id: str) -> Optional[float]:
+        """Время последнего обновления профиля (используется как версия в ключе кэша)"""
+        entry = self._profiles.get(user_id)
+        return entry[1] if entry is not None else None
+
+    def remove(self, user_id: str) -> bool:
+        with self._lock:
+            return self._profiles.pop(user_id, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._profiles.clear()
+
+    def _evict(self, now: float):
+        # Порядок OrderedDict = порядок обращений, самые давние в начале
+        while self._profiles:
+            user_id, (_, _, accessed_at) = next(iter(self._profiles.items()))
+            if len(self._profiles) > self.max_users or now - accessed_at > self.idle_seconds:
+                del self._profiles[user_id]
+            else:
+                break
+
+    def snapshot(self, path: Path, model_fingerprint: str = ""):
+        """Атомарно сохраняет профили на диск (.npz)"""
+        with self._lock:
+            user_ids = list(self._profiles.keys())
+            entries = list(self._profiles.values())
+
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                user_ids=np.array(user_ids, dtype=str),
+                sums=np.stack([e[0] for e in entries]) if entries else np.empty((0, self.dim), dtype=np.float32),
+                updated_at=np.array([e[1] for e in entries], dtype=np.float64),
+                accessed_at=np.array([e[2] for e in entries], dtype=np.float64),
+                model_fingerprint=np.array(model_fingerprint)
+            )
+        os.replace(tmp_path, path)
+        logger.info(f"Снапшот профилей сохранен: {len(user_ids)} пользователей → {path}")
+
+    def restore(self, path: Path, model_fingerprint: str = "") -> int:
+        """
+        Загружает профили из снапшота.
+
+        Снапшот другой модели (другие embeddings) игнорируется.
+
+        Returns:
+            int: Количество загруженных профилей
+        """
+        with np.load(path) as data:
+            if str(data['model_fingerprint']) != model_fingerprint:
+                logger.warning(f"Снапшот профилей от другой модели, пропускаю: {path}")
+                return 0
+            sums = data['sums']
+            if sums.shape[1:] != (self.dim,):
+                return 0
+            restored = OrderedDict(
+                (str(user_id), (sums[i], float(data['updated_at'][i]), float(data['accessed_at'][i])))
+                for i, user_id in enumerate(data['user_ids'])
+            )
+
+        with self._lock:
+            self._profiles = restored
+            self._evict(time.time())
+            return len(self._profiles)
+
+    def stats(self) -> Dict:
+        return {
+            "users": len(self._profiles),
+            "max_users": self.max_users,
+            "memory_mb": len(self._profiles) * self.dim * 4 / 1024 / 1024
+        }
@@ -0,0 +1,267 @@
+import json
+import logging
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+from mmr import normalize_rows
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATION_MODES = ("float16", "int8", "pq")
+
+# Коды сохраняются при обучении рядом с embeddings: коды открываются через mmap,
+# масштаб, кодбуки и recall лежат в отдельном .npz
+QUANTIZED_CODES_FILENAME = "db_quantized.codes.npy"
+QUANTIZED_META_FILENAME = "db_quantized.npz"
+
+# Размер блока строк при скоринге: компактные коды разворачиваются во float32 по блокам
+SCORE_BLOCK_SIZE = 65536
+
+
+class QuantizedEmbeddings:
+    """
+    Компактное представление матрицы embeddings для приближенного скоринга.
+
+    Режимы:
+        float16 — половинная точность, 2 байта на элемент
+        int8    — скалярное квантование с масштабом по каждому измерению, 1 байт на элемент
+        pq      — product quantization: вектор делится на подпространства по sub_dim
+                  измерений, каждое кодируется номером центроида (1 байт на подпространство)
+
+    Приближенные скоры используются только для отбора кандидатов, итоговые
+    similarities пересчитываются по полной матрице (см. service.select_candidates).
+
+    Коды строятся при обучении (train_model) и сохраняются в версию модели
+    вместе с recall (stats), сервис только загружает их.
+    """
+
+    def __init__(self, mode: str, codes: np.ndarray, scale: Optional[np.ndarray] = None,
+                 codebooks: Optional[np.ndarray] = None, stats: Optional[Dict] = None):
+        self.mode = mode
+        self.codes = codes
+        self.scale = scale
+        self.codebooks = codebooks
+        self.stats = stats or {}
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, mode: str, pq_sub_dim: int = 8,
+              sample_size: int = 20000, random_state: int = 42) -> "QuantizedEmbeddings":
+        """
+        Квантует L2-нормализованную матрицу embeddings.
+
+        Args:
+            embeddings: Матрица embeddings (N × D)
+            mode: Режим квантования (float16, int8, pq)
+            pq_sub_dim: Размерность подпространства для pq
+            sample_size: Размер выборки для обучения кодбуков pq
+            random_state: Seed для воспроизводимости
+
+        Returns:
+            QuantizedEmbeddings: Квантованная матрица
+        """
+        if mode not in QUANTIZATION_MODES:
+            raise ValueError(f"Неизвестный режим квантования: {mode}")
+
+        if mode == "float16":
+            quantized = cls(mode, np.empty((0, embeddings.shape[1]), dtype=np.float16))
+            quantized.codes = quantized.encode(embeddings)
+            return quantized
+
+        if mode == "int8":
+            scale = np.zeros(embeddings.shape[1], dtype=np.float32)
+            for start in range(0, len(embeddings), SCORE_BLOCK_SIZE):
+                block = normalize_rows(np.asarray(embeddings[start:start + SCORE_BLOCK_SIZE], dtype=np.float32))
+                np.maximum(scale, np.abs(block).max(axis=0), out=scale)
+            scale = scale / 127
+            scale[scale == 0] = 1
+            quantized = cls(mode, np.empty((0, embeddings.shape[1]), dtype=np.int8), scale=scale)
+            quantized.codes = quantized.encode(embeddings)
+            return quantized
+
+        return cls._build_pq(embeddings, pq_sub_dim, sample_size, random_state)
+
+    @classmethod
+    def _build_pq(cls, embeddings: np.ndarray, sub_dim: int, sample_size: int,
+                  random_state: int) -> "QuantizedEmbeddings":
+        n_tracks, dim = embeddings.shape
+        n_subspaces = -(-dim // sub_dim)
+        n_centroids = min(256, n_tracks)
+        rng = np.random.default_rng(random_state)
+
+        sample_idx = np.sort(rng.choice(n_tracks, size=min(sample_size, n_tracks), replace=False))
+        sample = _subvectors(embeddings[sample_idx], n_subspaces, sub_dim)
+
+        codebooks = np.empty((n_subspaces, n_centroids, sub_dim), dtype=np.float32)
+        for j in range(n_subspaces):
+            codebooks[j] = _kmeans(sample[:, j, :], n_centroids, rng)
+
+        logger.info(f"PQ кодбуки обучены: {n_subspaces} подпространств × {n_centroids} центроидов")
+        quantized = cls("pq", np.empty((0, n_subspaces), dtype=np.uint8), codebooks=codebooks)
+        quantized.codes = quantized.encode(embeddings)
+        return quantized
+
+    def encode(self, embeddings: np.ndarray) -> np.ndarray:
+        """
+        Коды строк embeddings с масштабом и кодбуками этой матрицы (без их переобучения).
+
+        Используется при построении и при инкрементальном обучении: новые
+        треки кодируются теми же кодбуками, что и остальной каталог.
+        """
+        n_tracks = len(embeddings)
+        if self.mode == "pq":
+            n_subspaces, _, sub_dim = self.codebooks.shape
+            codes = np.empty((n_tracks, n_subspaces), dtype=np.uint8)
+        else:
+            codes = np.empty(embeddings.shape, dtype=self.codes.dtype)
+
+        for start in range(0, n_tracks, SCORE_BLOCK_SIZE):
+            block = embeddings[start:start + SCORE_BLOCK_SIZE]
+            if self.mode == "pq":
+                block = _subvectors(block, n_subspaces, sub_dim)
+                for j in range(n_subspaces):
+                    codes[start:start + SCORE_BLOCK_SIZE, j] = _nearest_centroid(block[:, j, :], self.codebooks[j])
+                continue
+            block = normalize_rows(np.asarray(block, dtype=np.float32))
+            if self.mode == "int8":
+                block = np.clip(np.rint(block / self.scale), -127, 127)
+            codes[start:start + SCORE_BLOCK_SIZE] = block
+        return codes
+
+    def update(self, keep: np.ndarray, added: np.ndarray) -> "QuantizedEmbeddings":
+        """Коды после инкрементального обучения: сохраненные треки (keep), затем закодированные добавленные"""
+        codes = np.concatenate([np.asarray(self.codes[keep]), self.encode(added)])
+        return QuantizedEmbeddings(self.mode, codes, scale=self.scale, codebooks=self.codebooks)
+
+    def rows(self, start: int, stop: int) -> "QuantizedEmbeddings":
+        """Коды среза каталога (для шардов) с теми же масштабом, кодбуками и stats"""
+        return QuantizedEmbeddings(self.mode, np.asarray(self.codes[start:stop]), scale=self.scale,
+                                   codebooks=self.codebooks, stats=self.stats)
+
+    def save(self, path: Path):
+        """Сохраняет коды (.npy для mmap), масштаб, кодбуки и stats в директорию модели"""
+        np.save(path / QUANTIZED_CODES_FILENAME, self.codes)
+        extra = {name: value for name, value in (("scale", self.scale), ("codebooks", self.codebooks)) if value is not None}
+        np.savez(path / QUANTIZED_META_FILENAME, mode=np.array(self.mode),
+                 stats=np.array(json.dumps(self.stats)), **extra)
+
+    @classmethod
+    def load(cls, path: Path, mmap: bool = True) -> Optional["QuantizedEmbeddings"]:
+        """Загружает коды из директории модели (None, если модель обучена без квантования)"""
+        if not (path / QUANTIZED_CODES_FILENAME).exists():
+            return None
+        with np.load(path / QUANTIZED_META_FILENAME) as meta:
+            return cls(
+                str(meta["mode"]),
+                np.load(path / QUANTIZED_CODES_FILENAME, mmap_mode='r' if mmap else None),
+                scale=meta["scale"] if "scale" in meta else None,
+                codebooks=meta["codebooks"] if "codebooks" in meta else None,
+                stats=json.loads(str(meta["stats"]))
+            )
+
+    @property
+    def nbytes(self) -> int:
+        """Память, занимаемая кодами и вспомогательными таблицами"""
+        total = self.codes.nbytes
+        for extra in (self.scale, self.codebooks):
+            if extra is not None:
+                total += extra.nbytes
+        return total
+
+    def score(self, query: np.ndarray, indices: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Приближенное скалярное произведение запроса с треками.
+
+        Args:
+            query: Нормализованный вектор запроса (D,) или (1, D)
+            indices: Индексы треков (None = весь каталог)
+
+        Returns:
+            np.ndarray: Приближенные similarities (float32)
+        """
+        query = np.ravel(query).astype(np.float32)
+        codes = self.codes if indices is None else self.codes[indices]
+
+        if self.mode == "pq":
+            n_subspaces, _, sub_dim = self.codebooks.shape
+            query = np.pad(query, (0, n_subspaces * sub_dim - len(query)))
+            # Таблица скалярных произведений подвектора запроса с каждым центроидом
+            lut = np.einsum('jcd,jd->jc', self.codebooks, query.reshape(n_subspaces, sub_dim))
+            scores = np.zeros(len(codes), dtype=np.float32)
+            for j in range(n_subspaces):
+                scores += lut[j][codes[:, j]]
+            return scores
+
+        if self.mode == "int8":
+            query = query * self.scale
+
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_BLOCK_SIZE):
+            block = codes[start:start + SCORE_BLOCK_SIZE]
+            scores[start:start + SCORE_BLOCK_SIZE] = block.astype(np.float32) @ query
+        return scores
+
+
+def _subvectors(block: np.ndarray, n_subspaces: int, sub_dim: int) -> np.ndarray:
+    # Нормализованные строки, дополненные нулями до n_subspaces × sub_dim, по подпространствам
+    block = normalize_rows(np.asarray(block, dtype=np.float32))
+    padded_dim = n_subspaces * sub_dim
+    if padded_dim > block.shape[1]:
+        block = np.pad(block, ((0, 0), (0, padded_dim - block.shape[1])))
+    return block.reshape(len(block), n_subspaces, sub_dim)
+
+
+def _nearest_centroid(points: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    # argmin ||x - c||² = argmax (2·x·c - ||c||²)
+    return np.argmax(2 * points @ centroids.T - (centroids ** 2).sum(axis=1), axis=1)
+
+
+def _kmeans(points: np.ndarray, n_centroids: int, rng: np.random.Generator, n_iter: int = 10) -> np.ndarray:
+    centroids = points[rng.choice(len(points), size=n_centroids, replace=False)].copy()
+    for _ in range(n_iter):
+        assignments = _nearest_centroid(points, centroids)
+        counts = np.bincount(assignments, minlength=n_centroids)
+        sums = np.zeros_like(centroids)
+        order = np.argsort(assignments, kind='stable')
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        non_empty = counts > 0
+        sums[non_empty] = np.add.reduceat(points[order], starts[non_empty], axis=0)
+        centroids[non_empty] = sums[non_empty] / counts[non_empty, None]
+    return centroids
+
+
+def measure_recall(
+    embeddings: np.ndarray,
+    quantized: QuantizedEmbeddings,
+    rerank_size: int,
+    top_k: int = 50,
+    n_queries: int = 16,
+    random_state: int = 42
+) -> float:
+    """
+    Измеряет recall@top_k квантованного скоринга с точным переранжированием.
+
+    Запросы — нормализованные средние 20 случайных треков (как профиль из истории).
+
+    Returns:
+        float: Средняя доля точного топа, найденная квантованным путем
+    """
+    n_tracks = embeddings.shape[0]
+    top_k = min(top_k, n_tracks)
+    rerank_size = min(max(rerank_size, top_k), n_tracks)
+    rng = np.random.default_rng(random_state)
+
+    recalls = []
+    for _ in range(n_queries):
+        history = rng.choice(n_tracks, size=min(20, n_tracks), replace=False)
+        query = normalize_rows(np.asarray(embeddings[history], dtype=np.float64).mean(axis=0, keepdims=True))[0]
+
+        exact = np.asarray(embeddings @ query)
+        truth = np.argpartition(-exact, top_k - 1)[:top_k]
+
+        pool = np.argpartition(-quantized.score(query), rerank_size - 1)[:rerank_size]
+        reranked = pool[np.argpartition(-exact[pool], top_k - 1)[:top_k]]
+        recalls.append(len(np.intersect1d(truth, reranked)) / top_k)
+
+    return float(np.mean(recalls))
@@ -1,5 +1,4 @@
-from flask import Flask, request, jsonify
-import pickle
+from flask import Flask, Response, request, jsonify, g
 import numpy as np
 from pathlib import Path
 from sklearn.metrics.pairwise import cosine_similarity
@@ -7,9 +6,32 @@ import pandas as pd
 import logging
 from typing import List, Dict, Optional, Tuple
 from datetime import datetime, timedelta
-from collections import defaultdict
+from collections import Counter, defaultdict
+import atexit
 import hashlib
 import json
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+
+from ann_index import ANN_INDEX_FILENAME, IVFIndex
+from cache import create_cache
+from coalescer import RequestCoalescer
+from filters import CatalogueFilters, parse_filters
+from artifacts import EMBEDDINGS_FILENAME, load_artifacts, load_fixed_width_columns, resolve_model_dir
+from mmr import mmr_rerank
+from neighbours import NeighbourGraph
+from parallel_scoring import ParallelScorer, block_top_k, merge_block_tops
+from popularity import PopularityIndex, sample_positions
+from profile_store import SECONDS_PER_DAY, ProfileStore
+from quantization import QuantizedEmbeddings
+from rwlock import ReadWriteLock
+from sharding import SHARDS_DIRNAME, decode_array, encode_array
+from track_metadata import TrackMetadata, render_object, render_response
+from telemetry import PROMETHEUS_CONTENT_TYPE, RecommendTelemetry, StageTimer, array_summary, render_gauges
 
 # Настройка логирования
 logging.basicConfig(
@@ -24,49 +46,392 @@ app = Flask(__name__)
 embeddings: Optional[np.ndarray] = None
 tracks_df: Optional[pd.DataFrame] = None
 track_id_to_idx: Optional[Dict[str, int]] = None
+ann_index: Optional[IVFIndex] = None
+quantized_embeddings: Optional[QuantizedEmbeddings] = None
+quantization_stats: Dict = {}
+# Целочисленные коды жанров и артистов (-1 = пропуск) и словари значение → код
+genre_codes: Optional[np.ndarray] = None
+artist_codes: Optional[np.ndarray] = None
+genre_lookup: Dict[str, int] = {}
+artist_lookup: Dict[str, int] = {}
+# Колонки метаданных для сборки JSON-ответа без DataFrame
+track_metadata: Optional[TrackMetadata] = None
+# Треки по популярности (общий порядок и по жанрам/артистам) для холодного старта
+popularity_index: Optional[PopularityIndex] = None
+# Маски фильтров запроса по атрибутам треков (explicit, жанр, артист, год)
+catalogue_filters: Optional[CatalogueFilters] = None
+# Заранее посчитанные соседи треков для /similar (None — модель обучена без графа)
+neighbour_graph: Optional[NeighbourGraph] = None
+# Инкрементальные профили пользователей (None = выключено)
+profile_store: Optional[ProfileStore] = None
+profile_snapshot_path: Optional[Path] = None
+model_fingerprint = ""
+# Активная версия модели и перезагрузка без остановки сервиса
+model_data_dir: Optional[Path] = None
+model_version = ""
+model_loaded_at: Optional[datetime] = None
+model_load_seconds = 0.0
+reload_status: Dict = {"state": "idle", "version": None, "error": None}
+# Запросы держат блокировку на чтение, замена модели — на запись
+model_lock = ReadWriteLock()
+reload_lock = threading.Lock()
 
 # Конфигурация
 MAX_LIMIT = 50
 DEFAULT_LIMIT = 25
-CACHE_TTL_SECONDS = 300  # 5 минут кэширования
+CACHE_TTL_SECONDS = int(os.getenv('AI_DJ_CACHE_TTL_SECONDS', '300'))  # 5 минут кэширования
+CACHE_MAX_ENTRIES = int(os.getenv('AI_DJ_CACHE_MAX_ENTRIES', '1000'))
+CACHE_MAX_BYTES = int(os.getenv('AI_DJ_CACHE_MAX_MB', '64')) * 1024 * 1024
+# memory — кэш в памяти процесса, sqlite — общий файл для всех процессов на машине
+CACHE_BACKEND = os.getenv('AI_DJ_CACHE_BACKEND', 'memory')
+CACHE_PATH = os.getenv('AI_DJ_CACHE_PATH', str(Path(tempfile.gettempdir()) / "ai_dj_cache.sqlite"))
+# Версия формата значений кэша (входит в ключ: общий SQLite кэш переживает перезапуск сервиса)
+CACHE_VALUE_FORMAT = 2
 EMBEDDING_DIM = 512
+DEFAULT_DIVERSITY_FACTOR = 0.2
+# Максимальная прибавка бонуса категории (вся история в ней): жанр до 1.5, артист до 1.4
+GENRE_BONUS_MAX_EXTRA = 0.4
+ARTIST_BONUS_MAX_EXTRA = 0.3
+# Сколько кластеров IVF индекса просматривать (0 = всегда полный перебор)
+ANN_NPROBE = int(os.getenv('AI_DJ_ANN_NPROBE', '16'))
+# Квантованный скоринг: float16, int8, pq (пусто = полная точность); коды строит train_model
+# с тем же AI_DJ_QUANTIZATION
+QUANTIZATION = os.getenv('AI_DJ_QUANTIZATION', '')
+# Сколько лучших по приближенному скору треков пересчитывать с полной точностью
+RERANK_SIZE = int(os.getenv('AI_DJ_RERANK_SIZE', '300'))
+# Номер шарда каталога, который обслуживает процесс (пусто — весь каталог; см. coordinator.py)
+SHARD = os.getenv('AI_DJ_SHARD', '')
+# Полный перебор каталога блоками строк: потоков на запрос (0 — прежний проход по всему каталогу одним вызовом)
+# и размер блока (блок помещается в кэш процессора, поэтому блоки быстрее и в одном потоке)
+SCORING_THREADS = int(os.getenv('AI_DJ_SCORING_THREADS', '1'))
+SCORING_BLOCK_SIZE = int(os.getenv('AI_DJ_SCORING_BLOCK_SIZE', '4096'))
+# Микробатчинг полного перебора: одновременные /recommend скорятся одним умножением на батч профилей.
+# Максимум запросов в батче (0/1 — выключено) и сколько ждать следующих запросов после первого
+COALESCE_MAX_BATCH = int(os.getenv('AI_DJ_COALESCE_MAX_BATCH', '0'))
+COALESCE_WINDOW_MS = float(os.getenv('AI_DJ_COALESCE_WINDOW_MS', '2'))
+# Сессии AI DJ: сколько треков ранжировать на сессию, время жизни курсора с последнего обращения, максимум сессий
+SESSION_SIZE = int(os.getenv('AI_DJ_SESSION_SIZE', '200'))
+SESSION_TTL_SECONDS = int(os.getenv('AI_DJ_SESSION_TTL_SECONDS', '1800'))
+SESSION_MAX_ENTRIES = int(os.getenv('AI_DJ_SESSION_MAX_ENTRIES', '10000'))
+# Максимум пользователей в одном запросе /recommend/batch
+MAX_BATCH_SIZE = 1000
+# Сколько профилей скорить одним матричным умножением (ограничивает память блока)
+BATCH_SCORE_ROWS = 64
+# Хранилище профилей: максимум пользователей (0 = выключено), вытеснение неактивных, снапшоты.
+# По умолчанию выключено: профиль считается по истории запроса (compute_user_profile); хранилище
+# имеет смысл, только если бэкенд присылает прослушивания через /profile/update
+PROFILE_STORE_MAX_USERS = int(os.getenv('AI_DJ_PROFILE_STORE_MAX_USERS', '0'))
+PROFILE_IDLE_DAYS = float(os.getenv('AI_DJ_PROFILE_IDLE_DAYS', '30'))
+PROFILE_SNAPSHOT_PATH = os.getenv('AI_DJ_PROFILE_SNAPSHOT', '')  # по умолчанию <data_dir>/profiles.npz
+PROFILE_SNAPSHOT_SECONDS = int(os.getenv('AI_DJ_PROFILE_SNAPSHOT_SECONDS', '300'))
+# Открывать embeddings через mmap вместо чтения в память процесса
+USE_MMAP = os.getenv('AI_DJ_MMAP', '1') != '0'
+# Как часто проверять появление новой версии модели (0 = только через /admin/reload)
+MODEL_WATCH_SECONDS = int(os.getenv('AI_DJ_MODEL_WATCH_SECONDS', '30'))
+# Токен для /admin/* (заголовок X-Admin-Token), пусто = без проверки
+ADMIN_TOKEN = os.getenv('AI_DJ_ADMIN_TOKEN', '')
+# Доля запросов /recommend, для которых пишется трасса (одна JSON-запись в логгер ai_dj.trace)
+TRACE_SAMPLE_RATE = float(os.getenv('AI_DJ_TRACE_SAMPLE_RATE', '0.01'))
+# Эндпоинты, которые работают с моделью и не должны видеть замену посреди запроса
+MODEL_ENDPOINTS = {'recommend', 'recommend_next', 'recommend_batch', 'similar', 'profile_update',
+                   'shard_lookup', 'shard_score', 'shard_popular'}
+
+# LRU кэш с TTL и ограничением по размеру (в памяти процесса или общий SQLite)
+recommendation_cache = create_cache(
+    CACHE_BACKEND,
+    path=Path(CACHE_PATH),
+    max_entries=CACHE_MAX_ENTRIES,
+    ttl_seconds=CACHE_TTL_SECONDS,
+    max_bytes=CACHE_MAX_BYTES
+)
+
+# Сессии AI DJ (курсор → ранжированный список и сколько треков уже отдано), тот же backend, что у кэша
+session_store = create_cache(
+    CACHE_BACKEND,
+    path=Path(CACHE_PATH).with_suffix(".sessions.sqlite"),
+    max_entries=SESSION_MAX_ENTRIES,
+    ttl_seconds=SESSION_TTL_SECONDS,
+    max_bytes=CACHE_MAX_BYTES
+)
+
+# Латентность этапов /recommend и счетчики по способу ответа (/metrics/prometheus)
+telemetry = RecommendTelemetry(trace_sample_rate=TRACE_SAMPLE_RATE)
+
+# Параллельный скоринг полного перебора (None — выключен)
+parallel_scorer = ParallelScorer(SCORING_THREADS, SCORING_BLOCK_SIZE) if SCORING_THREADS > 0 else None
+
+# Микробатчинг полного перебора /recommend (None — выключен)
+request_coalescer = RequestCoalescer(
+    lambda tasks: rank_catalogue_batch(tasks),
+    window_seconds=COALESCE_WINDOW_MS / 1000,
+    max_batch=COALESCE_MAX_BATCH,
+    on_batch=telemetry.record_batch
+) if COALESCE_MAX_BATCH > 1 else None
+
+
+def read_model(model_path: Path, version: str, data_path: Path) -> Dict:
+    """
+    Загружает версию модели и все производные структуры, не трогая активную модель.
+    
+    Args:
+        model_path: Директория версии модели
+        version: Имя версии
+        data_path: Корневая директория модели (для снапшота профилей)
+    
+    Returns:
+        Dict: Состояние модели (имена совпадают с глобальными переменными)
+    """
+    started = time.perf_counter()
+    embeddings_path = model_path / EMBEDDINGS_FILENAME
+    if not embeddings_path.exists():
+        raise FileNotFoundError(f"Модель не найдена: {embeddings_path}")
+    
+    logger.info(f"Загружаю модель из БД (версия {version})...")
+    # Embeddings открываются через mmap: страницы разделяются между процессами через page cache
+    # id и title остаются байтами фиксированной ширины в mmap (TrackMetadata), в DataFrame их нет
+    new_embeddings, new_tracks_df, new_track_id_to_idx = load_artifacts(model_path, mmap=USE_MMAP, decode_fixed_width=False)
+    
+    if len(new_tracks_df) != new_embeddings.shape[0]:
+        raise ValueError(f"Несоответствие размеров: {len(new_tracks_df)} треков, {new_embeddings.shape[0]} embeddings")
+    # Индекс строки = индекс трека в embeddings (на этом строится сборка ответа холодного старта)
+    if not isinstance(new_tracks_df.index, pd.RangeIndex):
+        new_tracks_df = new_tracks_df.reset_index(drop=True)
+    
+    fingerprint = f"{new_embeddings.shape[0]}x{new_embeddings.shape[1]}@{int(embeddings_path.stat().st_mtime)}"
+    # Профили живут в пространстве embeddings конкретной версии, поэтому хранилище создается заново
+    new_profile_store = None
+    snapshot_path = None
+    if PROFILE_STORE_MAX_USERS > 0:
+        new_profile_store = ProfileStore(
+            new_embeddings.shape[1],
+            max_users=PROFILE_STORE_MAX_USERS,
+            idle_seconds=PROFILE_IDLE_DAYS * SECONDS_PER_DAY
+        )
+        snapshot_path = Path(PROFILE_SNAPSHOT_PATH) if PROFILE_SNAPSHOT_PATH else data_path / "profiles.npz"
+        if snapshot_path.exists():
+            restored = new_profile_store.restore(snapshot_path, fingerprint)
+            logger.info(f"Профили восстановлены из снапшота: {restored}")
+    
+    new_genre_codes, new_genre_lookup = build_category_codes(new_tracks_df, 'genre')
+    new_artist_codes, new_artist_lookup = build_category_codes(new_tracks_df, 'artist')
+    logger.info(f"Коды категорий: {len(new_genre_lookup)} жанров, {len(new_artist_lookup)} артистов")
+    new_track_metadata = TrackMetadata(new_tracks_df, load_fixed_width_columns(model_path, mmap=USE_MMAP))
+    categories = {'genre': (new_genre_codes, new_genre_lookup), 'artist': (new_artist_codes, new_artist_lookup)}
+    new_popularity_index = PopularityIndex(
+        len(new_tracks_df),
+        new_tracks_df['plays'].to_numpy() if 'plays' in new_tracks_df.columns else None,
+        categories
+    )
+    new_catalogue_filters = CatalogueFilters(new_tracks_df, categories, new_track_id_to_idx)
+    
+    new_ann_index = None
+    ann_path = model_path / ANN_INDEX_FILENAME
+    if ann_path.exists():
+        new_ann_index = IVFIndex.load(ann_path)
+        if new_ann_index.n_tracks != new_embeddings.shape[0]:
+            logger.warning(f"IVF индекс не соответствует модели ({new_ann_index.n_tracks} треков), используем полный перебор")
+            new_ann_index = None
+        else:
+            logger.info(f"IVF индекс загружен: {new_ann_index.n_lists} кластеров, nprobe={ANN_NPROBE}")
+    
+    new_neighbour_graph = NeighbourGraph.load(model_path, mmap=USE_MMAP)
+    if new_neighbour_graph is not None:
+        if new_neighbour_graph.n_tracks != new_embeddings.shape[0]:
+            logger.warning(f"Граф соседей не соответствует модели ({new_neighbour_graph.n_tracks} треков), /similar скорит каталог")
+            new_neighbour_graph = None
+        else:
+            logger.info(f"Граф соседей загружен: {new_neighbour_graph.k} соседей на трек")
+    
+    new_quantized = None
+    new_quantization_stats = {}
+    if QUANTIZATION:
+        # Коды и recall строятся при обучении: загрузка только открывает их (через mmap)
+        new_quantized = QuantizedEmbeddings.load(model_path, mmap=USE_MMAP)
+        if new_quantized is None or new_quantized.mode != QUANTIZATION or len(new_quantized.codes) != new_embeddings.shape[0]:
+            logger.warning(f"В модели нет квантованных кодов {QUANTIZATION} (обучите ее с AI_DJ_QUANTIZATION={QUANTIZATION}), "
+                           f"используем полную точность")
+            new_quantized = None
+        else:
+            recall = new_quantized.stats.get("recall_at_50")
+            new_quantization_stats = dict(new_quantized.stats, mode=QUANTIZATION, rerank_size=RERANK_SIZE,
+                                          recall_loss=1 - recall if recall is not None else None)
+            logger.info(f"Квантованный скоринг ({QUANTIZATION}): {new_quantized.nbytes / 1024 / 1024:.1f} MB, recall@50={recall}")
+    
+    logger.info(f"Модель загружена: {len(new_tracks_df)} треков, embeddings shape: {new_embeddings.shape}")
+    return {
+        "embeddings": new_embeddings,
+        "tracks_df": new_tracks_df,
+        "track_metadata": new_track_metadata,
+        "popularity_index": new_popularity_index,
+        "catalogue_filters": new_catalogue_filters,
+        "track_id_to_idx": new_track_id_to_idx,
+        "ann_index": new_ann_index,
+        "neighbour_graph": new_neighbour_graph,
+        "quantized_embeddings": new_quantized,
+        "quantization_stats": new_quantization_stats,
+        "genre_codes": new_genre_codes,
+        "genre_lookup": new_genre_lookup,
+        "artist_codes": new_artist_codes,
+        "artist_lookup": new_artist_lookup,
+        "profile_store": new_profile_store,
+        "profile_snapshot_path": snapshot_path,
+        "model_fingerprint": fingerprint,
+        "model_version": version,
+        "model_load_seconds": time.perf_counter() - started
+    }
+
+
+def activate_model(state: Dict):
+    """
+    Атомарно делает загруженную версию активной.
+    
+    Замена ждет завершения начатых запросов (они дорабатывают на старой
+    версии), новые запросы на время замены приостанавливаются. Кэш очищается:
+    ответы старой версии больше не нужны (в ключ кэша входит отпечаток модели,
+    поэтому старые записи и так не совпадут с новыми запросами).
+    """
+    global embeddings, tracks_df, track_metadata, popularity_index, catalogue_filters, track_id_to_idx, ann_index, neighbour_graph, quantized_embeddings, quantization_stats
+    global genre_codes, artist_codes, genre_lookup, artist_lookup
+    global profile_store, profile_snapshot_path, model_fingerprint
+    global model_version, model_loaded_at, model_load_seconds
+    
+    with model_lock.write_locked():
+        embeddings = state["embeddings"]
+        tracks_df = state["tracks_df"]
+        track_metadata = state["track_metadata"]
+        popularity_index = state["popularity_index"]
+        catalogue_filters = state["catalogue_filters"]
+        track_id_to_idx = state["track_id_to_idx"]
+        ann_index = state["ann_index"]
+        neighbour_graph = state["neighbour_graph"]
+        quantized_embeddings = state["quantized_embeddings"]
+        quantization_stats = state["quantization_stats"]
+        genre_codes, genre_lookup = state["genre_codes"], state["genre_lookup"]
+        artist_codes, artist_lookup = state["artist_codes"], state["artist_lookup"]
+        profile_store = state["profile_store"]
+        profile_snapshot_path = state["profile_snapshot_path"]
+        model_fingerprint = state["model_fingerprint"]
+        model_version = state["model_version"]
+        model_load_seconds = state["model_load_seconds"]
+        model_loaded_at = datetime.now()
+    
+    recommendation_cache.clear()
+    logger.info(f"Активна версия модели {model_version} (загрузка {model_load_seconds:.1f} с)")
 
-# In-memory кэш (в продакшене использовать Redis)
-recommendation_cache: Dict[str, Tuple[datetime, List[Dict]]] = {}
+
+def resolve_serving_dir(data_path: Path) -> Tuple[Path, str]:
+    """Директория активной версии модели, в режиме шарда (AI_DJ_SHARD) — директория шарда в ней"""
+    model_path, version = resolve_model_dir(data_path)
+    if SHARD:
+        model_path = model_path / SHARDS_DIRNAME / SHARD
+    return model_path, version
 
 
 def load_model(data_dir: str = "ml/ai_dj/data") -> bool:
     """Загружает модель и эмбеддинги при старте"""
-    global embeddings, tracks_df, track_id_to_idx
+    global model_data_dir
     
     data_path = Path(data_dir)
     
     try:
-        embeddings_path = data_path / "db_embeddings.npy"
-        tracks_path = data_path / "db_tracks.pkl"
-        mapping_path = data_path / "db_track_mapping.pkl"
-        
-        if not embeddings_path.exists():
-            logger.error(f"Модель не найдена: {embeddings_path}")
-            return False
-        
-        logger.info("Загружаю модель из БД...")
-        embeddings = np.load(embeddings_path)
-        tracks_df = pd.read_pickle(tracks_path)
-        
-        with open(mapping_path, "rb") as f:
-            track_id_to_idx = pickle.load(f)
+        model_path, version = resolve_serving_dir(data_path)
+        state = read_model(model_path, version, data_path)
+    except Exception as e:
+        logger.error(f"Ошибка загрузки модели: {e}", exc_info=True)
+        return False
+    
+    model_data_dir = data_path
+    activate_model(state)
+    return True
+
+
+def reload_model(force: bool = False) -> bool:
+    """
+    Загружает новую версию модели в фоне и подменяет активную.
+    
+    Пока версия загружается, запросы обслуживает текущая модель. Если загрузка
+    не удалась, текущая модель остается активной.
+    
+    Args:
+        force: Перезагрузить, даже если версия не изменилась
+    
+    Returns:
+        bool: True, если активна актуальная версия
+    """
+    if not reload_lock.acquire(blocking=False):
+        logger.info("Перезагрузка модели уже выполняется")
+        return False
+    
+    try:
+        model_path, version = resolve_serving_dir(model_data_dir)
+        if version == model_version and not force:
+            return True
         
-        if len(tracks_df) != embeddings.shape[0]:
-            logger.error(f"Несоответствие размеров: {len(tracks_df)} треков, {embeddings.shape[0]} embeddings")
+        logger.info(f"Перезагрузка модели: {model_version} → {version}")
+        reload_status.update(state="loading", version=version, error=None)
+        try:
+            state = read_model(model_path, version, model_data_dir)
+        except Exception as e:
+            logger.error(f"Ошибка загрузки версии {version}, остается {model_version}: {e}", exc_info=True)
+            reload_status.update(state="failed", error=str(e))
             return False
         
-        logger.info(f"Модель загружена: {len(tracks_df)} треков, embeddings shape: {embeddings.shape}")
+        activate_model(state)
+        reload_status.update(state="idle", error=None)
         return True
-        
-    except Exception as e:
-        logger.error(f"Ошибка загрузки модели: {e}", exc_info=True)
-        return False
+    finally:
+        reload_lock.release()
+
+
+def start_model_watch():
+    """Запускает фоновую проверку новой версии модели (файл CURRENT)"""
+    if MODEL_WATCH_SECONDS <= 0:
+        return
+    
+    def loop():
+        while True:
+            time.sleep(MODEL_WATCH_SECONDS)
+            try:
+                _, version = resolve_model_dir(model_data_dir)
+            except Exception as e:
+                logger.warning(f"Не удалось проверить версию модели: {e}")
+                continue
+            # Версию, которая не загрузилась, повторно не пробуем до следующего обновления
+            failed = reload_status["state"] == "failed" and reload_status["version"] == version
+            if version != model_version and not failed:
+                reload_model()
+    
+    threading.Thread(target=loop, name="model-watch", daemon=True).start()
+
+
+def start_background_tasks():
+    """
+    Запускает фоновые потоки процесса: снапшоты профилей и проверку новой версии модели.
+    
+    Потоки не переживают fork, поэтому в gunicorn их запускает каждый воркер
+    после старта (gunicorn.conf.py, post_worker_init), а не процесс, загрузивший модель.
+    """
+    start_profile_snapshots()
+    start_model_watch()
+
+
+@app.before_request
+def hold_model():
+    """Фиксирует активную модель на время запроса (замена дождется его завершения)"""
+    if request.endpoint in MODEL_ENDPOINTS:
+        model_lock.acquire_read()
+        g.model_held = True
+
+
+@app.teardown_request
+def release_model(exc=None):
+    if g.pop('model_held', False):
+        model_lock.release_read()
+
+
+def parse_played_at(value: str) -> datetime:
+    """Парсит дату прослушивания в ISO формате (с суффиксом Z)"""
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
 
 
 def compute_user_profile(
@@ -88,22 +453,48 @@ def compute_user_profile(
     if not history_indices:
         raise ValueError("История пуста")
     
-    history_embeddings = embeddings[history_indices]
-    weights = np.ones(len(history_indices))
+    track_ids = track_metadata.values('id', history_indices) if history_with_dates else []
+    frequencies = [track_frequencies.get(idx, 1) for idx in history_indices] if track_frequencies else None
+    return weighted_profile(embeddings[history_indices], track_ids, history_with_dates, frequencies)
+
+
+def weighted_profile(
+    history_embeddings: np.ndarray,
+    track_ids,
+    history_with_dates: Optional[List[Dict]] = None,
+    frequencies: Optional[List[int]] = None
+) -> np.ndarray:
+    """
+    Взвешенное среднее embeddings истории (см. compute_user_profile).
+    
+    Args:
+        history_embeddings: Embeddings треков истории (по треку на прослушивание)
+        track_ids: UUID тех же треков (нужны для весов по датам)
+        history_with_dates: Список с датами прослушивания [{"id": "...", "playedAt": "..."}]
+        frequencies: Частота прослушивания каждого трека истории
+    
+    Returns:
+        np.ndarray: Профиль пользователя (1 × D)
+    """
+    weights = np.ones(len(history_embeddings))
     
     # 1. Взвешивание по датам прослушивания (более свежие = больший вес)
     if history_with_dates:
         try:
             now = datetime.now()
+            # Дата прослушивания по UUID (первое вхождение), каждая дата парсится один раз
+            played_at_by_id: Dict[str, str] = {}
+            for h in history_with_dates:
+                played_at_by_id.setdefault(str(h.get('id')), h.get('playedAt', ''))
+            parsed_dates: Dict[str, datetime] = {}
+            
             date_weights = []
-            for idx in history_indices:
-                track_id = tracks_df.iloc[idx]['id']
-                # Находим дату прослушивания для этого трека
+            for track_id in track_ids:
                 played_at = None
-                for h in history_with_dates:
-                    if str(h.get('id')) == str(track_id):
-                        played_at = datetime.fromisoformat(h.get('playedAt', '').replace('Z', '+00:00'))
-                        break
+                if track_id in played_at_by_id:
+                    if track_id not in parsed_dates:
+                        parsed_dates[track_id] = parse_played_at(played_at_by_id[track_id])
+                    played_at = parsed_dates[track_id]
                 
                 if played_at:
                     # Чем свежее трек, тем больший вес (экспоненциальное затухание)
@@ -119,8 +510,8 @@ def compute_user_profile(
             logger.warning(f"Ошибка обработки дат: {e}, используем равные веса")
     
     # 2. Взвешивание по частоте прослушивания
-    if track_frequencies:
-        freq_weights = np.array([track_frequencies.get(idx, 1) for idx in history_indices])
+    if frequencies:
+        freq_weights = np.array(frequencies)
         # Нормализуем частоты (логарифмическая шкала для уменьшения влияния выбросов)
         freq_weights = np.log1p(freq_weights)  # log(1 + x)
         weights = weights * freq_weights
@@ -129,7 +520,7 @@ def compute_user_profile(
     if weights.sum() > 0:
         weights = weights / weights.sum()
     else:
-        weights = np.ones(len(history_indices)) / len(history_indices)
+        weights = np.ones(len(history_embeddings)) / len(history_embeddings)
     
     # Вычисляем взвешенную среднюю
     user_profile = np.average(history_embeddings, axis=0, weights=weights)
@@ -142,164 +533,444 @@ def compute_user_profile(
     return user_profile.reshape(1, -1)
 
 
+def build_category_codes(tracks: pd.DataFrame, column: str) -> Tuple[Optional[np.ndarray], Dict[str, int]]:
+    """
+    Строит целочисленные коды категориальной колонки треков.
+    
+    Returns:
+        Tuple: (коды треков int32, -1 для пропусков; словарь значение → код)
+    """
+    if column not in tracks.columns:
+        return None, {}
+    
+    series = tracks[column]
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes, names = series.cat.codes.to_numpy(), series.cat.categories
+    else:
+        codes, names = pd.factorize(series)
+    return codes.astype(np.int32), {str(name): code for code, name in enumerate(names)}
+
+
+def preference_multipliers(
+    preferred: List[str],
+    history_codes: np.ndarray,
+    lookup: Dict[str, int],
+    max_extra: float
+) -> Optional[np.ndarray]:
+    """
+    Строит таблицу множителей по кодам категории.
+    
+    Бонус категории зависит от ее доли в истории: 1.1 + доля × max_extra.
+    Последний элемент таблицы соответствует пропущенному значению (код -1).
+    
+    Returns:
+        Optional[np.ndarray]: Множители (len(lookup) + 1,) или None, если бонусов нет
+    """
+    counts = np.bincount(history_codes, minlength=len(lookup))
+    total = len(history_codes)
+    multipliers = None
+    
+    for name in preferred:
+        code = lookup.get(str(name))
+        if code is None or counts[code] == 0:
+            continue
+        if multipliers is None:
+            multipliers = np.ones(len(lookup) + 1)
+        ratio = counts[code] / total
+        bonus = 1.1 + (ratio * max_extra)
+        multipliers[code] *= bonus
+        logger.debug(f"{name}: ratio={ratio:.2f}, bonus={bonus:.2f}")
+    
+    return multipliers
+
+
+def preference_multipliers_by_name(preferred: List[str], history_values: List[str], max_extra: float) -> Dict[str, float]:
+    """
+    preference_multipliers по значениям категории вместо кодов: координатор
+    шардов считает бонусы по истории, а коды категорий у каждого шарда свои.
+    
+    Returns:
+        Dict: Значение категории → множитель (только категории с бонусом)
+    """
+    counts = Counter(history_values)
+    multipliers: Dict[str, float] = {}
+    for name in preferred:
+        name = str(name)
+        if counts[name] == 0:
+            continue
+        multipliers[name] = multipliers.get(name, 1.0) * (1.1 + (counts[name] / len(history_values) * max_extra))
+    return multipliers
+
+
+def named_bonus_tables(genre_multipliers: Dict[str, float], artist_multipliers: Dict[str, float]) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Таблицы бонусов (как bonus_tables) из множителей по значениям категорий (запрос координатора шардов)"""
+    tables = []
+    for codes, lookup, multipliers in ((genre_codes, genre_lookup, genre_multipliers),
+                                       (artist_codes, artist_lookup, artist_multipliers)):
+        if codes is None or not multipliers:
+            continue
+        table = np.ones(len(lookup) + 1)
+        for name, multiplier in multipliers.items():
+            if name in lookup:
+                table[lookup[name]] = multiplier
+        tables.append((codes, table))
+    return tables
+
+
+def bonus_tables(
+    preferred_genres: List[str],
+    preferred_artists: List[str],
+    history_genres: np.ndarray,
+    history_artists: np.ndarray
+) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Таблицы множителей бонусов: жанры от 1.1 (редкий в истории) до 1.5 (вся
+    история), артисты от 1.1 до 1.4.
+    
+    Returns:
+        List: (коды треков каталога, множители по коду) для каждой категории с бонусами
+    """
+    tables = []
+    if preferred_genres and len(history_genres) and genre_codes is not None:
+        multipliers = preference_multipliers(preferred_genres, history_genres, genre_lookup, GENRE_BONUS_MAX_EXTRA)
+        if multipliers is not None:
+            tables.append((genre_codes, multipliers))
+    if preferred_artists and len(history_artists) and artist_codes is not None:
+        multipliers = preference_multipliers(preferred_artists, history_artists, artist_lookup, ARTIST_BONUS_MAX_EXTRA)
+        if multipliers is not None:
+            tables.append((artist_codes, multipliers))
+    return tables
+
+
 def compute_dynamic_bonuses(
     similarities: np.ndarray,
     preferred_genres: List[str],
     preferred_artists: List[str],
-    history_genres: List[str],
-    history_artists: List[str]
+    history_genres: np.ndarray,
+    history_artists: np.ndarray,
+    indices: Optional[np.ndarray] = None
 ) -> np.ndarray:
     """
     Применяет динамические бонусы на основе силы предпочтения.
     
+    Бонусы собираются в таблицы множителей по кодам жанров и артистов и
+    применяются одним gather по кодам треков, поэтому стоимость не зависит
+    от количества предпочитаемых жанров и артистов.
+    
     Args:
         similarities: Массив similarities
         preferred_genres: Предпочитаемые жанры
         preferred_artists: Предпочитаемые артисты
-        history_genres: Все жанры из истории (для вычисления силы предпочтения)
-        history_artists: Все артисты из истории
+        history_genres: Коды жанров из истории (для вычисления силы предпочтения)
+        history_artists: Коды артистов из истории
+        indices: Индексы треков, которым соответствуют similarities (None = весь каталог)
     
     Returns:
         np.ndarray: Обновленный массив similarities
     """
+    tables = bonus_tables(preferred_genres, preferred_artists, history_genres, history_artists)
+    return apply_bonus_tables(similarities, tables, indices)
+
+
+def apply_bonus_tables(
+    similarities: np.ndarray,
+    tables: List[Tuple[np.ndarray, np.ndarray]],
+    indices: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """Умножает копию similarities на множители бонусов (см. bonus_tables) по кодам треков"""
     result = similarities.copy()
+    for codes, multipliers in tables:
+        result *= multipliers[codes if indices is None else codes[indices]]
+    return result
+
+
+def select_candidates(
+    user_profile: np.ndarray,
+    n_probe: int = ANN_NPROBE,
+    min_candidates: int = 0,
+    allowed: Optional[np.ndarray] = None,
+    tables: Optional[List[Tuple[np.ndarray, np.ndarray]]] = None
+) -> Optional[np.ndarray]:
+    """
+    Выбирает треки, для которых считается точная похожесть.
     
-    # Вычисляем силу предпочтения для жанров
-    if preferred_genres and history_genres and 'genre' in tracks_df.columns:
-        genre_counts = defaultdict(int)
-        for g in history_genres:
-            genre_counts[g] += 1
-        
-        total_genres = len(history_genres)
-        genre_mask = tracks_df['genre'].isin(preferred_genres).values
-        
-        for genre in preferred_genres:
-            if genre in genre_counts:
-                # Процент истории с этим жанром
-                genre_ratio = genre_counts[genre] / total_genres if total_genres > 0 else 0
-                # Динамический бонус: от 1.1 (20%) до 1.5 (80%+)
-                bonus = 1.1 + (genre_ratio * 0.4)  # 1.1 - 1.5
-                
-                genre_specific_mask = tracks_df['genre'] == genre
-                result[genre_specific_mask] *= bonus
-                logger.debug(f"Жанр {genre}: ratio={genre_ratio:.2f}, bonus={bonus:.2f}")
-    
-    # Вычисляем силу предпочтения для артистов
-    if preferred_artists and history_artists and 'artist' in tracks_df.columns:
-        artist_counts = defaultdict(int)
-        for a in history_artists:
-            artist_counts[a] += 1
-        
-        total_artists = len(history_artists)
-        artist_mask = tracks_df['artist'].isin(preferred_artists).values
-        
-        for artist in preferred_artists:
-            if artist in artist_counts:
-                artist_ratio = artist_counts[artist] / total_artists if total_artists > 0 else 0
-                # Динамический бонус: от 1.1 (20%) до 1.4 (80%+)
-                bonus = 1.1 + (artist_ratio * 0.3)  # 1.1 - 1.4
-                
-                artist_specific_mask = tracks_df['artist'] == artist
-                result[artist_specific_mask] *= bonus
-                logger.debug(f"Артист {artist}: ratio={artist_ratio:.2f}, bonus={bonus:.2f}")
+    Если загружен IVF индекс и n_probe > 0, похожесть считается только для треков
+    из n_probe ближайших кластеров. Если кандидатов меньше min_candidates,
+    используется полный перебор.
     
-    return result
+    В квантованном режиме кандидаты сначала ранжируются по компактным кодам,
+    и точная похожесть считается только для RERANK_SIZE лучших. Бонусы
+    (tables) применяются к приближенным оценкам до отбора: иначе трек, который
+    поднимается в топ бонусом жанра или артиста, мог не попасть в пул.
+    
+    Маска фильтров отсекает кандидатов IVF и квантованного отбора заранее,
+    чтобы недопустимые треки не занимали места в пуле; если после фильтров
+    кандидатов IVF не хватает, n_probe удваивается. Похожесть недопустимых
+    треков при полном переборе считается как обычно: из топа их исключает apply_filters.
+    
+    Args:
+        user_profile: Профиль пользователя (1 × D)
+        n_probe: Количество просматриваемых кластеров IVF индекса
+        min_candidates: Минимальное количество кандидатов для приближенного поиска
+        allowed: Маска допустимых треков (None — без фильтров)
+        tables: Таблицы бонусов (bonus_tables) для квантованного отбора
+    
+    Returns:
+        Optional[np.ndarray]: Индексы кандидатов или None для полного перебора
+    """
+    candidates = None
+    if ann_index is not None and n_probe > 0:
+        candidates = ann_index.search_candidates(user_profile, n_probe)
+        if allowed is not None:
+            candidates = candidates[allowed[candidates]]
+            # Фильтры отсекли часть кластеров: расширяем поиск, прежде чем переходить к полному перебору
+            while len(candidates) < min_candidates and n_probe < ann_index.n_lists:
+                n_probe *= 2
+                candidates = ann_index.search_candidates(user_profile, n_probe)
+                candidates = candidates[allowed[candidates]]
+        if len(candidates) < min_candidates:
+            logger.debug(f"IVF: {len(candidates)} кандидатов < {min_candidates}, полный перебор")
+            candidates = None
+    
+    if quantized_embeddings is not None:
+        approximate = quantized_embeddings.score(user_profile, candidates)
+        if tables:
+            approximate = apply_bonus_tables(approximate, tables, candidates)
+        if allowed is not None and candidates is None:
+            approximate[~allowed] = -np.inf
+        pool = top_k_indices(approximate, max(RERANK_SIZE, min_candidates))
+        candidates = pool if candidates is None else candidates[pool]
+    return candidates
+
+
+def score_catalogue(user_profile: np.ndarray, candidates: Optional[np.ndarray]) -> np.ndarray:
+    """Косинусная близость профиля к кандидатам (None — ко всему каталогу одним проходом)"""
+    if candidates is None:
+        return cosine_similarity(user_profile, embeddings)[0]
+    return cosine_similarity(user_profile, embeddings[candidates])[0]
+
+
+def rank_catalogue_blocks(
+    user_profile: np.ndarray,
+    tables: List[Tuple[np.ndarray, np.ndarray]],
+    history_indices: List[int],
+    allowed: Optional[np.ndarray],
+    k: int,
+    trace: Optional[Dict] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Топ полного перебора блоками каталога в пуле потоков (ParallelScorer).
+    
+    Для каждого блока строк embeddings считаются косинусная близость,
+    бонусы (bonus_tables), исключение истории и фильтры, из блока берется
+    k лучших; кандидаты блоков сливаются. Оценки те же, что у однопроходного
+    скоринга, при равных оценках выше трек с меньшим индексом.
+    
+    Args:
+        trace: Трасса запроса: для сводок оценки блоков собираются в полные массивы
+    
+    Returns:
+        Tuple: (индексы треков, оценки) по убыванию оценки
+    """
+    history = np.unique(np.asarray(history_indices, dtype=np.int64))
+    raw = after_bonuses = None
+    if trace is not None:
+        raw, after_bonuses = np.empty(len(embeddings)), np.empty(len(embeddings))
+    
+    def score_block(start: int, stop: int) -> np.ndarray:
+        block = cosine_similarity(user_profile, embeddings[start:stop])[0]
+        if raw is not None:
+            raw[start:stop] = block
+        adjust_block(block, start, stop, tables, history)
+        if after_bonuses is not None:
+            after_bonuses[start:stop] = block
+        if allowed is not None:
+            block[~allowed[start:stop]] = -np.inf
+        return block
+    
+    top_indices, top_scores = parallel_scorer.top_k(len(embeddings), score_block, k)
+    if trace is not None:
+        trace["similarity"] = array_summary(raw)
+        trace["ann_candidates"] = None
+        trace["after_bonuses"] = array_summary(after_bonuses)
+    return top_indices, top_scores
+
+
+def rank_catalogue_batch(
+    tasks: List[Tuple[np.ndarray, List[Tuple[np.ndarray, np.ndarray]], List[int], Optional[np.ndarray], int]]
+) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Полный перебор для батча одновременных запросов (RequestCoalescer).
+    
+    Профили складываются в матрицу B × D, и каждый блок из
+    SCORING_BLOCK_SIZE треков скорится одним матричным умножением на весь
+    батч: embeddings читаются из памяти один раз на батч, а не на запрос.
+    Бонусы, исключение истории, фильтры и top-k блоков — построчно, как в
+    rank_catalogue_blocks.
+    
+    Args:
+        tasks: (профиль 1 × D, таблицы бонусов, индексы истории, маска фильтров, k) для каждого запроса
+    
+    Returns:
+        List: (индексы треков, оценки) по убыванию оценки для каждого запроса
+    """
+    profiles = np.vstack([task[0] for task in tasks])
+    histories = [np.unique(np.asarray(task[2], dtype=np.int64)) for task in tasks]
+    parts: List[List[Tuple[np.ndarray, np.ndarray]]] = [[] for _ in tasks]
+    
+    for start in range(0, len(embeddings), SCORING_BLOCK_SIZE):
+        stop = min(start + SCORING_BLOCK_SIZE, len(embeddings))
+        similarities = cosine_similarity(profiles, embeddings[start:stop])
+        for row, (_, tables, _, allowed, k) in enumerate(tasks):
+            block = similarities[row]
+            adjust_block(block, start, stop, tables, histories[row])
+            if allowed is not None:
+                block[~allowed[start:stop]] = -np.inf
+            top = block_top_k(block, k)
+            parts[row].append((top + start, block[top]))
+    
+    return [merge_block_tops(row_parts, task[4]) for row_parts, task in zip(parts, tasks)]
+
+
+def adjust_block(
+    block: np.ndarray,
+    start: int,
+    stop: int,
+    tables: List[Tuple[np.ndarray, np.ndarray]],
+    history: np.ndarray
+):
+    """Бонусы и исключение истории (отсортированные индексы) для оценок блока каталога [start, stop), in-place"""
+    for codes, multipliers in tables:
+        block *= multipliers[codes[start:stop]]
+    lo, hi = np.searchsorted(history, [start, stop])
+    block[history[lo:hi] - start] = -1
+
+
+def apply_filters(similarities: np.ndarray, allowed: Optional[np.ndarray], candidates: Optional[np.ndarray] = None):
+    """Исключает недопустимые треки из топа: их похожесть становится -inf (in-place)"""
+    if allowed is not None:
+        similarities[~(allowed if candidates is None else allowed[candidates])] = -np.inf
+
+
+def drop_filtered(top_indices: np.ndarray, top_scores: np.ndarray, allowed: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """Убирает из топа исключенные фильтрами треки (если допустимых меньше, чем мест в топе)"""
+    if allowed is None:
+        return top_indices, top_scores
+    keep = np.isfinite(top_scores)
+    return top_indices[keep], top_scores[keep]
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Возвращает позиции k наибольших значений по убыванию без полной сортировки"""
+    if k >= len(scores):
+        return np.argsort(-scores, kind='stable')
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+def top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """Построчный top-k для матрицы скоров: позиции k наибольших в каждой строке по убыванию"""
+    k = min(k, scores.shape[1])
+    if k < scores.shape[1]:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        top = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(top, order, axis=1)
 
 
 def add_diversity(
-    similarities: np.ndarray,
     top_indices: np.ndarray,
-    diversity_factor: float = 0.3
-) -> np.ndarray:
+    top_scores: np.ndarray,
+    diversity_factor: float = DEFAULT_DIVERSITY_FACTOR
+) -> Tuple[np.ndarray, np.ndarray]:
     """
     Добавляет разнообразие в рекомендации используя MMR (Maximal Marginal Relevance).
     
     Args:
-        similarities: Массив similarities
         top_indices: Топ индексы (уже отсортированные)
+        top_scores: Similarities топ индексов
         diversity_factor: Фактор разнообразия (0 = только похожие, 1 = только разнообразные)
     
     Returns:
-        np.ndarray: Обновленные индексы с учетом разнообразия
+        Tuple: Обновленные индексы с учетом разнообразия и их similarities
     """
     if len(top_indices) <= 1 or diversity_factor == 0:
-        return top_indices
+        return top_indices, top_scores
     
     # MMR: выбираем треки, которые похожи на пользователя, но разнообразны между собой
-    selected = [top_indices[0]]  # Первый - самый похожий
-    remaining = set(top_indices[1:])
-    
-    while len(selected) < len(top_indices) and remaining:
-        best_score = -np.inf
-        best_idx = None
-        
-        for idx in remaining:
-            # Похожесть на пользователя
-            relevance = similarities[idx]
-            
-            # Разнообразие (минимальная похожесть на уже выбранные)
-            if len(selected) > 0:
-                max_similarity = max([
-                    cosine_similarity(
-                        embeddings[idx:idx+1],
-                        embeddings[sel:sel+1]
-                    )[0, 0]
-                    for sel in selected
-                ])
-                diversity = 1 - max_similarity
-            else:
-                diversity = 1
-            
-            # MMR score
-            score = (1 - diversity_factor) * relevance + diversity_factor * diversity
-            
-            if score > best_score:
-                best_score = score
-                best_idx = idx
-        
-        if best_idx is not None:
-            selected.append(best_idx)
-            remaining.remove(best_idx)
-        else:
-            break
-    
-    return np.array(selected[:len(top_indices)])
+    order = mmr_rerank(embeddings[top_indices], top_scores, diversity_factor)
+    return top_indices[order], top_scores[order]
 
 
-def get_cache_key(history_ids: List[str], genres: List[str], artists: List[str], limit: int) -> str:
-    """Создает ключ кэша для запроса"""
+def get_cache_key(params: Dict) -> str:
+    """
+    Создает ключ кэша по всем параметрам запроса, влияющим на результат.
+    
+    Даты прослушивания входят в ключ как целое число дней назад (с такой
+    точностью они учитываются в compute_user_profile), поэтому даты лайков,
+    которые backend проставляет текущим временем, не ломают попадания в кэш.
+    Для пользователей из хранилища профилей в ключ входит версия профиля,
+    в ключ всегда входит отпечаток модели (ответы разных версий не смешиваются).
+    """
+    now = datetime.now()
+    dated_history = []
+    for h in params["history_with_dates"]:
+        played_at = h.get('playedAt', '')
+        try:
+            played_at = (now - parse_played_at(played_at).replace(tzinfo=None)).days
+        except (TypeError, ValueError, AttributeError):
+            pass
+        dated_history.append([str(h.get('id')), played_at])
+    
+    user_id = params["user_id"]
     key_data = {
-        "history": sorted(history_ids),
-        "genres": sorted(genres),
-        "artists": sorted(artists),
-        "limit": limit
+        "history": sorted(str(tid) for tid in params["history_ids"]),
+        "history_with_dates": sorted(dated_history, key=lambda x: (x[0], str(x[1]))),
+        "genres": sorted(str(g) for g in params["preferred_genres"]),
+        "artists": sorted(str(a) for a in params["preferred_artists"]),
+        "limit": params["limit"],
+        "use_diversity": bool(params["use_diversity"]),
+        "diversity_factor": params["diversity_factor"],
+        "n_probe": params["n_probe"],
+        "filters": params["filters"],
+        "user_id": user_id,
+        "model": model_fingerprint,
+        "format": CACHE_VALUE_FORMAT,
+        "profile_version": profile_store.updated_at(user_id) if profile_store is not None and user_id else None
     }
     key_str = json.dumps(key_data, sort_keys=True)
     return hashlib.md5(key_str.encode()).hexdigest()
 
 
-def get_cached_recommendations(cache_key: str) -> Optional[List[Dict]]:
-    """Получает рекомендации из кэша"""
-    if cache_key in recommendation_cache:
-        cached_time, recommendations = recommendation_cache[cache_key]
-        if (datetime.now() - cached_time).total_seconds() < CACHE_TTL_SECONDS:
-            logger.debug(f"Кэш попадание для ключа {cache_key[:8]}...")
-            return recommendations
-        else:
-            # Кэш устарел
-            del recommendation_cache[cache_key]
-    return None
+def get_cached_recommendations(cache_key: str) -> Optional[Tuple[str, int]]:
+    """Получает рекомендации из кэша: (JSON-массив, количество); пустой ответ считается промахом"""
+    cached = recommendation_cache.get(cache_key)
+    if cached is None or not cached[1]:
+        return None
+    logger.debug(f"Кэш попадание для ключа {cache_key[:8]}...")
+    return cached[0], cached[1]
 
 
-def cache_recommendations(cache_key: str, recommendations: List[Dict]):
-    """Сохраняет рекомендации в кэш"""
-    recommendation_cache[cache_key] = (datetime.now(), recommendations)
-    # Очищаем старые записи (простая очистка, в продакшене использовать TTL)
-    if len(recommendation_cache) > 1000:
-        # Удаляем самые старые
-        sorted_cache = sorted(recommendation_cache.items(), key=lambda x: x[1][0])
-        for key, _ in sorted_cache[:100]:
-            del recommendation_cache[key]
+def cache_recommendations(cache_key: str, recommendations: Tuple[str, int]):
+    """Сохраняет рекомендации (JSON-массив, количество) в кэш"""
+    recommendation_cache.set(cache_key, list(recommendations))
+
+
+def recommendation_fields(recommendations: Tuple[str, int], method: str, cached: bool) -> Dict[str, str]:
+    """Поля ответа /recommend в JSON для render_response"""
+    rendered, count = recommendations
+    return {
+        "recommendations": rendered,
+        "count": str(count),
+        "method": f'"{method}"',
+        "cached": "true" if cached else "false"
+    }
+
+
+def recommendation_response(recommendations: Tuple[str, int], method: str, cached: bool) -> Response:
+    """Ответ /recommend из готового JSON-массива рекомендаций (тот же вывод, что у jsonify)"""
+    return Response(render_response(recommendation_fields(recommendations, method, cached)), mimetype="application/json")
 
 
 @app.route('/health', methods=['GET'])
@@ -310,10 +981,411 @@ def health():
         "model_loaded": embeddings is not None,
         "tracks_count": len(tracks_df) if tracks_df is not None else 0,
         "model_type": "db" if track_id_to_idx is not None else "none",
-        "cache_size": len(recommendation_cache)
+        "cache_size": len(recommendation_cache),
+        "cache_hit_rate": recommendation_cache.stats()["hit_rate"],
+        "model_version": model_version or None,
+        "model_fingerprint": model_fingerprint or None,
+        "shard": SHARD or None,
+        "model_loaded_at": model_loaded_at.isoformat() if model_loaded_at else None,
+        "model_load_seconds": round(model_load_seconds, 3),
+        "reload": reload_status
     })
 
 
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    """
+    Запускает перезагрузку модели в фоне.
+    
+    Request body (опционально):
+    {
+        "force": false  // перезагрузить, даже если версия в CURRENT не изменилась
+    }
+    
+    Ход перезагрузки виден в /health (поле reload).
+    """
+    if ADMIN_TOKEN and request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        return jsonify({"error": "Forbidden"}), 403
+    if model_data_dir is None:
+        return jsonify({"error": "Model not loaded"}), 500
+    if reload_lock.locked():
+        return jsonify({"error": "Reload already in progress"}), 409
+    
+    force = bool((request.get_json(silent=True) or {}).get('force', False))
+    threading.Thread(target=reload_model, kwargs={"force": force}, name="model-reload", daemon=True).start()
+    return jsonify({"status": "reloading", "activeVersion": model_version}), 202
+
+
+def parse_recommend_params(data: Dict) -> Dict:
+    """Разбирает тело запроса /recommend и применяет значения по умолчанию"""
+    return {
+        "history_ids": data.get('history', []),
+        "history_with_dates": data.get('historyWithDates', []),
+        "preferred_genres": data.get('genres', []),
+        "preferred_artists": data.get('artists', []),
+        "limit": min(data.get('limit', DEFAULT_LIMIT), MAX_LIMIT),
+        "use_diversity": data.get('useDiversity', True),
+        "diversity_factor": min(max(float(data.get('diversityFactor', DEFAULT_DIVERSITY_FACTOR)), 0.0), 1.0),
+        "n_probe": int(data.get('nprobe', ANN_NPROBE)),
+        "user_id": str(data['userId']) if data.get('userId') else None,
+        "filters": parse_filters(data.get('filters')),
+        "session": bool(data.get('session', False)),
+    }
+
+
+def collect_history_attributes(history_indices: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """Собирает коды всех жанров и артистов из истории для динамических бонусов (без пропусков)"""
+    empty = np.empty(0, dtype=np.int32)
+    history_genres = genre_codes[history_indices] if genre_codes is not None else empty
+    history_artists = artist_codes[history_indices] if artist_codes is not None else empty
+    return history_genres[history_genres >= 0], history_artists[history_artists >= 0]
+
+
+def build_user_profile(history_indices: List[int], history_with_dates: List[Dict]) -> np.ndarray:
+    """Вычисляет профиль пользователя с учетом дат и частоты прослушивания"""
+    track_frequencies = defaultdict(int)
+    for idx in history_indices:
+        track_frequencies[idx] += 1
+    
+    return compute_user_profile(
+        history_indices,
+        history_with_dates=history_with_dates,
+        track_frequencies=track_frequencies
+    )
+
+
+def plays_to_profile_update(plays: List[Dict]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Переводит прослушивания [{"id": "...", "playedAt": "..."}] в индексы, веса и время.
+    
+    Прослушивания без даты получают вес 0.5 (как в compute_user_profile),
+    неизвестные треки и нераспознанные даты пропускаются.
+    """
+    now = time.time()
+    indices, weights, timestamps = [], [], []
+    for play in plays:
+        idx = track_id_to_idx.get(str(play.get('id'))) if track_id_to_idx is not None else None
+        if idx is None:
+            continue
+        played_at = play.get('playedAt')
+        if played_at:
+            try:
+                timestamps.append(parse_played_at(played_at).timestamp())
+                weights.append(1.0)
+            except ValueError:
+                continue
+        else:
+            timestamps.append(now)
+            weights.append(0.5)
+        indices.append(idx)
+    return np.array(indices, dtype=np.int64), np.array(weights), np.array(timestamps)
+
+
+def plays_after(plays: List[Dict], since: float) -> List[Dict]:
+    """Прослушивания с датой позже since (unix timestamp); без даты и с нераспознанной датой пропускаются"""
+    fresh = []
+    for play in plays:
+        try:
+            if parse_played_at(play.get('playedAt') or '').timestamp() > since:
+                fresh.append(play)
+        except (TypeError, ValueError, AttributeError):
+            continue
+    return fresh
+
+
+def resolve_user_profile(params: Dict, history_indices: List[int], timer: Optional[StageTimer] = None) -> np.ndarray:
+    """
+    Возвращает профиль пользователя: из хранилища профилей, если пользователь
+    известен, иначе строит его по истории (и заводит профиль в хранилище).
+    
+    Прослушивания из historyWithDates новее последнего обновления профиля
+    добавляются в хранилище перед чтением: профиль не застывает на первом
+    запросе, даже если бэкенд не вызывает /profile/update.
+    """
+    user_id = params["user_id"]
+    if profile_store is not None and user_id and user_id in profile_store:
+        updated_at = profile_store.updated_at(user_id)
+        fresh = plays_after(params["history_with_dates"], updated_at) if updated_at is not None else []
+        if fresh:
+            indices, weights, timestamps = plays_to_profile_update(fresh)
+            if len(indices):
+                profile_store.update(user_id, embeddings[indices], weights, timestamps)
+        user_profile = profile_store.get(user_id)
+        if user_profile is not None:
+            if timer is not None:
+                timer.note("profile_source", "store")
+            return user_profile
+    if timer is not None:
+        timer.note("profile_source", "history")
+    
+    user_profile = build_user_profile(history_indices, params["history_with_dates"])
+    
+    if profile_store is not None and user_id:
+        plays = params["history_with_dates"] or [{"id": tid} for tid in params["history_ids"]]
+        indices, weights, timestamps = plays_to_profile_update(plays)
+        if len(indices):
+            profile_store.update(user_id, embeddings[indices], weights, timestamps)
+    
+    return user_profile
+
+
+def snapshot_profiles():
+    """Сохраняет снапшот хранилища профилей на диск"""
+    if profile_store is not None and profile_snapshot_path is not None:
+        try:
+            profile_store.snapshot(profile_snapshot_path, model_fingerprint)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения снапшота профилей: {e}")
+
+
+def start_profile_snapshots():
+    """Запускает периодические снапшоты профилей и снапшот при выходе"""
+    if profile_store is None or PROFILE_SNAPSHOT_SECONDS <= 0:
+        return
+    
+    def loop():
+        while True:
+            time.sleep(PROFILE_SNAPSHOT_SECONDS)
+            snapshot_profiles()
+    
+    threading.Thread(target=loop, name="profile-snapshots", daemon=True).start()
+    atexit.register(snapshot_profiles)
+
+
+def finalize_ranking(
+    top_indices: np.ndarray,
+    top_scores: np.ndarray,
+    params: Dict
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Применяет MMR к топ кандидатам и обрезает до limit"""
+    if params["use_diversity"]:
+        top_indices, top_scores = add_diversity(top_indices, top_scores, diversity_factor=params["diversity_factor"])
+    
+    limit = params["limit"]
+    return top_indices[:limit], top_scores[:limit]
+
+
+def format_recommendations(top_indices: np.ndarray, top_scores: np.ndarray) -> Tuple[str, int]:
+    """
+    Формирует ответ по индексам треков и перемешивает его (топ-3 сохраняются).
+    
+    Returns:
+        Tuple: (JSON-массив рекомендаций, количество)
+    """
+    order = np.arange(len(top_indices))
+    
+    # Перемешиваем рекомендации для разнообразия (сохраняя топ-3 в начале)
+    if len(order) > 3:
+        rest = order[3:].tolist()
+        random.shuffle(rest)
+        order[3:] = rest
+    
+    return track_metadata.render(np.asarray(top_indices)[order], np.asarray(top_scores)[order]), len(order)
+
+
+def cold_start_ranking(
+    preferred_genres: List[str],
+    preferred_artists: List[str],
+    n: int,
+    allowed: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Треки холодного старта: популярные треки предпочитаемых жанров/артистов.
+    
+    Берет n * 2 самых популярных треков под предпочтения и фильтры запроса
+    из заранее отсортированных списков PopularityIndex и выбирает из них n
+    случайных (фиксированный seed, как прежний DataFrame.sample).
+    
+    Returns:
+        np.ndarray: Индексы треков в порядке ответа
+    """
+    top_tracks = popularity_index.top(preferred_genres, preferred_artists, n * 2, allowed)
+    return top_tracks[sample_positions(len(top_tracks), min(n, len(top_tracks)))]
+
+
+def cold_start_recommendations(
+    preferred_genres: List[str],
+    preferred_artists: List[str],
+    limit: int,
+    allowed: Optional[np.ndarray] = None
+) -> Tuple[str, int]:
+    """
+    Рекомендации для новых пользователей (см. cold_start_ranking).
+    
+    Returns:
+        Tuple: (JSON-массив рекомендаций, количество)
+    """
+    sampled = cold_start_ranking(preferred_genres, preferred_artists, limit, allowed)
+    return track_metadata.render_cold_start(sampled), len(sampled)
+
+
+def find_history_indices(history_ids: List[str]) -> List[int]:
+    """Индексы треков истории по UUID (неизвестные треки пропускаются)"""
+    if track_id_to_idx is None or not history_ids:
+        return []
+    return [track_id_to_idx[tid] for tid in history_ids if tid in track_id_to_idx]
+
+
+def rank_personalized(
+    params: Dict,
+    history_indices: List[int],
+    allowed: Optional[np.ndarray],
+    k: int,
+    timer: StageTimer
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Персональный топ до MMR: профиль, скоринг каталога, бонусы, исключение
+    истории и фильтров, k лучших треков.
+    
+    Returns:
+        Tuple: (индексы треков, similarities) по убыванию похожести
+    """
+    history_genres, history_artists = collect_history_attributes(history_indices)
+    timer.lap("index_mapping")
+    user_profile = resolve_user_profile(params, history_indices, timer)
+    timer.lap("user_profile")
+    tables = bonus_tables(params["preferred_genres"], params["preferred_artists"], history_genres, history_artists)
+    return rank_catalogue(user_profile, tables, history_indices, allowed, k, params["n_probe"], timer)
+
+
+def rank_catalogue(
+    user_profile: np.ndarray,
+    tables: List[Tuple[np.ndarray, np.ndarray]],
+    history_indices: List[int],
+    allowed: Optional[np.ndarray],
+    k: int,
+    n_probe: int,
+    timer: StageTimer
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Топ каталога для готового профиля: скоринг, бонусы (bonus_tables),
+    исключение истории и фильтров, k лучших треков.
+    
+    Returns:
+        Tuple: (индексы треков, similarities) по убыванию похожести
+    """
+    # Кандидаты IVF индекса / квантованного отбора или полный перебор (None)
+    candidates = select_candidates(
+        user_profile,
+        n_probe=n_probe,
+        min_candidates=k + len(history_indices),
+        allowed=allowed,
+        tables=tables
+    )
+    
+    if candidates is None and (request_coalescer is not None or parallel_scorer is not None):
+        # Похожесть, бонусы и топ блоков считаются за один проход: время этапа similarity включает их все
+        if request_coalescer is not None:
+            # В батче с одновременными запросами (время этапа включает и ожидание батча)
+            top_indices, top_scores = request_coalescer.submit((user_profile, tables, history_indices, allowed, k))
+            timer.note("coalesced", True)
+        else:
+            top_indices, top_scores = rank_catalogue_blocks(user_profile, tables, history_indices, allowed, k, timer.trace)
+        timer.lap("similarity")
+        top_indices, top_scores = drop_filtered(top_indices, top_scores, allowed)
+        if timer.trace is not None:
+            timer.trace["top_indices"] = top_indices[:5].tolist()
+        timer.lap("top_k")
+        return top_indices, top_scores
+    
+    # Косинусная близость (по кандидатам или по всему каталогу)
+    similarities = score_catalogue(user_profile, candidates)
+    if timer.trace is not None:
+        timer.trace["similarity"] = array_summary(similarities)
+        timer.trace["ann_candidates"] = None if candidates is None else len(candidates)
+    timer.lap("similarity")
+    
+    # Применяем динамические бонусы
+    similarities = apply_bonus_tables(similarities, tables, candidates)
+    timer.lap("bonuses")
+    
+    # Исключаем треки из истории
+    if candidates is None:
+        similarities[history_indices] = -1
+    else:
+        similarities[np.isin(candidates, history_indices)] = -1
+    if timer.trace is not None:
+        timer.trace["after_bonuses"] = array_summary(similarities)
+    apply_filters(similarities, allowed, candidates)
+    
+    # Топ рекомендации
+    top_positions = top_k_indices(similarities, k)
+    top_indices = top_positions if candidates is None else candidates[top_positions]
+    top_scores = similarities[top_positions]
+    top_indices, top_scores = drop_filtered(top_indices, top_scores, allowed)
+    if timer.trace is not None:
+        timer.trace["top_indices"] = top_indices[:5].tolist()
+    timer.lap("top_k")
+    return top_indices, top_scores
+
+
+def build_session(
+    params: Dict,
+    history_indices: List[int],
+    allowed: Optional[np.ndarray],
+    timer: StageTimer,
+    excluded: Optional[List[int]] = None
+) -> Dict:
+    """
+    Ранжирует SESSION_SIZE треков для сессии AI DJ: страницы потом отдаются
+    из этого списка без повторного скоринга.
+    
+    Args:
+        excluded: Треки, уже отданные в сессии (при пересчете не повторяются)
+    
+    Returns:
+        Dict: Состояние сессии для session_store (только JSON-типы)
+    """
+    if excluded:
+        allowed = np.ones(len(tracks_df), dtype=bool) if allowed is None else allowed.copy()
+        allowed[excluded] = False
+    
+    if history_indices:
+        ranked, scores = rank_personalized(params, history_indices, allowed, SESSION_SIZE, timer)
+        if params["use_diversity"]:
+            ranked, scores = add_diversity(ranked, scores, diversity_factor=params["diversity_factor"])
+        timer.lap("diversity")
+        method, scores = "ml_db_embeddings", scores.tolist()
+    else:
+        timer.lap("index_mapping")
+        ranked = cold_start_ranking(params["preferred_genres"], params["preferred_artists"], SESSION_SIZE, allowed)
+        timer.lap("cold_start")
+        method, scores = "cold_start", None
+    
+    return {
+        "model": model_fingerprint,
+        "params": params,
+        "method": method,
+        "ranked": np.asarray(ranked).tolist(),
+        "scores": scores,
+        "served": 0,
+        "excluded": list(excluded or [])
+    }
+
+
+def next_session_page(session: Dict, limit: int) -> Tuple[Dict, Tuple[str, int]]:
+    """
+    Следующая страница сессии: limit треков из ранжированного списка после уже отданных.
+    
+    Returns:
+        Tuple: (обновленное состояние сессии, (JSON-массив рекомендаций, количество))
+    """
+    served = session["served"]
+    page = np.asarray(session["ranked"][served:served + limit], dtype=np.int64)
+    if session["scores"] is None:
+        recommendations = track_metadata.render_cold_start(page), len(page)
+    else:
+        recommendations = format_recommendations(page, np.asarray(session["scores"][served:served + limit]))
+    return dict(session, served=served + len(page)), recommendations
+
+
+def session_fields(recommendations: Tuple[str, int], method: str, cursor: str) -> Dict[str, str]:
+    """Поля ответа с курсором сессии"""
+    fields = recommendation_fields(recommendations, method, cached=False)
+    fields["cursor"] = f'"{cursor}"'
+    return fields
+
+
 @app.route('/recommend', methods=['POST'])
 def recommend():
     """
@@ -325,194 +1397,585 @@ def recommend():
         "historyWithDates": [{"id": "...", "playedAt": "2024-01-01T00:00:00Z"}],
         "genres": ["Hip-Hop", "Rap"],
         "artists": ["artist1"],
-        "limit": 25
+        "limit": 25,
+        "useDiversity": true,
+        "diversityFactor": 0.2,
+        "userId": "...",
+        "filters": {"explicit": false, "excludeGenres": ["..."], "yearFrom": 2000},
+        "session": false
     }
+    
+    filters ограничивают каталог до выбора топа (см. filters.parse_filters):
+    недопустимые треки не попадают в ответ, даже если их меньше limit.
+    
+    С "session": true сервис ранжирует сразу SESSION_SIZE треков, отдает
+    первую страницу и курсор (поле cursor); следующие страницы отдает
+    /recommend/next без повторного скоринга. Такие запросы кэш ответов не
+    используют.
+    
+    Если передан userId и пользователь есть в хранилище профилей, профиль
+    берется оттуда без пересборки по истории. Первый запрос с userId заводит
+    профиль по истории; дальше новые прослушивания нужно передавать в /profile/update.
+    
+    Подробности запроса (размеры входа, сводки оценок по этапам, топ
+    кандидатов) пишутся одной записью трассы для доли AI_DJ_TRACE_SAMPLE_RATE
+    запросов; остальные запросы ничего не логируют.
     """
-    logger.info("=== AI DJ RECOMMEND REQUEST ===")
+    timer = telemetry.timer()
     
     if embeddings is None or tracks_df is None:
         logger.error("Модель не загружена")
+        timer.finish("error")
         return jsonify({"error": "Model not loaded"}), 500
     
-    logger.info(f"Модель загружена: {len(tracks_df)} треков, embeddings shape: {embeddings.shape}")
-    
     try:
-        data = request.get_json() or {}
-        history_ids = data.get('history', [])
-        history_with_dates = data.get('historyWithDates', [])
-        preferred_genres = data.get('genres', [])
-        preferred_artists = data.get('artists', [])
-        limit = min(data.get('limit', DEFAULT_LIMIT), MAX_LIMIT)
-        use_diversity = data.get('useDiversity', True)
+        params = parse_recommend_params(request.get_json() or {})
+        history_ids = params["history_ids"]
+        history_with_dates = params["history_with_dates"]
+        preferred_genres = params["preferred_genres"]
+        preferred_artists = params["preferred_artists"]
+        limit = params["limit"]
+        if timer.trace is not None:
+            timer.trace.update({
+                "model_version": model_version,
+                "tracks": len(tracks_df),
+                "history": len(history_ids),
+                "history_with_dates": len(history_with_dates),
+                "genres": preferred_genres,
+                "artists": preferred_artists,
+                "limit": limit,
+                "user_id": params["user_id"],
+                "filters": params["filters"],
+                "session": params["session"]
+            })
+        timer.lap("parse")
         
-        logger.info(f"Входные данные: history_ids={len(history_ids)}, history_with_dates={len(history_with_dates)}, genres={preferred_genres}, artists={preferred_artists}, limit={limit}")
+        if params["session"]:
+            allowed = catalogue_filters.mask(params["filters"])
+            timer.lap("filters")
+            session = build_session(params, find_history_indices(history_ids), allowed, timer)
+            session, recommendations = next_session_page(session, limit)
+            timer.lap("serialization")
+            cursor = uuid.uuid4().hex
+            session_store.set(cursor, session)
+            timer.lap("session")
+            timer.note("count", recommendations[1])
+            
+            response = Response(render_response(session_fields(recommendations, session["method"], cursor)),
+                                mimetype="application/json")
+            timer.lap("serialization")
+            timer.finish(session["method"])
+            return response
         
         # Проверяем кэш
-        cache_key = get_cache_key(history_ids, preferred_genres, preferred_artists, limit)
+        cache_key = get_cache_key(params)
         cached_result = get_cached_recommendations(cache_key)
+        timer.lap("cache_lookup")
         if cached_result:
-            logger.info(f"Кэш попадание: {len(cached_result)} рекомендаций")
-            return jsonify({
-                "recommendations": cached_result,
-                "count": len(cached_result),
-                "method": "ml_db_embeddings",
-                "cached": True
-            })
+            timer.note("count", cached_result[1])
+            response = recommendation_response(cached_result, "ml_db_embeddings", cached=True)
+            timer.lap("serialization")
+            timer.finish("cached")
+            return response
         
-        logger.info(f"Запрос рекомендаций: history={len(history_ids)}, genres={len(preferred_genres)}, artists={len(preferred_artists)}, limit={limit}")
+        allowed = catalogue_filters.mask(params["filters"])
+        if timer.trace is not None and allowed is not None:
+            timer.trace["allowed"] = int(np.count_nonzero(allowed))
+        timer.lap("filters")
         
-        # Если есть история и модель из БД
+        # Если есть история и модель из БД: находим индексы треков по UUID
+        history_indices = find_history_indices(history_ids)
         if track_id_to_idx is not None and history_ids:
-            logger.info(f"track_id_to_idx размер: {len(track_id_to_idx)}")
-            logger.info(f"Первые 3 history_ids: {history_ids[:3]}")
+            timer.note("history_found", len(history_indices))
+        
+        if history_indices:
+            top_indices, top_scores = rank_personalized(params, history_indices, allowed, limit * 2, timer)  # Берем больше для разнообразия
             
-            # Находим индексы треков по UUID
-            history_indices = [
-                track_id_to_idx[tid] 
-                for tid in history_ids 
-                if tid in track_id_to_idx
-            ]
+            # Добавляем разнообразие (MMR) и формируем ответ
+            top_indices, top_scores = finalize_ranking(top_indices, top_scores, params)
+            timer.lap("diversity")
+            recommendations = format_recommendations(top_indices, top_scores)
+            timer.lap("serialization")
             
-            logger.info(f"Найдено индексов в маппинге: {len(history_indices)} из {len(history_ids)}")
+            # Кэшируем результат
+            cache_recommendations(cache_key, recommendations)
+            timer.lap("cache_store")
+            timer.note("count", recommendations[1])
             
-            if history_indices:
-                # Вычисляем частоту прослушивания треков
-                track_frequencies = defaultdict(int)
-                for idx in history_indices:
-                    track_frequencies[idx] += 1
-                
-                # Собираем все жанры и артисты из истории для динамических бонусов
-                history_genres = []
-                history_artists = []
-                for idx in history_indices:
-                    row = tracks_df.iloc[idx]
-                    if pd.notna(row.get('genre')):
-                        history_genres.append(str(row['genre']))
-                    if pd.notna(row.get('artist')):
-                        history_artists.append(str(row['artist']))
-                
-                # Вычисляем профиль пользователя с учетом дат и частоты
-                user_profile = compute_user_profile(
-                    history_indices,
-                    history_with_dates=history_with_dates,
-                    track_frequencies=track_frequencies
-                )
-                
-                logger.info(f"Профиль пользователя shape: {user_profile.shape}, embeddings shape: {embeddings.shape}")
-                
-                # Косинусная близость
-                similarities = cosine_similarity(user_profile, embeddings)[0]
-                logger.info(f"Similarities computed: min={similarities.min():.4f}, max={similarities.max():.4f}, mean={similarities.mean():.4f}")
-                
-                # Применяем динамические бонусы
-                similarities = compute_dynamic_bonuses(
-                    similarities,
-                    preferred_genres,
-                    preferred_artists,
+            response = recommendation_response(recommendations, "ml_db_embeddings", cached=False)
+            timer.lap("serialization")
+            timer.finish("ml_db_embeddings")
+            return response
+        
+        # Fallback: холодный старт (новые пользователи)
+        timer.lap("index_mapping")
+        recommendations = cold_start_recommendations(preferred_genres, preferred_artists, limit, allowed)
+        timer.lap("cold_start")
+        timer.note("count", recommendations[1])
+        
+        response = recommendation_response(recommendations, "cold_start", cached=False)
+        timer.lap("serialization")
+        timer.finish("cold_start")
+        return response
+    
+    except Exception as e:
+        logger.error(f"Ошибка рекомендации: {e}", exc_info=True)
+        timer.note("error", str(e))
+        timer.finish("error")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/recommend/next', methods=['POST'])
+def recommend_next():
+    """
+    Следующая страница сессии AI DJ (курсор из /recommend с "session": true).
+    
+    Request body:
+    {
+        "cursor": "...",
+        "limit": 25,                 // по умолчанию limit исходного запроса
+        "history": [...],            // опционально: текущая история пользователя
+        "historyWithDates": [...]
+    }
+    
+    Страница берется из сохраненного ранжированного списка, уже отданные
+    треки не повторяются. Каталог скорится заново, только если в истории
+    появились новые прослушивания (кроме треков самой сессии) или список
+    закончился; курсор при этом не меняется. Сессия живет
+    AI_DJ_SESSION_TTL_SECONDS с последнего обращения и сбрасывается при
+    смене версии модели: тогда ответ 404 и нужно начать новую сессию.
+    """
+    timer = telemetry.timer("recommend_next")
+    
+    if embeddings is None or tracks_df is None:
+        timer.finish("error")
+        return jsonify({"error": "Model not loaded"}), 500
+    
+    try:
+        data = request.get_json() or {}
+        cursor = data.get('cursor')
+        if not cursor:
+            timer.finish("error")
+            return jsonify({"error": "cursor is required"}), 400
+        timer.lap("parse")
+        
+        session = session_store.get(str(cursor))
+        timer.lap("session")
+        if session is None or session["model"] != model_fingerprint:
+            timer.finish("error")
+            return jsonify({"error": "Session expired"}), 404
+        
+        params = session["params"]
+        limit = min(int(data.get('limit', params["limit"])), MAX_LIMIT)
+        method = "session"
+        
+        # Новые прослушивания — треки истории, которых не было в сессии (ни в истории, ни в выдаче)
+        new_history = data.get('history')
+        new_history_with_dates = data.get('historyWithDates')
+        new_plays = []
+        if new_history is not None or new_history_with_dates is not None:
+            new_history = new_history or []
+            new_history_with_dates = new_history_with_dates or []
+            served = session["excluded"] + session["ranked"][:session["served"]]
+            known = set(params["history_ids"]) | {str(h.get('id')) for h in params["history_with_dates"]}
+            known.update(track_metadata.values('id', served))
+            new_plays = [tid for tid in set(new_history) | {str(h.get('id')) for h in new_history_with_dates}
+                         if tid not in known]
+            params = dict(params, history_ids=new_history, history_with_dates=new_history_with_dates)
+        timer.note("new_plays", len(new_plays))
+        
+        if new_plays or session["served"] >= len(session["ranked"]):
+            allowed = catalogue_filters.mask(params["filters"])
+            timer.lap("filters")
+            excluded = session["excluded"] + session["ranked"][:session["served"]]
+            session = build_session(params, find_history_indices(params["history_ids"]), allowed, timer, excluded)
+            method = session["method"]
+        
+        session, recommendations = next_session_page(session, limit)
+        timer.lap("serialization")
+        session_store.set(str(cursor), session)
+        timer.lap("session")
+        timer.note("count", recommendations[1])
+        
+        response = Response(render_response(session_fields(recommendations, method, str(cursor))),
+                            mimetype="application/json")
+        timer.lap("serialization")
+        timer.finish(method)
+        return response
+    
+    except Exception as e:
+        logger.error(f"Ошибка продолжения сессии: {e}", exc_info=True)
+        timer.note("error", str(e))
+        timer.finish("error")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/recommend/batch', methods=['POST'])
+def recommend_batch():
+    """
+    Рекомендации для нескольких пользователей за один запрос.
+    
+    Профили пользователей собираются в матрицу N × D и скорятся одним
+    матричным умножением (по блокам из BATCH_SCORE_ROWS строк, чтобы
+    матрица similarities не занимала N × каталог памяти). Исключение истории
+    и выбор топа выполняются сразу для всех строк блока.
+    IVF индекс и квантование здесь не используются: на блоке пользователей
+    полный GEMM по каталогу выгоднее, чем отдельные наборы кандидатов.
+    
+    Request body:
+    {
+        "requests": [<тело /recommend>, ...]
+    }
+    
+    Response:
+    {
+        "results": [<ответ /recommend>, ...],
+        "count": N
+    }
+    
+    В метриках батч — один запрос (method "batch"), этапы суммируются по всем пользователям.
+    """
+    timer = telemetry.timer("recommend_batch")
+    
+    if embeddings is None or tracks_df is None:
+        logger.error("Модель не загружена")
+        timer.finish("error")
+        return jsonify({"error": "Model not loaded"}), 500
+    
+    try:
+        payloads = (request.get_json() or {}).get('requests', [])
+        if not isinstance(payloads, list):
+            timer.finish("error")
+            return jsonify({"error": "requests must be a list"}), 400
+        if len(payloads) > MAX_BATCH_SIZE:
+            timer.finish("error")
+            return jsonify({"error": f"Too many requests in batch (max {MAX_BATCH_SIZE})"}), 400
+        timer.note("batch", len(payloads))
+        timer.lap("parse")
+        
+        logger.info(f"=== AI DJ BATCH REQUEST: {len(payloads)} пользователей ===")
+        
+        # Ответы собираются сразу в JSON (render_object)
+        results: List[Optional[str]] = [None] * len(payloads)
+        pending = []  # (позиция в батче, params, cache_key, history_indices, профиль, жанры, артисты, маска фильтров)
+        
+        for pos, payload in enumerate(payloads):
+            params = parse_recommend_params(payload or {})
+            timer.lap("parse")
+            cache_key = get_cache_key(params)
+            cached_result = get_cached_recommendations(cache_key)
+            timer.lap("cache_lookup")
+            if cached_result:
+                results[pos] = render_object(recommendation_fields(cached_result, "ml_db_embeddings", cached=True))
+                timer.lap("serialization")
+                continue
+            
+            allowed = catalogue_filters.mask(params["filters"])
+            timer.lap("filters")
+            history_indices = find_history_indices(params["history_ids"])
+            
+            if not history_indices:
+                timer.lap("index_mapping")
+                recommendations = cold_start_recommendations(params["preferred_genres"], params["preferred_artists"], params["limit"], allowed)
+                timer.lap("cold_start")
+                results[pos] = render_object(recommendation_fields(recommendations, "cold_start", cached=False))
+                timer.lap("serialization")
+                continue
+            
+            history_genres, history_artists = collect_history_attributes(history_indices)
+            timer.lap("index_mapping")
+            user_profile = resolve_user_profile(params, history_indices, timer)
+            timer.lap("user_profile")
+            pending.append((pos, params, cache_key, history_indices, user_profile, history_genres, history_artists, allowed))
+        
+        for start in range(0, len(pending), BATCH_SCORE_ROWS):
+            block = pending[start:start + BATCH_SCORE_ROWS]
+            profiles = np.vstack([item[4] for item in block])
+            
+            # Одно матричное умножение на весь блок пользователей
+            similarities = cosine_similarity(profiles, embeddings)
+            timer.lap("similarity")
+            
+            for row, (_, params, _, _, _, history_genres, history_artists, _) in enumerate(block):
+                similarities[row] = compute_dynamic_bonuses(
+                    similarities[row],
+                    params["preferred_genres"],
+                    params["preferred_artists"],
                     history_genres,
                     history_artists
                 )
-                logger.info(f"After bonuses: min={similarities.min():.4f}, max={similarities.max():.4f}, mean={similarities.mean():.4f}")
-                
-                # Исключаем треки из истории
-                similarities[history_indices] = -1
-                logger.info(f"After excluding history: {len([s for s in similarities if s > 0])} треков с положительной похожестью")
-                
-                # Топ рекомендации
-                top_indices = np.argsort(-similarities)[:limit * 2]  # Берем больше для разнообразия
-                logger.info(f"Top {len(top_indices)} индексов: {top_indices[:5]}")
-                
-                # Добавляем разнообразие (MMR)
-                if use_diversity:
-                    top_indices = add_diversity(similarities, top_indices, diversity_factor=0.2)
-                    logger.info(f"After diversity: {len(top_indices)} индексов")
-                
-                top_indices = top_indices[:limit]
-                recommended_tracks = tracks_df.iloc[top_indices]
-                logger.info(f"Рекомендуемые треки: {len(recommended_tracks)}")
-                
-                # Формируем ответ
-                recommendations = []
-                for idx, (_, row) in enumerate(recommended_tracks.iterrows()):
-                    recommendations.append({
-                        "id": str(row['id']),
-                        "artist": str(row.get('artist', 'Unknown')),
-                        "title": str(row.get('title', 'Unknown')),
-                        "genre": str(row.get('genre', 'Unknown')),
-                        "plays": int(row.get('plays', 0)),
-                        "similarity": float(similarities[top_indices[idx]])
-                    })
-                
-                # Перемешиваем рекомендации для разнообразия (сохраняя топ-3 в начале)
-                import random
-                if len(recommendations) > 3:
-                    top_three = recommendations[:3]
-                    rest = recommendations[3:]
-                    random.shuffle(rest)
-                    recommendations = top_three + rest
-                    logger.info(f"Рекомендации перемешаны: топ-3 сохранены, остальные перемешаны")
-                
-                # Кэшируем результат
+            timer.lap("bonuses")
+            
+            # Исключаем историю каждого пользователя одной операцией
+            mask_rows = np.concatenate([np.full(len(item[3]), row) for row, item in enumerate(block)])
+            mask_cols = np.concatenate([np.asarray(item[3]) for item in block])
+            similarities[mask_rows, mask_cols] = -1
+            for row, item in enumerate(block):
+                apply_filters(similarities[row], item[7])
+            
+            k = max(item[1]["limit"] for item in block) * 2
+            top_positions = top_k_rows(similarities, k)
+            timer.lap("top_k")
+            
+            for row, (pos, params, cache_key, *_rest, allowed) in enumerate(block):
+                top_indices = top_positions[row, :params["limit"] * 2]
+                top_scores = similarities[row, top_indices]
+                top_indices, top_scores = drop_filtered(top_indices, top_scores, allowed)
+                top_indices, top_scores = finalize_ranking(top_indices, top_scores, params)
+                timer.lap("diversity")
+                recommendations = format_recommendations(top_indices, top_scores)
+                timer.lap("serialization")
                 cache_recommendations(cache_key, recommendations)
-                
-                logger.info(f"Возвращено {len(recommendations)} рекомендаций (метод: ml_db_embeddings)")
-                logger.info(f"=== AI DJ RECOMMEND RESPONSE: {len(recommendations)} рекомендаций ===")
-                return jsonify({
-                    "recommendations": recommendations,
-                    "count": len(recommendations),
-                    "method": "ml_db_embeddings",
-                    "cached": False
-                })
-        
-        # Fallback: холодный старт (новые пользователи)
-        logger.info("Используется fallback метод (холодный старт)")
-        filtered_df = tracks_df.copy()
+                timer.lap("cache_store")
+                results[pos] = render_object(recommendation_fields(recommendations, "ml_db_embeddings", cached=False))
         
-        if preferred_genres and 'genre' in tracks_df.columns:
-            filtered_df = filtered_df[filtered_df['genre'].isin(preferred_genres)]
+        logger.info(f"=== AI DJ BATCH RESPONSE: {len(results)} ответов, {len(pending)} посчитано моделью ===")
+        response = Response(
+            render_response({"results": "[" + ",".join(results) + "]", "count": str(len(results))}),
+            mimetype="application/json"
+        )
+        timer.lap("serialization")
+        timer.finish("batch")
+        return response
         
-        if preferred_artists and 'artist' in tracks_df.columns:
-            filtered_df = filtered_df[filtered_df['artist'].isin(preferred_artists)]
+    except Exception as e:
+        logger.error(f"Ошибка batch рекомендации: {e}", exc_info=True)
+        timer.note("error", str(e))
+        timer.finish("error")
+        return jsonify({"error": str(e)}), 500
+
+
+def similar_tracks(track_idx: int, limit: int, allowed: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray, str]:
+    """
+    Самые похожие на трек треки по убыванию похожести.
+    
+    Берутся из графа соседей (срез строки, без скоринга каталога). Для
+    моделей без графа, а также если фильтры отсекли слишком много соседей,
+    похожесть считается по всему каталогу.
+    
+    Returns:
+        Tuple: (индексы треков, похожесть, способ ответа)
+    """
+    if neighbour_graph is not None and limit <= neighbour_graph.k:
+        top_indices, top_scores = neighbour_graph.neighbours(track_idx, limit, allowed)
+        if len(top_indices) == limit:
+            return top_indices, top_scores, "neighbours"
+    
+    similarities = cosine_similarity(embeddings[track_idx:track_idx + 1], embeddings)[0]
+    similarities[track_idx] = -np.inf
+    apply_filters(similarities, allowed)
+    # Сам трек не входит в ответ: мест не больше, чем остальных треков каталога
+    top_indices = top_k_indices(similarities, min(limit, len(similarities) - 1))
+    top_scores = similarities[top_indices]
+    keep = np.isfinite(top_scores)
+    return top_indices[keep], top_scores[keep], "ml_db_embeddings"
+
+
+@app.route('/similar/<track_id>', methods=['GET', 'POST'])
+def similar(track_id: str):
+    """
+    Треки, похожие на один трек ("похожие треки", радио по треку).
+    
+    Query: ?limit=25. POST-запрос может передать фильтры в теле:
+    {"limit": 25, "filters": {"explicit": false, "excludeTracks": [...]}}
+    
+    Ответ — те же поля треков, что у /recommend, в порядке убывания
+    похожести (без перемешивания, профиля пользователя и бонусов).
+    """
+    timer = telemetry.timer("similar")
+    
+    if embeddings is None or tracks_df is None:
+        timer.finish("error")
+        return jsonify({"error": "Model not loaded"}), 500
+    
+    try:
+        data = (request.get_json(silent=True) or {}) if request.method == 'POST' else {}
+        limit = min(int(data.get('limit', request.args.get('limit', DEFAULT_LIMIT))), MAX_LIMIT)
+        filters = parse_filters(data.get('filters'))
+        timer.lap("parse")
         
-        if len(filtered_df) == 0:
-            filtered_df = tracks_df
+        track_idx = track_id_to_idx.get(str(track_id))
+        timer.lap("index_mapping")
+        if track_idx is None:
+            timer.finish("error")
+            return jsonify({"error": "Track not found"}), 404
         
-        # Сортируем по популярности и перемешиваем
-        if 'plays' in filtered_df.columns:
-            top_tracks = filtered_df.nlargest(limit * 2, 'plays')
-        else:
-            top_tracks = filtered_df.head(limit * 2)
+        allowed = catalogue_filters.mask(filters) if filters else None
+        timer.lap("filters")
         
-        sampled = top_tracks.sample(n=min(limit, len(top_tracks)), random_state=42)
+        top_indices, top_scores, method = similar_tracks(track_idx, max(limit, 0), allowed)
+        timer.lap("similarity")
         
-        recommendations = []
-        for _, row in sampled.iterrows():
-            rec = {
-                "artist": str(row.get('artist', 'Unknown')),
-                "title": str(row.get('title', row.get('song', 'Unknown'))),
-            }
-            if 'id' in row:
-                rec['id'] = str(row['id'])
-            if 'genre' in row:
-                rec['genre'] = str(row['genre'])
-            if 'plays' in row:
-                rec['plays'] = int(row['plays'])
-            recommendations.append(rec)
+        response = Response(render_response({
+            "trackId": json.dumps(str(track_id)),
+            "recommendations": track_metadata.render(top_indices, top_scores),
+            "count": str(len(top_indices)),
+            "method": f'"{method}"'
+        }), mimetype="application/json")
+        timer.lap("serialization")
+        timer.note("count", len(top_indices))
+        timer.finish(method)
+        return response
+    
+    except Exception as e:
+        logger.error(f"Ошибка поиска похожих треков: {e}", exc_info=True)
+        timer.note("error", str(e))
+        timer.finish("error")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/shard/lookup', methods=['POST'])
+def shard_lookup():
+    """
+    Треки истории, которые есть в этом шарде (запрос координатора шардов).
+    
+    Request body: {"ids": ["track_id", ...]}
+    
+    Ответ: найденные UUID (без повторов), их embeddings (encode_array) и
+    жанр/артист (null — пропуск) для профиля и бонусов координатора.
+    """
+    if embeddings is None:
+        return jsonify({"error": "Model not loaded"}), 500
+    
+    ids = list(dict.fromkeys(str(tid) for tid in (request.get_json() or {}).get('ids', [])))
+    found = [tid for tid in ids if tid in track_id_to_idx]
+    indices = [track_id_to_idx[tid] for tid in found]
+    
+    def names(codes, lookup) -> List[Optional[str]]:
+        if codes is None:
+            return [None] * len(indices)
+        values = list(lookup)
+        return [values[code] if code >= 0 else None for code in codes[indices].tolist()]
+    
+    return jsonify({
+        "model": model_fingerprint,
+        "ids": found,
+        "embeddings": encode_array(np.asarray(embeddings[indices])),
+        "genres": names(genre_codes, genre_lookup),
+        "artists": names(artist_codes, artist_lookup)
+    })
+
+
+@app.route('/shard/score', methods=['POST'])
+def shard_score():
+    """
+    Частичный топ шарда для готового профиля (запрос координатора шардов).
+    
+    Request body:
+    {
+        "profile": {...},                 // профиль пользователя 1 × D (encode_array)
+        "k": 50,
+        "genreBonuses": {"Rock": 1.3},    // множители бонусов по значениям (preference_multipliers_by_name)
+        "artistBonuses": {},
+        "exclude": ["track_id"],          // история пользователя
+        "filters": {...},
+        "nprobe": 16
+    }
+    
+    Ответ: k лучших треков шарда — локальные индексы, оценки с бонусами,
+    embeddings (для MMR на координаторе) и поля ответа (TrackMetadata.columns).
+    """
+    timer = telemetry.timer("shard_score")
+    
+    if embeddings is None:
+        timer.finish("error")
+        return jsonify({"error": "Model not loaded"}), 500
+    
+    try:
+        data = request.get_json() or {}
+        user_profile = decode_array(data["profile"])
+        tables = named_bonus_tables(data.get("genreBonuses") or {}, data.get("artistBonuses") or {})
+        history_indices = find_history_indices([str(tid) for tid in data.get("exclude") or []])
+        allowed = catalogue_filters.mask(parse_filters(data.get("filters")))
+        timer.lap("parse")
         
-        logger.info(f"Возвращено {len(recommendations)} рекомендаций (метод: cold_start)")
-        logger.info(f"=== AI DJ RECOMMEND RESPONSE: {len(recommendations)} рекомендаций ===")
-        return jsonify({
-            "recommendations": recommendations,
-            "count": len(recommendations),
-            "method": "cold_start",
-            "cached": False
+        top_indices, top_scores = rank_catalogue(user_profile, tables, history_indices, allowed,
+                                                 int(data["k"]), int(data.get("nprobe", ANN_NPROBE)), timer)
+        response = jsonify({
+            "model": model_fingerprint,
+            "indices": np.asarray(top_indices).tolist(),
+            "scores": encode_array(np.asarray(top_scores)),
+            "embeddings": encode_array(np.asarray(embeddings[top_indices])),
+            "tracks": track_metadata.columns(top_indices)
         })
-        
+        timer.lap("serialization")
+        timer.finish("shard")
+        return response
+    
     except Exception as e:
-        logger.error(f"Ошибка рекомендации: {e}", exc_info=True)
+        logger.error(f"Ошибка скоринга шарда: {e}", exc_info=True)
+        timer.note("error", str(e))
+        timer.finish("error")
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/shard/popular', methods=['POST'])
+def shard_popular():
+    """
+    Самые популярные треки шарда под предпочтения холодного старта.
+    
+    Request body: {"genres": [...], "artists": [...], "n": 50, "filters": {...}}
+    
+    matched = false: под жанры/артистов и фильтры в шарде треков нет, отдан
+    общий топ шарда. Координатор берет общий топ, только если треков нет ни в
+    одном шарде (как PopularityIndex.top для всего каталога). keys — ключи
+    порядка (plays, пропуски = -inf) для слияния шардов.
+    """
+    if embeddings is None:
+        return jsonify({"error": "Model not loaded"}), 500
+    
+    data = request.get_json() or {}
+    genres, artists, n = data.get('genres', []), data.get('artists', []), int(data.get('n', DEFAULT_LIMIT))
+    allowed = catalogue_filters.mask(parse_filters(data.get('filters')))
+    top_tracks = popularity_index.top(genres, artists, n, allowed, fallback=False)
+    matched = len(top_tracks) > 0
+    if not matched:
+        top_tracks = popularity_index.top([], [], n, allowed)
+    
+    keys = (np.nan_to_num(tracks_df['plays'].to_numpy(dtype=np.float64)[top_tracks], nan=-np.inf)
+            if 'plays' in tracks_df.columns else np.zeros(len(top_tracks)))
+    return jsonify({
+        "model": model_fingerprint,
+        "matched": matched,
+        "indices": np.asarray(top_tracks).tolist(),
+        "keys": encode_array(keys),
+        "tracks": track_metadata.columns(top_tracks)
+    })
+
+
+@app.route('/profile/update', methods=['POST'])
+def profile_update():
+    """
+    Добавляет новые прослушивания в профиль пользователя.
+    
+    Request body:
+    {
+        "userId": "...",
+        "plays": [{"id": "track_id", "playedAt": "2024-01-01T00:00:00Z"}]
+    }
+    """
+    if embeddings is None or track_id_to_idx is None:
+        return jsonify({"error": "Model not loaded"}), 500
+    if profile_store is None:
+        return jsonify({"error": "Profile store disabled"}), 404
+    
+    data = request.get_json() or {}
+    user_id = data.get('userId')
+    plays = data.get('plays', [])
+    if not user_id or not isinstance(plays, list):
+        return jsonify({"error": "userId and plays are required"}), 400
+    
+    indices, weights, timestamps = plays_to_profile_update(plays)
+    if len(indices):
+        profile_store.update(str(user_id), embeddings[indices], weights, timestamps)
+    
+    return jsonify({
+        "userId": str(user_id),
+        "applied": int(len(indices)),
+        "ignored": len(plays) - int(len(indices))
+    })
+
+
 @app.route('/metrics', methods=['GET'])
 def metrics():
     """
@@ -521,22 +1984,56 @@ def metrics():
     """
     return jsonify({
         "cache_size": len(recommendation_cache),
-        "cache_hit_rate": "N/A",  # Можно добавить счетчики
+        "cache_hit_rate": recommendation_cache.stats()["hit_rate"],
+        "cache": recommendation_cache.stats(),
+        "sessions": session_store.stats(),
         "model_stats": {
             "tracks_count": len(tracks_df) if tracks_df is not None else 0,
             "embedding_dim": embeddings.shape[1] if embeddings is not None else 0,
             "model_size_mb": embeddings.nbytes / 1024 / 1024 if embeddings is not None else 0
-        }
+        },
+        "memory": {
+            "embeddings_mb": embeddings.nbytes / 1024 / 1024 if embeddings is not None else 0,
+            "quantized_mb": quantized_embeddings.nbytes / 1024 / 1024 if quantized_embeddings is not None else 0,
+            "ann_index_mb": (ann_index.centroids.nbytes + ann_index.list_ids.nbytes) / 1024 / 1024 if ann_index is not None else 0,
+            "popularity_index_mb": popularity_index.nbytes / 1024 / 1024 if popularity_index is not None else 0,
+            "neighbour_graph_mb": neighbour_graph.nbytes / 1024 / 1024 if neighbour_graph is not None else 0
+        },
+        "quantization": quantization_stats or None,
+        "profile_store": profile_store.stats() if profile_store is not None else None,
+        "coalescing": dict(telemetry.batch_stats(), max_batch=COALESCE_MAX_BATCH, window_ms=COALESCE_WINDOW_MS)
+        if request_coalescer is not None else None,
+        "requests_by_endpoint": telemetry.request_counts("endpoint"),
+        "requests_by_method": telemetry.request_counts("method")
+    })
+
+
+@app.route('/metrics/prometheus', methods=['GET'])
+def metrics_prometheus():
+    """
+    Метрики в текстовом формате Prometheus: гистограммы латентности этапов
+    по эндпоинтам (ai_dj_recommend_stage_seconds), латентность запросов и их
+    количество по способу ответа (ml_db_embeddings, cold_start, cached, error).
+    """
+    cache_stats = recommendation_cache.stats()
+    lines = telemetry.render() + render_gauges({
+        "ai_dj_cache_entries": ("Number of cached recommendation responses", len(recommendation_cache)),
+        "ai_dj_cache_hit_rate": ("Recommendation cache hit rate", cache_stats["hit_rate"]),
+        "ai_dj_model_tracks": ("Number of tracks in the active model", len(tracks_df) if tracks_df is not None else 0),
+        "ai_dj_model_load_seconds": ("Load time of the active model in seconds", model_load_seconds),
     })
+    return Response("\n".join(lines) + "\n", content_type=PROMETHEUS_CONTENT_TYPE)
 
 
 if __name__ == '__main__':
     import sys
     
+    # Сервер разработки Flask (один процесс); в продакшене: gunicorn -c ml/ai_dj/gunicorn.conf.py
     data_dir = sys.argv[1] if len(sys.argv) > 1 else "ml/ai_dj/data"
     if load_model(data_dir):
         port = int(sys.argv[2]) if len(sys.argv) > 2 else 5001
-        logger.info(f"AI DJ сервис V4 запущен на порту {port}")
+        start_background_tasks()
+        logger.info(f"AI DJ сервис V4 запущен на порту {port} (сервер разработки)")
         app.run(host='0.0.0.0', port=port, debug=False)
     else:
         logger.error("Не удалось загрузить модель.")
@@ -0,0 +1,145 @@
+import base64
+import http.client
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import numpy as np
+import pandas as pd
+
+from artifacts import save_artifacts
+
+# Шарды версии модели: <версия>/shards/<номер>/ (формат модели как у версии целиком) и manifest
+SHARDS_DIRNAME = "shards"
+SHARDS_MANIFEST_FILENAME = "shards.json"
+
+
+def shard_bounds(n_tracks: int, n_shards: int) -> List[Tuple[int, int]]:
+    """Границы [start, stop) шардов: каталог делится на n_shards подряд идущих частей почти равного размера"""
+    edges = np.linspace(0, n_tracks, n_shards + 1).astype(int)
+    return [(int(edges[i]), int(edges[i + 1])) for i in range(n_shards)]
+
+
+def save_shards(
+    version_path: Path,
+    embeddings: np.ndarray,
+    tracks_df: pd.DataFrame,
+    n_shards: int,
+    build_index: Optional[Callable[[np.ndarray, Path], None]] = None
+) -> Dict:
+    """
+    Записывает каталог, разбитый на шарды, рядом с моделью версии.
+
+    Каждый шард — отдельная директория в формате save_artifacts со своим
+    срезом embeddings и метаданных (индексы треков в шарде локальные), так
+    что процесс шарда загружает только свою часть каталога.
+
+    Args:
+        version_path: Директория версии модели
+        embeddings: Матрица embeddings всего каталога
+        tracks_df: Треки всего каталога
+        n_shards: Количество шардов
+        build_index: (embeddings шарда, директория шарда) → строит и сохраняет индексы шарда (IVF)
+
+    Returns:
+        Dict: Содержимое shards.json
+    """
+    shards = []
+    for number, (start, stop) in enumerate(shard_bounds(len(tracks_df), n_shards)):
+        shard_path = version_path / SHARDS_DIRNAME / str(number)
+        shard_path.mkdir(parents=True, exist_ok=True)
+        shard_df = tracks_df.iloc[start:stop].reset_index(drop=True)
+        shard_embeddings = np.asarray(embeddings[start:stop])
+        save_artifacts(shard_path, shard_embeddings, shard_df,
+                       {str(track_id): idx for idx, track_id in enumerate(shard_df['id'])})
+        if build_index is not None:
+            build_index(shard_embeddings, shard_path)
+        shards.append({"shard": number, "start": start, "stop": stop})
+
+    manifest = {"n_tracks": len(tracks_df), "shards": shards}
+    with open(version_path / SHARDS_DIRNAME / SHARDS_MANIFEST_FILENAME, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def load_shards_manifest(version_path: Path) -> Optional[Dict]:
+    """Содержимое shards.json версии (None, если модель сохранена без шардов)"""
+    path = version_path / SHARDS_DIRNAME / SHARDS_MANIFEST_FILENAME
+    if not path.exists():
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def encode_array(array: np.ndarray) -> Dict:
+    """Массив для JSON-запроса между процессами: сырые байты в base64 (без потерь точности)"""
+    array = np.ascontiguousarray(array)
+    return {"dtype": array.dtype.str, "shape": list(array.shape), "data": base64.b64encode(array.tobytes()).decode("ascii")}
+
+
+def decode_array(data: Dict) -> np.ndarray:
+    """Обратное к encode_array"""
+    return np.frombuffer(base64.b64decode(data["data"]), dtype=np.dtype(data["dtype"])).reshape(data["shape"])
+
+
+class ShardClient:
+    """
+    HTTP-клиент координатора к процессам шардов (scatter-gather).
+
+    Запрос рассылается всем шардам параллельно (пул потоков по числу
+    шардов), ответы возвращаются в порядке шардов. У каждого потока свое
+    keep-alive соединение к каждому шарду.
+
+    Args:
+        urls: Адреса шардов (http://host:port) в порядке номеров шардов
+        timeout: Таймаут запроса к шарду в секундах
+    """
+
+    def __init__(self, urls: List[str], timeout: float = 10.0):
+        self.urls = urls
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max(1, len(urls)), thread_name_prefix="ai-dj-shards")
+        self._local = threading.local()
+
+    def _connection(self, shard: int) -> http.client.HTTPConnection:
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+        if shard not in connections:
+            url = urlsplit(self.urls[shard])
+            connections[shard] = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=self.timeout)
+        return connections[shard]
+
+    def request(self, shard: int, method: str, path: str, payload: Optional[Dict] = None) -> Dict:
+        """
+        Запрос к одному шарду.
+
+        Raises:
+            RuntimeError: Шард недоступен или ответил ошибкой
+        """
+        body = json.dumps(payload).encode() if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        for attempt in range(2):
+            connection = self._connection(shard)
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+                break
+            except (OSError, http.client.HTTPException) as e:
+                # Соединение могло закрыться на стороне шарда (перезапуск): одна повторная попытка с новым
+                connection.close()
+                self._local.connections.pop(shard, None)
+                if attempt:
+                    raise RuntimeError(f"Шард {shard} ({self.urls[shard]}) недоступен: {e}") from e
+        if response.status != 200:
+            raise RuntimeError(f"Шард {shard} ответил {response.status}: {data[:200]!r}")
+        return json.loads(data)
+
+    def scatter(self, path: str, payload: Optional[Dict] = None, method: str = "POST") -> List[Dict]:
+        """Один и тот же запрос всем шардам параллельно; ответы в порядке шардов"""
+        futures = [self._executor.submit(self.request, shard, method, path, payload) for shard in range(len(self.urls))]
+        return [future.result() for future in futures]
@@ -0,0 +1,295 @@
+import bisect
+import itertools
+import json
+import logging
+import multiprocessing
+import random
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+# Трассы запросов пишутся отдельным логгером: их можно направить в свой файл/уровень
+trace_logger = logging.getLogger("ai_dj.trace")
+
+# Границы бакетов латентности этапа (секунды): от 100 мкс до 2.5 с
+STAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# Границы бакетов латентности запроса целиком (секунды)
+REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Границы бакетов размера батча микробатчинга /recommend (RequestCoalescer)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+# Этапы /recommend в порядке выполнения (для стабильного порядка в выдаче)
+RECOMMEND_STAGES = (
+    "parse", "cache_lookup", "filters", "index_mapping", "user_profile", "similarity",
+    "bonuses", "top_k", "diversity", "cold_start", "serialization", "cache_store", "session"
+)
+# Способы ответа /recommend (session — страница из сохраненной сессии, /recommend/next;
+# neighbours — готовые соседи трека из графа, /similar; shard — частичный топ шарда для координатора;
+# batch — запрос /recommend/batch целиком)
+RECOMMEND_METHODS = ("ml_db_embeddings", "cold_start", "cached", "session", "neighbours", "shard", "batch", "error")
+# Эндпоинты, запросы которых пишутся в метрики запросов (метка endpoint)
+RECOMMEND_ENDPOINTS = ("recommend", "recommend_next", "recommend_batch", "similar", "shard_score")
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    return ",".join(f'{name}="{value}"' for name, value in labels.items())
+
+
+def label_set(label: Union[str, Tuple[str, ...]], label_value: Union[str, Tuple[str, ...]]) -> Dict[str, str]:
+    """Метки серии: одна метка — строка, несколько — кортежи имен и значений"""
+    if isinstance(label, tuple):
+        return dict(zip(label, label_value))
+    return {label: label_value}
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными бакетами (как histogram в Prometheus).
+
+    label — имя метки или кортеж имен; во втором случае серии задаются
+    кортежами значений (label_values — все сочетания). Значения меток известны заранее, поэтому все серии лежат в одном массиве
+    в разделяемой памяти (multiprocessing.RawArray): объект, созданный до
+    fork (gunicorn --preload), общий для всех воркеров, и любой воркер отдает
+    метрики всего сервиса. observe — двоичный поиск бакета и два сложения под
+    межпроцессной блокировкой, без аллокаций; накопительные суммы по бакетам
+    считаются только при выдаче.
+    """
+
+    def __init__(self, name: str, description: str, label: Union[str, Tuple[str, ...]], label_values: Tuple,
+                 buckets: Tuple[float, ...]):
+        self.name = name
+        self.description = description
+        self.label = label
+        self.buckets = buckets
+        self._positions = {value: i for i, value in enumerate(label_values)}
+        # На серию: счетчики по бакетам (последний — +Inf), затем сумма
+        self._stride = len(buckets) + 2
+        self._values = multiprocessing.RawArray('d', len(label_values) * self._stride)
+        self._lock = multiprocessing.Lock()
+
+    def observe(self, label_value: str, value: float):
+        start = self._positions[label_value] * self._stride
+        position = start + bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._values[position] += 1
+            self._values[start + self._stride - 1] += value
+
+    def snapshot(self) -> Dict[str, Tuple[List[int], float]]:
+        """Серии, в которые было хотя бы одно наблюдение: метка → (счетчики по бакетам, сумма)"""
+        with self._lock:
+            values = self._values[:]
+        series = {}
+        for label_value, i in self._positions.items():
+            row = values[i * self._stride:(i + 1) * self._stride]
+            if any(row[:-1]):
+                series[label_value] = ([int(c) for c in row[:-1]], row[-1])
+        return series
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for label_value, (counts, total) in self.snapshot().items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{{{format_labels(dict(label_set(self.label, label_value), le=le))}}} {cumulative}")
+            labels = format_labels(label_set(self.label, label_value))
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+
+class Counter:
+    """
+    Счетчик (как counter в Prometheus) с метками и в разделяемой памяти, как Histogram.
+
+    С несколькими метками выдаются только ненулевые серии: большинство
+    сочетаний значений никогда не встречается.
+    """
+
+    def __init__(self, name: str, description: str, label: Union[str, Tuple[str, ...]], label_values: Tuple):
+        self.name = name
+        self.description = description
+        self.label = label
+        self._positions = {value: i for i, value in enumerate(label_values)}
+        self._values = multiprocessing.RawArray('d', len(label_values))
+        self._lock = multiprocessing.Lock()
+
+    def inc(self, label_value: str, amount: int = 1):
+        position = self._positions[label_value]
+        with self._lock:
+            self._values[position] += amount
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            values = self._values[:]
+        return {label_value: int(values[i]) for label_value, i in self._positions.items()}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        for label_value, value in self.snapshot().items():
+            if value == 0 and isinstance(self.label, tuple):
+                continue
+            lines.append(f"{self.name}{{{format_labels(label_set(self.label, label_value))}}} {value}")
+        return lines
+
+
+def array_summary(values: np.ndarray) -> Dict[str, float]:
+    """Сводка по вектору оценок для трассы (векторно, без прохода в Python)"""
+    if len(values) == 0:
+        return {"n": 0}
+    return {
+        "n": int(len(values)),
+        "min": round(float(values.min()), 4),
+        "max": round(float(values.max()), 4),
+        "mean": round(float(values.mean()), 4),
+        "positive": int(np.count_nonzero(values > 0))
+    }
+
+
+class StageTimer:
+    """
+    Замер этапов одного запроса.
+
+    lap(stage) добавляет к этапу время с предыдущей отметки (этап может
+    встречаться несколько раз), finish(method) записывает все этапы и
+    длительность запроса в гистограммы одним проходом.
+
+    Если запрос попал в выборку трассировки, timer.trace — словарь, куда
+    обработчик складывает подробности (note), и finish пишет его одной
+    JSON-записью в логгер ai_dj.trace. Иначе trace — None: сводки для
+    трассы нужно считать только под проверкой `if timer.trace is not None`.
+    """
+
+    __slots__ = ("telemetry", "endpoint", "started", "last", "stages", "trace")
+
+    def __init__(self, telemetry: "RecommendTelemetry", traced: bool = False, endpoint: str = "recommend"):
+        self.telemetry = telemetry
+        self.endpoint = endpoint
+        self.started = self.last = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.trace: Optional[Dict[str, Any]] = {} if traced else None
+
+    def note(self, key: str, value: Any):
+        """Добавляет поле в трассу (ничего не делает вне выборки)"""
+        if self.trace is not None:
+            self.trace[key] = value
+
+    def lap(self, stage: str):
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self.last
+        self.last = now
+
+    def finish(self, method: str):
+        total_seconds = time.perf_counter() - self.started
+        self.telemetry.record(self.stages, total_seconds, method, self.endpoint)
+        if self.trace is not None:
+            record = {
+                "endpoint": self.endpoint,
+                "method": method,
+                "total_ms": round(total_seconds * 1000, 3),
+                "stages_ms": {stage: round(seconds * 1000, 3) for stage, seconds in self.stages.items()},
+            }
+            record.update(self.trace)
+            trace_logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+
+class RecommendTelemetry:
+    """
+    Метрики /recommend: латентность по этапам, латентность запроса и
+    количество запросов по эндпоинту (endpoint) и этапу (stage) или способу
+    ответа (method).
+
+    Метрики лежат в разделяемой памяти: если объект создан до fork воркеров
+    (при импорте service в gunicorn --preload), они общие для всех воркеров.
+
+    Args:
+        trace_sample_rate: Доля запросов, для которых пишется трасса (0 — выключено)
+    """
+
+    def __init__(self, trace_sample_rate: float = 0.0):
+        self.trace_sample_rate = trace_sample_rate
+        # Серии по сочетаниям эндпоинта и этапа (способа ответа): /similar, /recommend/next,
+        # /shard/score и /recommend/batch (этапы которого — суммы по всем запросам батча)
+        # не смешиваются с /recommend
+        self.stage_seconds = Histogram(
+            "ai_dj_recommend_stage_seconds", "Latency of recommendation request stages in seconds",
+            ("endpoint", "stage"), tuple(itertools.product(RECOMMEND_ENDPOINTS, RECOMMEND_STAGES)), STAGE_BUCKETS
+        )
+        request_labels = tuple(itertools.product(RECOMMEND_ENDPOINTS, RECOMMEND_METHODS))
+        self.request_seconds = Histogram(
+            "ai_dj_recommend_request_seconds", "Latency of recommendation requests in seconds",
+            ("endpoint", "method"), request_labels, REQUEST_BUCKETS
+        )
+        self.requests = Counter(
+            "ai_dj_recommend_requests_total", "Number of recommendation requests",
+            ("endpoint", "method"), request_labels
+        )
+        # Микробатчинг полного перебора (серии появляются, только если он включен)
+        self.batch_size = Histogram(
+            "ai_dj_recommend_batch_size", "Number of /recommend requests scored in one coalesced batch",
+            "endpoint", ("recommend",), BATCH_SIZE_BUCKETS
+        )
+        self.queue_seconds = Histogram(
+            "ai_dj_recommend_queue_seconds", "Time a /recommend request waited for its coalesced batch in seconds",
+            "endpoint", ("recommend",), STAGE_BUCKETS
+        )
+
+    def timer(self, endpoint: str = "recommend") -> StageTimer:
+        traced = self.trace_sample_rate > 0 and random.random() < self.trace_sample_rate
+        return StageTimer(self, traced, endpoint)
+
+    def record(self, stages: Dict[str, float], total_seconds: float, method: str, endpoint: str = "recommend"):
+        for stage, seconds in stages.items():
+            self.stage_seconds.observe((endpoint, stage), seconds)
+        self.request_seconds.observe((endpoint, method), total_seconds)
+        self.requests.inc((endpoint, method))
+
+    def request_counts(self, label: str) -> Dict[str, int]:
+        """Количество запросов, просуммированное по одной метке (endpoint или method)"""
+        position = ("endpoint", "method").index(label)
+        counts = dict.fromkeys(RECOMMEND_ENDPOINTS if label == "endpoint" else RECOMMEND_METHODS, 0)
+        for labels, count in self.requests.snapshot().items():
+            counts[labels[position]] += count
+        return counts
+
+    def record_batch(self, size: int, queue_seconds: List[float]):
+        """Размер батча микробатчинга и время ожидания каждого его запроса в очереди"""
+        self.batch_size.observe("recommend", size)
+        for seconds in queue_seconds:
+            self.queue_seconds.observe("recommend", seconds)
+
+    def batch_stats(self) -> Dict[str, float]:
+        """Сводка микробатчинга: количество батчей и запросов в них, средний размер батча и ожидание в очереди"""
+        sizes = self.batch_size.snapshot().get("recommend")
+        waits = self.queue_seconds.snapshot().get("recommend")
+        if sizes is None or waits is None:
+            return {"batches": 0, "requests": 0}
+        batches, requests = sum(sizes[0]), sum(waits[0])
+        return {
+            "batches": batches,
+            "requests": requests,
+            "mean_batch_size": sizes[1] / batches,
+            "mean_queue_ms": waits[1] / requests * 1000
+        }
+
+    def render(self) -> List[str]:
+        return (
+            self.stage_seconds.render()
+            + self.request_seconds.render()
+            + self.requests.render()
+            + self.batch_size.render()
+            + self.queue_seconds.render()
+        )
+
+
+def render_gauges(gauges: Dict[str, Tuple[str, float]]) -> List[str]:
+    """Выдача gauge-метрик без меток: {имя: (описание, значение)}"""
+    lines = []
+    for name, (description, value) in gauges.items():
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} gauge", f"{name} {value}"]
+    return lines
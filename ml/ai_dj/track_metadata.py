@@ -0,0 +1,144 @@
+import math
+from json.encoder import encode_basestring_ascii
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+# Строковые колонки треков, которые попадают в ответ (song — название в старых датасетах)
+RESPONSE_STRING_COLUMNS = ("artist", "genre", "id", "title", "song")
+
+
+class TrackMetadata:
+    """
+    Метаданные треков для сборки ответа, подготовленные при загрузке модели.
+
+    Строковые поля хранятся колонками: коды (int32, общие с pandas.Categorical
+    колоночного формата) и словарь значений (ссылки на те же строки, что и в
+    категориях, без копий). Поля с почти уникальными значениями (id, title)
+    передаются массивами байтов фиксированной ширины (fixed, открыты через
+    mmap и общие для воркеров) и декодируются только для выбранных треков.
+    Ответ собирается выборкой по индексам треков,
+    кодированием выбранных строк C-функцией json и склейкой, без DataFrame и
+    json.dumps на каждый запрос. Вывод совпадает с jsonify байт в байт
+    (ключи по алфавиту, компактные разделители, ensure_ascii).
+    """
+
+    def __init__(self, tracks_df: pd.DataFrame, fixed: Optional[Dict[str, np.ndarray]] = None):
+        self.n_tracks = len(tracks_df)
+        self.codes: Dict[str, np.ndarray] = {}
+        self.vocab: Dict[str, np.ndarray] = {}
+        self.fixed: Dict[str, np.ndarray] = {
+            field: values for field, values in (fixed or {}).items() if field in RESPONSE_STRING_COLUMNS
+        }
+        for field in RESPONSE_STRING_COLUMNS:
+            if field not in tracks_df.columns or field in self.fixed:
+                continue
+            column = tracks_df[field]
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                codes, values = column.cat.codes.to_numpy(), list(column.cat.categories)
+            else:
+                codes, values = pd.factorize(column)
+            # Последний элемент словаря — пропуск (код -1): str(NaN) == "nan", как в прежнем ответе
+            self.codes[field] = np.asarray(codes, dtype=np.int32)
+            vocab = np.empty(len(values) + 1, dtype=object)
+            vocab[:-1] = [v if isinstance(v, str) else str(v) for v in values]
+            vocab[-1] = "nan"
+            self.vocab[field] = vocab
+        self.plays: Optional[np.ndarray] = (
+            tracks_df['plays'].fillna(0).to_numpy(dtype=np.int64) if 'plays' in tracks_df.columns else None
+        )
+
+    def has(self, field: str) -> bool:
+        return field in self.codes or field in self.fixed
+
+    def values(self, field: str, indices: Sequence[int]) -> List[str]:
+        """Значения строкового поля для треков (пропуски — "nan")"""
+        indices = np.asarray(indices, dtype=np.int64)
+        if field in self.fixed:
+            return [value.decode() for value in self.fixed[field][indices].tolist()]
+        return self.vocab[field][self.codes[field][indices]].tolist()
+
+    def _column(self, field: str, indices: np.ndarray, default: str = "Unknown") -> List[str]:
+        if field in self.fixed:
+            return list(map(encode_basestring_ascii, self.values(field, indices)))
+        if field not in self.codes:
+            return [encode_basestring_ascii(default)] * len(indices)
+        return list(map(encode_basestring_ascii, self.vocab[field][self.codes[field][indices]]))
+
+    def render(self, indices: Sequence[int], scores: np.ndarray) -> str:
+        """
+        Собирает JSON-массив рекомендаций модели.
+
+        Args:
+            indices: Индексы треков в порядке ответа
+            scores: Похожесть треков (поле similarity; inf и NaN отдаются как null)
+
+        Returns:
+            str: JSON-массив объектов {artist, genre, id, plays, similarity, title}
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        return self._render([
+            ("artist", self._column("artist", indices)),
+            ("genre", self._column("genre", indices)),
+            ("id", self._column("id", indices)),
+            ("plays", self.plays[indices].tolist() if self.plays is not None else [0] * len(indices)),
+            ("similarity", [score_json(s) for s in np.asarray(scores, dtype=np.float64).tolist()]),
+            ("title", self._column("title", indices)),
+        ])
+
+    def render_cold_start(self, indices: Sequence[int]) -> str:
+        """
+        Собирает JSON-массив рекомендаций холодного старта: без similarity,
+        id/genre/plays — только если такие колонки есть в модели.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        title_field = "title" if self.has("title") or not self.has("song") else "song"
+        fields = [("artist", self._column("artist", indices))]
+        if self.has("genre"):
+            fields.append(("genre", self._column("genre", indices)))
+        if self.has("id"):
+            fields.append(("id", self._column("id", indices)))
+        if self.plays is not None:
+            fields.append(("plays", self.plays[indices].tolist()))
+        fields.append(("title", self._column(title_field, indices)))
+        return self._render(fields)
+
+    def columns(self, indices: Sequence[int]) -> Dict[str, List]:
+        """
+        Значения полей ответа для треков (строки уже в виде ответа, пропуски —
+        "nan"). TrackMetadata, построенный по DataFrame из этих колонок,
+        отдает тот же JSON: так шард каталога передает метаданные координатору.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        columns: Dict[str, List] = {field: self.values(field, indices) for field in (*self.codes, *self.fixed)}
+        if self.plays is not None:
+            columns["plays"] = self.plays[indices].tolist()
+        return columns
+
+    @staticmethod
+    def _render(fields: List) -> str:
+        if not fields or len(fields[0][1]) == 0:
+            return "[]"
+        template = "{{" + ",".join(f'"{name}":{{{i}}}' for i, (name, _) in enumerate(fields)) + "}}"
+        return "[" + ",".join(map(template.format, *(values for _, values in fields))) + "]"
+
+
+def score_json(score: float) -> str:
+    """Число в JSON как у json.dumps; inf и NaN — null (в JSON таких чисел нет)"""
+    return float.__repr__(score) if math.isfinite(score) else "null"
+
+
+def render_object(fields: Dict[str, str]) -> str:
+    """
+    JSON-объект из уже закодированных значений полей: ключи по алфавиту, как у jsonify.
+
+    Args:
+        fields: Имя поля → значение в JSON (например, результат TrackMetadata.render)
+    """
+    return "{" + ",".join(f'"{name}":{fields[name]}' for name in sorted(fields)) + "}"
+
+
+def render_response(fields: Dict[str, str]) -> str:
+    """Тело ответа, как у jsonify: объект и перевод строки"""
+    return render_object(fields) + "\n"
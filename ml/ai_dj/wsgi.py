@@ -0,0 +1,31 @@
+"""
+WSGI точка входа AI DJ для продакшена (gunicorn с preload, см. gunicorn.conf.py).
+
+Модель загружается один раз при импорте, до fork воркеров: embeddings и
+колонки метаданных открыты через mmap и разделяются через page cache,
+остальные структуры воркеры получают copy-on-write. gc.freeze() переносит
+уже созданные объекты в постоянное поколение, чтобы сборщик мусора в
+воркерах не трогал их заголовки и не копировал страницы памяти.
+
+Переменные окружения:
+    AI_DJ_DATA_DIR — директория модели (по умолчанию ml/ai_dj/data)
+"""
+import gc
+import logging
+import os
+
+import service
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.getenv('AI_DJ_DATA_DIR', 'ml/ai_dj/data')
+
+if not service.load_model(DATA_DIR):
+    raise RuntimeError(f"Не удалось загрузить модель из {DATA_DIR}. "
+                       f"Запустите: python ml/ai_dj/train_model.py <DATABASE_URL>")
+
+gc.collect()
+gc.freeze()
+logger.info(f"Модель {service.model_version} загружена до запуска воркеров")
+
+app = service.app
@@ -426,10 +426,23 @@ class ApiClient {
   }
 
   // AI DJ
-  async getAIDJSession(limit: number = 25): Promise<{ tracks: Track[]; source?: string; matched?: number }> {
+  // cursor из предыдущего ответа — следующая порция той же сессии без повторов
+  // session: клиент листает сессию AI DJ (следующий вызов передаст полученный cursor)
+  async getAIDJSession(limit: number = 25, cursor?: string, session: boolean = false): Promise<{ tracks: Track[]; source?: string; matched?: number; cursor?: string }> {
     const queryParams = new URLSearchParams();
     queryParams.append('limit', limit.toString());
-    return this.request<{ tracks: Track[]; source?: string; matched?: number }>(`/api/ai-dj/session?${queryParams.toString()}`);
+    if (cursor) {
+      queryParams.append('cursor', cursor);
+    }
+    if (session) {
+      queryParams.append('session', '1');
+    }
+    return this.request<{ tracks: Track[]; source?: string; matched?: number; cursor?: string }>(`/api/ai-dj/session?${queryParams.toString()}`);
+  }
+
+  // Похожие треки (по убыванию похожести): "еще похожие", радио по треку
+  async getSimilarTracks(trackId: string, limit: number = 25): Promise<{ tracks: Track[]; source?: string }> {
+    return this.request<{ tracks: Track[]; source?: string }>(`/api/ai-dj/similar/${trackId}?limit=${limit}`);
   }
 
   // Проверка подключения к API
@@ -20,6 +20,10 @@ interface QuickAccessCardProps {
 const LIKED_SONGS_KEY = 'Liked Songs';
 const AI_DJ_PLAYLIST_NAME = 'DJ';
 
+// Курсор сессии AI DJ: повторный запуск DJ продолжает сессию (новые треки без повторов
+// и без повторного ранжирования каталога); истекший курсор backend заменяет новой сессией
+let djSessionCursor: string | undefined;
+
 export function QuickAccessCard({ title, image, index, type = 'playlist', id, onHoverChange }: QuickAccessCardProps) {
   const [isHovered, setIsHovered] = useState(false);
   const {
@@ -37,8 +41,9 @@ export function QuickAccessCard({ title, image, index, type = 'playlist', id, on
 
   const startDjSession = async () => {
     try {
-      const response = await apiClient.getAIDJSession(25);
+      const response = await apiClient.getAIDJSession(25, djSessionCursor, true);
       const tracks = response?.tracks || [];
+      djSessionCursor = response?.cursor;
 
       if (!Array.isArray(tracks) || tracks.length === 0) {
         toast.error('AI DJ не вернул треки. Попробуйте позже.');